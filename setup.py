@@ -33,6 +33,9 @@ setup(
         'requests',
         'apscheduler==2.1.2'
     ],
+    extras_require={
+        'columnar': ['numpy'],
+    },
     entry_points="""
     [console_scripts]
     flask-ctl = presence_analyzer.script:run
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks of presence analyzer.
+
+Every module of this package is runnable on its own, e.g.:
+
+    bin/python-console -m presence_analyzer.benchmarks.cache
+"""
+import datetime
+import gc
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from presence_analyzer import loader
+from presence_analyzer.main import app
+
+
+def generate_presence_csv(path, users, days, seed=0):
+    """
+    Writes synthetic presence CSV with `users` x `days` rows.
+    """
+    rnd = random.Random(seed)
+    first_day = datetime.date(2011, 1, 3)
+    with open(path, 'w') as csv_file:
+        for user_id in xrange(1, users + 1):
+            for day in xrange(days):
+                start = rnd.randint(7 * 3600, 10 * 3600)
+                end = start + rnd.randint(4 * 3600, 9 * 3600)
+                csv_file.write('{0},{1},{2},{3}\n'.format(
+                    user_id,
+                    first_day + datetime.timedelta(days=day),
+                    format_seconds(start),
+                    format_seconds(end),
+                ))
+
+
+def generate_users_xml(path, users):
+    """
+    Writes synthetic intranet users XML file with `users` users.
+    """
+    with open(path, 'w') as xml_file:
+        xml_file.write(
+            '<intranet>\n'
+            '    <server>\n'
+            '        <host>intranet.example.com</host>\n'
+            '        <port>443</port>\n'
+            '        <protocol>https</protocol>\n'
+            '    </server>\n'
+            '    <users>\n'
+        )
+        for user_id in xrange(1, users + 1):
+            xml_file.write(
+                '        <user id="{0}">\n'
+                '            <avatar>/api/images/users/{0}</avatar>\n'
+                '            <name>User {0}</name>\n'
+                '        </user>\n'.format(user_id)
+            )
+        xml_file.write('    </users>\n</intranet>\n')
+
+
+def format_seconds(seconds):
+    """
+    Formats seconds since midnight as HH:MM:SS.
+    """
+    return '%02d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                               seconds % 60)
+
+
+@contextmanager
+def temporary_directory():
+    """
+    Creates temporary directory removed on exit.
+    """
+    path = tempfile.mkdtemp(prefix='presence-bench-')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+@contextmanager
+def app_config(**config):
+    """
+    Temporarily overrides application configuration.
+    """
+    missing = object()
+    previous = dict((key, app.config.get(key, missing)) for key in config)
+    app.config.update(config)
+    try:
+        yield app.config
+    finally:
+        for key, value in previous.iteritems():
+            if value is missing:
+                app.config.pop(key, None)
+            else:
+                app.config[key] = value
+
+
+def measure(function, repeat=100):
+    """
+    Returns mean time of a single `function` call in seconds.
+    """
+    started = time.time()
+    for _ in xrange(repeat):
+        function()
+    return (time.time() - started) / repeat
+
+
+def count_allocations(function):
+    """
+    Returns number of container objects allocated by `function` call.
+
+    Garbage collector counts tracked allocations, so with collection
+    disabled the difference of generation zero counter tells how many
+    lists, dicts, tuples etc. the call left behind.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        result = function()
+        allocated = gc.get_count()[0] - before
+        del result
+    finally:
+        gc.enable()
+    return allocated
+
+
+def peak_memory(function, *args):
+    """
+    Returns growth of peak RSS in KiB caused by `function(*args)`.
+
+    Function runs in a forked process, so each measurement starts from
+    the same baseline and memory is given back afterwards.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_report_peak_memory, args=(queue, function, args)
+    )
+    process.start()
+    growth = queue.get()
+    process.join()
+    return growth
+
+
+def _report_peak_memory(queue, function, args):
+    """
+    Calls function and puts its peak RSS growth into the queue.
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = function(*args)
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+    del result
+
+
+def print_table(header, rows):
+    """
+    Prints benchmark results as plain text table.
+    """
+    widths = [
+        max(len(str(row[i])) for row in [header] + rows)
+        for i in xrange(len(header))
+    ]
+    for row in [header] + rows:
+        print '  '.join(str(cell).rjust(widths[i])
+                        for i, cell in enumerate(row))
+
+
+def data_path(*parts):
+    """
+    Returns path to file from runtime/data directory.
+    """
+    return os.path.join(
+        os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data', *parts
+    )
+
+
+def scale_presence_csv(source, path, times):
+    """
+    Writes `times` copies of presence CSV, each with distinct user ids.
+    """
+    with open(source) as source_file:
+        rows = [line.split(',', 1) for line in source_file if line.strip()]
+    with open(path, 'w') as csv_file:
+        for copy in xrange(times):
+            offset = copy * 100000
+            for user_id, rest in rows:
+                csv_file.write('{0},{1}'.format(int(user_id) + offset, rest))
+    return len(rows) * times
+
+
+def scale_sample(directory, times):
+    """
+    Writes sample data scaled up `times` times into directory.
+
+    :return: path of written file and number of its rows
+    """
+    path = os.path.join(directory, 'scaled.csv')
+    return path, scale_presence_csv(data_path('sample_data.csv'), path, times)
+
+
+def parse_time(path, workers=1):
+    """
+    Returns time of reading whole presence CSV file from scratch, without
+    memoised dates and times.
+
+    Parsing pool is started beforehand, as the application does it.
+    """
+    loader.DATES.clear()
+    loader.TIMES.clear()
+    if workers > 1:
+        loader.parse_pool(workers)
+    started = time.time()
+    loader.PresenceCsvLoader().load(path, workers)
+    return time.time() - started
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Cache hit latency and allocations of get_data versus dataset size.
+
+Compares shared read-only snapshots with the former deepcopy on every
+cache hit.
+"""
+from copy import deepcopy
+from functools import partial
+import os
+
+from presence_analyzer import utils
+from presence_analyzer.benchmarks import (
+    app_config, count_allocations, generate_presence_csv, measure,
+    print_table, temporary_directory,
+)
+
+SIZES = [(10, 100), (50, 200), (100, 500), (100, 1000)]
+
+
+def thaw(value):
+    """
+    Converts frozen snapshot back to plain dictionaries.
+    """
+    if isinstance(value, dict):
+        return dict((key, thaw(item)) for key, item in value.iteritems())
+    return value
+
+
+def run():
+    """
+    Runs benchmark for every dataset size.
+    """
+    rows = []
+    with temporary_directory() as directory:
+        for users, days in SIZES:
+            path = os.path.join(directory, 'data_%d_%d.csv' % (users, days))
+            generate_presence_csv(path, users, days)
+            with app_config(DATA_CSV=path, CACHE_DATA=True):
+                utils.get_data.invalidate()
+                utils.get_data()
+                snapshot_hit = measure(utils.get_data)
+                snapshot_allocs = count_allocations(utils.get_data)
+                # former cache kept plain dicts and copied them on hit
+                copy_plain = partial(deepcopy, thaw(utils.get_data()))
+                copy_hit = measure(copy_plain, 3)
+                copy_allocs = count_allocations(copy_plain)
+            rows.append([
+                users * days,
+                '%.6f' % copy_hit,
+                copy_allocs,
+                '%.6f' % snapshot_hit,
+                snapshot_allocs,
+            ])
+    print_table(
+        ['rows', 'deepcopy hit [s]', 'deepcopy allocs',
+         'snapshot hit [s]', 'snapshot allocs'],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Time and peak memory of loading synthetic 100k users XML file.
+
+Compares streaming iterparse loader with parsing the whole document
+read into a string.
+"""
+import os
+import time
+
+from lxml import etree
+
+from presence_analyzer import utils
+from presence_analyzer.benchmarks import (
+    generate_users_xml, peak_memory, print_table, temporary_directory,
+)
+from presence_analyzer.models import UserInfo
+
+USERS = 100000
+
+
+def load_whole_document(path):
+    """
+    Former loader, whole file in a string and a tree.
+    """
+    with open(path) as xml_file:
+        tree = etree.fromstring(xml_file.read())
+    server = dict((child.tag, child.text) for child in tree.xpath('server/*'))
+    users = dict(
+        (int(user.get('id')),
+         UserInfo(user.findtext('name'), user.findtext('avatar')))
+        for user in tree.xpath('users/user')
+    )
+    return server, users, tree
+
+
+def run():
+    """
+    Runs benchmark for both loaders.
+    """
+    rows = []
+    with temporary_directory() as directory:
+        path = os.path.join(directory, 'users.xml')
+        generate_users_xml(path, USERS)
+        for name, loader in [('fromstring', load_whole_document),
+                             ('iterparse', utils.load_user_directory)]:
+            growth = peak_memory(loader, path)
+            started = time.time()
+            loader(path)
+            elapsed = time.time() - started
+            rows.append([name, USERS, '%.3f' % elapsed, growth / 1024])
+    print_table(['loader', 'users', 'time [s]', 'peak RSS [MiB]'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Memory taken by 1M presence entries in the former and current layouts.
+
+Former layout kept a dict with two datetime.time objects per entry,
+current one keeps a slotted PresenceEntry tuple of seconds.
+"""
+import datetime
+
+from presence_analyzer.benchmarks import peak_memory, print_table
+from presence_analyzer.models import PresenceEntry
+
+USERS = 1000
+DAYS = 1000
+
+
+def build(make_entry):
+    """
+    Builds {user_id: {date: entry}} structure of USERS x DAYS entries.
+    """
+    first_day = datetime.date(2011, 1, 3).toordinal()
+    dates = [datetime.date.fromordinal(first_day + day)
+             for day in xrange(DAYS)]
+    data = {}
+    for user_id in xrange(USERS):
+        start = 28800 + user_id % 3600
+        data[user_id] = dict(
+            (date, make_entry(start, start + 28800)) for date in dates
+        )
+    return data
+
+
+def dict_entry(start, end):
+    """
+    Former entry, a dict of datetime.time objects.
+    """
+    return {
+        'start': datetime.time(start // 3600, start // 60 % 60, start % 60),
+        'end': datetime.time(end // 3600, end // 60 % 60, end % 60),
+    }
+
+
+def run():
+    """
+    Runs benchmark for both layouts.
+    """
+    rows = []
+    for name, make_entry in [('dict of times', dict_entry),
+                             ('PresenceEntry', PresenceEntry)]:
+        growth = peak_memory(build, make_entry)
+        rows.append([
+            name, USERS * DAYS, growth / 1024, growth * 1024 / (USERS * DAYS)
+        ])
+    print_table(['layout', 'entries', 'peak RSS [MiB]', 'bytes/entry'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Office-wide statistics of 1000 users times 250 days.
+
+Compares single pass over dict store with vectorised columnar store.
+"""
+import os
+import time
+
+from presence_analyzer import utils
+from presence_analyzer.benchmarks import (
+    app_config, generate_presence_csv, print_table, temporary_directory,
+)
+
+USERS = 1000
+DAYS = 250
+
+
+def aggregate(store):
+    """
+    Returns time of calculating office statistics from loaded data.
+    """
+    with app_config(PRESENCE_STORE=store):
+        data = utils.get_data()
+        started = time.time()
+        utils.aggregate_office(data)
+        return time.time() - started
+
+
+def run():
+    """
+    Runs benchmark for both stores.
+    """
+    with temporary_directory() as directory:
+        path = os.path.join(directory, 'presence.csv')
+        generate_presence_csv(path, USERS, DAYS)
+        with app_config(DATA_CSV=path, CACHE_DATA=False):
+            results = [['dict', '%.3f' % aggregate('dict')]]
+            if utils.numpy is not None:
+                results.append(['columnar', '%.3f' % aggregate('columnar')])
+    print_table(['store', 'time [s]'], results)
+
+
+if __name__ == '__main__':
+    run()
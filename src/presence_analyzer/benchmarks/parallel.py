@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel CSV parsing of sample data scaled up 100 times.
+
+Compares reading the file from scratch by 1, 2, 4 and 8 processes.
+"""
+import multiprocessing
+
+from presence_analyzer.benchmarks import (
+    parse_time, print_table, scale_sample, temporary_directory,
+)
+
+SCALE = 100
+WORKERS = (1, 2, 4, 8)
+
+
+def run():
+    """
+    Runs benchmark for every number of workers.
+    """
+    with temporary_directory() as directory:
+        path, rows = scale_sample(directory, SCALE)
+        times = [parse_time(path, workers) for workers in WORKERS]
+    print 'CPUs: %d' % multiprocessing.cpu_count()
+    print_table(
+        ['workers', 'rows', 'time [s]', 'rows/s', 'speed-up'],
+        [
+            [workers, rows, '%.3f' % elapsed, int(rows / elapsed),
+             '%.2f' % (times[0] / elapsed)]
+            for workers, elapsed in zip(WORKERS, times)
+        ],
+    )
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+CSV parse throughput of get_data on sample data scaled up 100 times.
+
+Compares fixed layout parser with the former strptime calls.
+"""
+import datetime
+
+import mock
+
+from presence_analyzer import loader
+from presence_analyzer.benchmarks import (
+    parse_time, print_table, scale_sample, temporary_directory,
+)
+
+SCALE = 100
+
+
+def strptime_row(row):
+    """
+    Former row parser calling strptime three times.
+    """
+    strptime = datetime.datetime.strptime
+    return int(row[0]), strptime(row[1], '%Y-%m-%d').date(), {
+        'start': strptime(row[2], '%H:%M:%S').time(),
+        'end': strptime(row[3], '%H:%M:%S').time(),
+    }
+
+
+def run():
+    """
+    Runs benchmark for both parsers.
+    """
+    with temporary_directory() as directory:
+        path, rows = scale_sample(directory, SCALE)
+        with mock.patch.object(loader, 'parse_row', strptime_row):
+            strptime_time = parse_time(path)
+        fast_time = parse_time(path)
+    print_table(
+        ['parser', 'rows', 'time [s]', 'rows/s'],
+        [
+            ['strptime', rows, '%.3f' % strptime_time,
+             int(rows / strptime_time)],
+            ['fixed layout', rows, '%.3f' % fast_time,
+             int(rows / fast_time)],
+        ],
+    )
+
+
+if __name__ == '__main__':
+    run()
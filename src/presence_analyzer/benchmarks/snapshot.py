@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Cold start of get_data on sample data scaled up 100 times.
+
+Compares parsing CSV text with loading a fresh binary snapshot.
+"""
+import os
+import time
+
+from presence_analyzer import loader, utils
+from presence_analyzer.benchmarks import (
+    app_config, print_table, scale_sample, temporary_directory,
+)
+
+SCALE = 100
+
+
+def cold_start(**config):
+    """
+    Returns time of loading presence data with empty caches.
+    """
+    loader.DATES.clear()
+    loader.TIMES.clear()
+    with app_config(CACHE_DATA=False, **config):
+        started = time.time()
+        utils.get_data()
+        return time.time() - started
+
+
+def run():
+    """
+    Runs benchmark for CSV and both snapshot based stores.
+    """
+    with temporary_directory() as directory:
+        path, rows = scale_sample(directory, SCALE)
+        snapshot = os.path.join(directory, 'scaled.snapshot')
+        csv_time = cold_start(DATA_CSV=path, DATA_SNAPSHOT=None)
+        build_time = cold_start(DATA_CSV=path, DATA_SNAPSHOT=snapshot)
+        dict_time = cold_start(DATA_CSV=path, DATA_SNAPSHOT=snapshot)
+        results = [
+            ['CSV', rows, '%.3f' % csv_time],
+            ['CSV + snapshot write', rows, '%.3f' % build_time],
+            ['snapshot, dict', rows, '%.3f' % dict_time],
+        ]
+        if utils.numpy is not None:
+            columnar_time = cold_start(
+                DATA_CSV=path, DATA_SNAPSHOT=snapshot,
+                PRESENCE_STORE='columnar',
+            )
+            results.append(
+                ['snapshot, columnar', rows, '%.4f' % columnar_time]
+            )
+    print_table(['source', 'rows', 'time [s]'], results)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Regression suite of get_data, aggregations and API views.
+
+Generates synthetic presence CSV and users XML of `--users` times
+`--years`, measures mean time, allocations and peak RSS growth of every
+case and writes them as JSON. With `--baseline` the results are compared
+with saved ones and the exit status is 1 when any case got slower or
+allocates more than `--tolerance` allows:
+
+    bin/python-console -m presence_analyzer.benchmarks.suite \\
+        --output baseline.json
+    bin/python-console -m presence_analyzer.benchmarks.suite \\
+        --baseline baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+
+from presence_analyzer import loader, utils
+from presence_analyzer.benchmarks import (
+    app_config, count_allocations, generate_presence_csv, generate_users_xml,
+    measure, peak_memory, print_table, temporary_directory,
+)
+from presence_analyzer.main import app
+
+# metrics compared with baseline, peak RSS is too coarse to gate on
+COMPARED = ('seconds', 'allocations')
+
+VIEWS = [
+    '/api/v1/users',
+    '/api/v1/user/1/photo',
+    '/api/v1/mean_time_weekday/1',
+    '/api/v1/presence_weekday/1',
+    '/api/v1/presence_start_end/1',
+    '/api/v1/monthly_worked_hours/1',
+    '/api/v1/office/mean_time_weekday',
+    '/api/v1/office/headcount',
+    '/api/v1/office/arrivals',
+    '/api/v1/stats',
+]
+
+
+def load_from_scratch():
+    """
+    Reads presence CSV file without any parsing caches.
+    """
+    loader.DATES.clear()
+    loader.TIMES.clear()
+    return loader.PresenceCsvLoader().load(app.config['DATA_CSV'])
+
+
+def get(client, url):
+    """
+    Returns function requesting url through test client.
+    """
+    def request():
+        """
+        Requests url, failing on error responses.
+        """
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status)
+        return response.data
+    return request
+
+
+def cold(function):
+    """
+    Returns function calling `function` without memoised JSON responses
+    and aggregates, so views calculate them again.
+    """
+    def call():
+        """
+        Clears memoised responses and aggregates and calls function.
+        """
+        for view in utils.jsonified_functions:
+            view.clear()
+        utils.get_aggregates.invalidate()
+        utils.get_office_aggregates.invalidate()
+        utils.get_range_aggregates.invalidate()
+        return function()
+    return call
+
+
+def cases():
+    """
+    Returns (name, function, repeat) of every benchmarked case.
+
+    Views are timed both cold and served from memoised responses.
+    """
+    data = utils.get_data()
+    items = data[1]
+    client = app.test_client()
+    result = [
+        ('get_data:scratch', load_from_scratch, 3),
+        ('get_data:hit', utils.get_data, 1000),
+        ('load_user_directory',
+         lambda: utils.load_user_directory(app.config['DATA_XML']), 10),
+        ('group_by_weekday', lambda: utils.group_by_weekday(items), 100),
+        ('get_mean_start_end_time',
+         lambda: utils.get_mean_start_end_time(items), 100),
+        ('get_monthly_worked_hours',
+         lambda: utils.get_monthly_worked_hours(items), 100),
+        ('aggregate_user', lambda: utils.aggregate_user(items), 100),
+        ('aggregate_office', lambda: utils.aggregate_office(data), 3),
+    ]
+    for url in VIEWS:
+        result.append(('GET %s:cold' % url, cold(get(client, url)), 5))
+        result.append(('GET %s:memo' % url, get(client, url), 20))
+    return result
+
+
+def run_case(function, repeat):
+    """
+    Returns seconds, allocations and peak RSS growth of function call.
+    """
+    function()
+    return {
+        'seconds': measure(function, repeat),
+        'allocations': count_allocations(function),
+        'peak_rss_kib': peak_memory(function),
+    }
+
+
+def run_suite(users, years):
+    """
+    Returns results document of all cases on generated data.
+    """
+    with temporary_directory() as directory:
+        csv_path = os.path.join(directory, 'presence.csv')
+        xml_path = os.path.join(directory, 'users.xml')
+        generate_presence_csv(csv_path, users, years * 365)
+        generate_users_xml(xml_path, users)
+        with app_config(DATA_CSV=csv_path, DATA_XML=xml_path,
+                        CACHE_DATA=True, CACHE_INVALIDATION='ttl'):
+            utils.get_data.invalidate()
+            utils.get_user_directory.invalidate()
+            results = dict(
+                (name, run_case(function, repeat))
+                for name, function, repeat in cases()
+            )
+            utils.get_data.invalidate()
+            utils.get_user_directory.invalidate()
+    return {
+        'environment': {
+            'users': users,
+            'years': years,
+            'rows': users * years * 365,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'store': app.config.get('PRESENCE_STORE', 'dict'),
+            'created': datetime.datetime.utcnow().isoformat(),
+            'max_rss_kib':
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns (case, metric, baseline, current) of regressed measurements.
+
+    Measurement regresses when it exceeds the baseline by more than
+    `tolerance` fraction. Cases missing in either document are skipped.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric in COMPARED:
+            previous = baseline[name][metric]
+            current = results[name][metric]
+            if current > previous * (1 + tolerance):
+                regressions.append((name, metric, previous, current))
+    return regressions
+
+
+def ratio(current, previous):
+    """
+    Formats current to previous value ratio.
+    """
+    if not previous:
+        return '-'
+    return '%.2f' % (float(current) / previous)
+
+
+def run(argv=None):
+    """
+    Runs suite, saves and compares results, returns exit status.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--output', help='write results JSON to file')
+    parser.add_argument('--baseline', help='compare with results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    options = parser.parse_args(argv)
+
+    document = run_suite(options.users, options.years)
+    results = document['results']
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(document, output_file, indent=2, sort_keys=True)
+
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    rows = []
+    for name in sorted(results):
+        result = results[name]
+        previous = baseline.get(name, {})
+        rows.append([
+            name,
+            '%.6f' % result['seconds'],
+            ratio(result['seconds'], previous.get('seconds')),
+            result['allocations'],
+            ratio(result['allocations'], previous.get('allocations')),
+            result['peak_rss_kib'],
+        ])
+    print_table(
+        ['case', 'time [s]', 'vs base', 'allocs', 'vs base',
+         'peak RSS [KiB]'],
+        rows,
+    )
+
+    regressions = compare(results, baseline, options.tolerance)
+    for name, metric, previous, current in regressions:
+        print 'REGRESSION %s %s: %s -> %s' % (name, metric, previous, current)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
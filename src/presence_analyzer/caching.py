@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory cache of function results.
+
+Cached functions share read-only snapshots of their results, see
+cache_data().
+"""
+from collections import OrderedDict, namedtuple
+from functools import partial, wraps
+import heapq
+import itertools
+import logging
+import os
+import sys
+from threading import Lock, Thread
+import time
+
+from presence_analyzer import metrics
+from presence_analyzer.main import app
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+cached_functions = []  # pylint: disable=invalid-name
+
+CACHE_REFRESH_SECONDS = metrics.Histogram(
+    'presence_cache_refresh_seconds',
+    'Time of calculating results of cached functions.', ['function'],
+)
+CACHE_LOCK_WAIT_SECONDS = metrics.Histogram(
+    'presence_cache_lock_wait_seconds',
+    'Time spent waiting for calculation lock of cached functions.',
+    ['function'],
+)
+
+
+Snapshot = namedtuple(
+    'Snapshot', 'value updated signature generation size'
+)
+
+
+class FrozenDict(dict):
+    """
+    Read-only dictionary handed out by the cache as a shared snapshot.
+    """
+
+    def _immutable(self, *args, **kwargs):  # pylint: disable=unused-argument
+        """
+        Refuses any modification of the snapshot.
+        """
+        raise TypeError('%s is read-only' % type(self).__name__)
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class UserEntries(FrozenDict):
+    """
+    Read-only {date: entry} dictionary of a single user.
+
+    Keeps sorted index of its dates, so entries of a range of days are
+    found by bisection instead of scanning the whole history.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(UserEntries, self).__init__(*args, **kwargs)
+        self.dates = tuple(sorted(self))
+
+    def updated(self, entries):
+        """
+        Returns copy with entries added or replaced.
+
+        New dates are merged into the sorted index, which is simply
+        extended when they all come after the last one.
+        """
+        result = UserEntries.__new__(UserEntries)
+        dict.update(result, self)
+        dict.update(result, entries)
+        added = sorted(date for date in entries if date not in self)
+        if not added:
+            result.dates = self.dates
+        elif not self.dates or added[0] > self.dates[-1]:
+            result.dates = self.dates + tuple(added)
+        else:
+            result.dates = tuple(heapq.merge(self.dates, added))
+        return result
+
+
+def freeze(value):
+    """
+    Returns immutable counterpart of passed value.
+
+    Dictionaries become FrozenDict, lists become tuples and sets become
+    frozensets, recursively. Other objects are returned untouched, so
+    they have to be immutable already (numbers, strings, dates, named
+    tuples).
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict(
+            (key, freeze(item)) for key, item in value.iteritems()
+        )
+    if isinstance(value, list) or \
+            isinstance(value, tuple) and not hasattr(value, '_fields'):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+def file_signature(path):
+    """
+    Returns (inode, size, modification time) of file or None if the file
+    can't be accessed.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def cache_data(seconds=0, watch=None, invalidation=None, max_entries=None,
+               max_bytes=None, source=None):
+    """
+    Decorator for caching data in memory.
+
+    Results are cached per positional and keyword arguments. Result is
+    frozen once, when it is calculated, and the very same read-only
+    snapshot is shared by all callers until it expires.
+
+    In 'ttl' invalidation mode snapshot expires after `seconds`. In
+    'watch' mode it expires only when the file named by `watch` config
+    key (or returned by `watch` function) changes its inode, size or
+    modification time. The mode is taken
+    from `invalidation` or CACHE_INVALIDATION config key ('ttl' by
+    default); functions without watched file always use 'ttl'.
+
+    Results calculated from another cached function passed as `source`
+    are kept per its generation, so they are never served for a newer
+    source snapshot.
+
+    With `max_entries` or `max_bytes` (approximated by sizeof()) least
+    recently used snapshots are evicted once the limit is exceeded.
+
+    Reads never wait for a calculation. Snapshot which expired no longer
+    than CACHE_STALE_WHILE_REVALIDATE seconds ago is still served while
+    a single background thread calculates its replacement. Only a
+    missing or completely outdated snapshot is calculated in place.
+    Calculations of the same key never run concurrently, different keys
+    are calculated independently.
+
+    Calls with unhashable arguments are not cached.
+    """
+
+    def decorate(function):
+        """
+        Main decorator function.
+        """
+        name = function.__name__
+        bookkeeping = Lock()
+        snapshots = OrderedDict()
+        locks = {}
+        workers = {}
+        latest = {}
+        hooks = []
+        counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+        generations = itertools.count(1)
+
+        def make_key(args, kwargs):
+            """
+            Returns cache key of call arguments.
+            """
+            key = (args, tuple(sorted(kwargs.items())))
+            if source is not None:
+                source()
+                key += (source.generation(),)
+            return key
+
+        def watched_signature():
+            """
+            Returns signature of watched file, None in 'ttl' mode.
+            """
+            mode = invalidation or app.config.get('CACHE_INVALIDATION', 'ttl')
+            if watch is None or mode != 'watch':
+                return None
+            path = watch() if callable(watch) else app.config.get(watch)
+            # missing file is cached as well until it appears
+            return file_signature(path) or ('missing', path)
+
+        def is_fresh(snapshot, signature):
+            """
+            Checks if snapshot may be served as it is.
+            """
+            if signature is not None:
+                return snapshot.signature == signature
+            return time.time() - snapshot.updated <= seconds
+
+        def key_lock(key):
+            """
+            Returns lock serialising calculations of key.
+            """
+            with bookkeeping:
+                return locks.setdefault(key, Lock())
+
+        def forget(key):
+            """
+            Drops snapshot of key, caller holds bookkeeping lock.
+            """
+            snapshot = snapshots.pop(key)
+            counters['bytes'] -= snapshot.size
+            arguments = key[:2]
+            if latest.get(arguments) == snapshot.generation:
+                del latest[arguments]
+            lock = locks.get(key)
+            if lock is not None and lock.acquire(False):
+                del locks[key]
+                lock.release()
+
+        def lookup(key):
+            """
+            Returns snapshot of key marking it as recently used.
+            """
+            with bookkeeping:
+                snapshot = snapshots.get(key)
+                if snapshot is not None:
+                    snapshots[key] = snapshots.pop(key)
+                return snapshot
+
+        def store(key, snapshot):
+            """
+            Stores snapshot, evicting least recently used ones over limit.
+            """
+            with bookkeeping:
+                previous = snapshots.pop(key, None)
+                if previous is not None:
+                    counters['bytes'] -= previous.size
+                snapshots[key] = snapshot
+                counters['bytes'] += snapshot.size
+                latest[key[:2]] = snapshot.generation
+                while len(snapshots) > 1 and (
+                        max_entries and len(snapshots) > max_entries or
+                        max_bytes and counters['bytes'] > max_bytes):
+                    forget(next(iter(snapshots)))
+                    counters['evictions'] += 1
+
+        def count_call(counter):
+            """
+            Increments one of hit and miss counters.
+            """
+            with bookkeeping:
+                counters[counter] += 1
+
+        def refresh(key, args, kwargs):
+            """
+            Calculates new snapshot and swaps it in.
+            """
+            signature = watched_signature()
+            started = time.time()
+            value = freeze(function(*args, **kwargs))
+            CACHE_REFRESH_SECONDS.observe(
+                time.time() - started, function=name
+            )
+            snapshot = Snapshot(
+                value, time.time(), signature, next(generations),
+                sizeof(value) if max_bytes else 0,
+            )
+            store(key, snapshot)
+            return snapshot
+
+        def background_refresh(key, lock, args, kwargs):
+            """
+            Refreshes snapshot in worker thread holding the key lock.
+            """
+            try:
+                refresh(key, args, kwargs)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('background refresh of %s failed', name)
+            finally:
+                with bookkeeping:
+                    workers.pop(key, None)
+                lock.release()
+
+        @wraps(function)
+        def do_cache(*args, **kwargs):
+            """
+            Cache method.
+            """
+            should_cache = app.config.get('CACHE_DATA', True)
+            if not should_cache:
+                return function(*args, **kwargs)
+
+            key = make_key(args, kwargs)
+            try:
+                hash(key)
+            except TypeError:
+                return function(*args, **kwargs)
+            snapshot = lookup(key)
+            if snapshot is not None:
+                signature = watched_signature()
+                if is_fresh(snapshot, signature):
+                    count_call('hits')
+                    return snapshot.value
+                stale = app.config.get('CACHE_STALE_WHILE_REVALIDATE', 0)
+                if signature is not None:
+                    # file change is noticed right away
+                    expired = 0
+                else:
+                    expired = time.time() - snapshot.updated - seconds
+                if stale and expired <= stale:
+                    lock = key_lock(key)
+                    if lock.acquire(False):
+                        worker = Thread(
+                            target=background_refresh,
+                            args=(key, lock, args, kwargs),
+                            name='refresh-%s' % name,
+                        )
+                        worker.daemon = True
+                        with bookkeeping:
+                            workers[key] = worker
+                        worker.start()
+                    count_call('hits')
+                    return snapshot.value
+
+            started = time.time()
+            with key_lock(key):
+                CACHE_LOCK_WAIT_SECONDS.observe(
+                    time.time() - started, function=name
+                )
+                # somebody could refresh it while we were waiting
+                snapshot = lookup(key)
+                if snapshot and is_fresh(snapshot, watched_signature()):
+                    count_call('hits')
+                    return snapshot.value
+                count_call('misses')
+                return refresh(key, args, kwargs).value
+
+        def invalidate(*args, **kwargs):
+            """
+            Drops cached snapshot of given arguments, all of them when
+            called without arguments. Next call calculates it again.
+            """
+            with bookkeeping:
+                if args or kwargs:
+                    keys = [
+                        key for key in snapshots
+                        if key[:2] == (args, tuple(sorted(kwargs.items())))
+                    ]
+                else:
+                    keys = list(snapshots)
+                for key in keys:
+                    forget(key)
+            for hook in hooks:
+                hook(*args, **kwargs)
+
+        def on_invalidate(hook):
+            """
+            Registers function called with arguments of every invalidate().
+            """
+            hooks.append(hook)
+            return hook
+
+        def wait():
+            """
+            Waits until pending background refreshes are finished.
+            """
+            with bookkeeping:
+                pending = workers.values()
+            for worker in pending:
+                worker.join()
+
+        def generation(*args, **kwargs):
+            """
+            Returns number of latest snapshot of given arguments, None if
+            there is none.
+            """
+            with bookkeeping:
+                return latest.get((args, tuple(sorted(kwargs.items()))))
+
+        def stats():
+            """
+            Returns hit, miss and eviction counters, number of cached
+            snapshots and their approximate size in bytes.
+            """
+            with bookkeeping:
+                return dict(counters, entries=len(snapshots))
+
+        do_cache.invalidate = invalidate
+        do_cache.on_invalidate = on_invalidate
+        do_cache.wait = wait
+        do_cache.generation = generation
+        do_cache.stats = stats
+        cached_functions.append(do_cache)
+        return do_cache
+
+    return decorate
+
+
+def cache_samples(counter):
+    """
+    Returns samples of one stats() counter of all cached functions.
+    """
+    return [
+        ({'function': function.__name__}, function.stats()[counter])
+        for function in cached_functions
+    ]
+
+
+CACHE_HITS = metrics.Callback(
+    'presence_cache_hits_total', 'Calls served from cache.', 'counter',
+    partial(cache_samples, 'hits'), ['function'],
+)
+CACHE_MISSES = metrics.Callback(
+    'presence_cache_misses_total', 'Calls calculated in place.', 'counter',
+    partial(cache_samples, 'misses'), ['function'],
+)
+CACHE_EVICTIONS = metrics.Callback(
+    'presence_cache_evictions_total', 'Snapshots evicted over limits.',
+    'counter', partial(cache_samples, 'evictions'), ['function'],
+)
+CACHE_ENTRIES = metrics.Callback(
+    'presence_cache_entries', 'Cached snapshots.', 'gauge',
+    partial(cache_samples, 'entries'), ['function'],
+)
+CACHE_BYTES = metrics.Callback(
+    'presence_cache_bytes', 'Approximate size of cached snapshots.',
+    'gauge', partial(cache_samples, 'bytes'), ['function'],
+)
+
+
+def sizeof(value, seen=None):
+    """
+    Approximates memory taken by value and everything it contains.
+
+    Containers are walked recursively, objects exposing `nbytes` (numpy
+    arrays, columnar store) report it themselves. SQLite store keeps its
+    data on disk, so only the object itself is counted.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if hasattr(value, 'nbytes'):
+        return sys.getsizeof(value) + value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.iteritems():
+            size += sizeof(key, seen) + sizeof(item, seen)
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        for item in value:
+            size += sizeof(item, seen)
+    return size
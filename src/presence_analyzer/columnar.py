@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar presence store backed by NumPy arrays.
+
+Enabled with PRESENCE_STORE = 'columnar', requires numpy.
+"""
+from collections import Mapping
+import datetime
+
+from presence_analyzer.models import PresenceEntry
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+# ordinal of 1970-01-01, day zero of numpy datetime64
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def readonly(array):
+    """
+    Marks array as read-only and returns it.
+    """
+    array.flags.writeable = False
+    return array
+
+
+class ColumnarStore(Mapping):
+    """
+    Presence data kept in parallel arrays sorted by user and day.
+
+    Arrays hold user id, day ordinal, start and end seconds since
+    midnight of every entry. Offsets of each user's slice are indexed
+    by user id. Store behaves like read-only {user_id: entries} mapping.
+    """
+
+    def __init__(self, user_ids, days, starts, ends):
+        self.user_ids = readonly(user_ids)
+        self.days = readonly(days)
+        self.starts = readonly(starts)
+        self.ends = readonly(ends)
+        users, begins = numpy.unique(user_ids, return_index=True)
+        bounds = begins.tolist() + [len(user_ids)]
+        self.index = dict(
+            (user_id, (bounds[i], bounds[i + 1]))
+            for i, user_id in enumerate(users.tolist())
+        )
+
+    @property
+    def nbytes(self):
+        """
+        Memory taken by the arrays.
+        """
+        return sum(
+            array.nbytes
+            for array in (self.user_ids, self.days, self.starts, self.ends)
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds store from (user_id, day ordinal, start, end) tuples.
+        """
+        rows = numpy.array(sorted(rows), dtype=numpy.int64).reshape(-1, 4)
+        return cls(
+            rows[:, 0].copy(),
+            rows[:, 1].astype(numpy.int32),
+            rows[:, 2].astype(numpy.int32),
+            rows[:, 3].astype(numpy.int32),
+        )
+
+    def everyone(self):
+        """
+        Returns entries of all users as a single UserColumns.
+        """
+        return UserColumns(self.days, self.starts, self.ends)
+
+    def __getitem__(self, user_id):
+        begin, end = self.index[user_id]
+        return UserColumns(
+            self.days[begin:end], self.starts[begin:end], self.ends[begin:end]
+        )
+
+    def __contains__(self, user_id):
+        return user_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class UserColumns(Mapping):
+    """
+    Presence entries of a single user as array slices.
+
+    Behaves like read-only {date: entry} mapping, but aggregation
+    helpers from utils use its vectorised reductions instead.
+    """
+
+    def __init__(self, days, starts, ends):
+        self.days = days
+        self.starts = starts
+        self.ends = ends
+
+    @property
+    def weekdays(self):
+        """
+        Weekday of every entry, Monday is zero.
+        """
+        return (self.days + 6) % 7
+
+    @property
+    def intervals(self):
+        """
+        Presence time of every entry in seconds.
+        """
+        return self.ends - self.starts
+
+    def group_by_weekday(self):
+        """
+        Groups presence intervals by weekday.
+        """
+        weekdays = self.weekdays
+        intervals = self.intervals
+        return [intervals[weekdays == day].tolist() for day in xrange(7)]
+
+    def weekday_totals(self):
+        """
+        Returns number of entries and total presence time per weekday.
+        """
+        weekdays = self.weekdays
+        counts = numpy.bincount(weekdays, minlength=7).tolist()
+        totals = numpy.bincount(weekdays, self.intervals, 7)
+        return counts, totals.astype(numpy.int64).tolist()
+
+    def mean_start_end_time(self):
+        """
+        Returns (mean start, mean end) tuple for every weekday.
+        """
+        weekdays = self.weekdays
+        counts = numpy.bincount(weekdays, minlength=7).tolist()
+        starts = numpy.bincount(weekdays, self.starts, 7).tolist()
+        ends = numpy.bincount(weekdays, self.ends, 7).tolist()
+        return [
+            (starts[day] / count, ends[day] / count) if count else (0, 0)
+            for day, count in enumerate(counts)
+        ]
+
+    def month_totals(self):
+        """
+        Returns {year: {month: [total presence seconds]}} dictionary.
+        """
+        months = (self.days - EPOCH).astype('datetime64[D]')
+        months = months.astype('datetime64[M]').astype(numpy.int64)
+        first = months.min() if len(months) else 0
+        totals = numpy.bincount(months - first, self.intervals)
+        years = {}
+        for offset in numpy.flatnonzero(numpy.bincount(months - first)):
+            year, month = divmod(int(first + offset), 12)
+            years.setdefault(1970 + year, {})[month + 1] = [
+                int(totals[offset])
+            ]
+        return years
+
+    def day_counts(self):
+        """
+        Returns (date, number of entries) pairs of all days with entries.
+        """
+        days, counts = numpy.unique(self.days, return_counts=True)
+        return [
+            (datetime.date.fromordinal(day), count)
+            for day, count in zip(days.tolist(), counts.tolist())
+        ]
+
+    def start_counts(self, bucket):
+        """
+        Returns (bucket start, number of entries) pairs of start times
+        grouped into `bucket` seconds long periods.
+        """
+        counts = numpy.bincount(self.starts // bucket)
+        return [
+            (int(index) * bucket, int(counts[index]))
+            for index in numpy.flatnonzero(counts)
+        ]
+
+    def between(self, start=None, end=None):
+        """
+        Returns entries of days from start to end, both inclusive.
+        """
+        begin = 0
+        stop = len(self.days)
+        if start is not None:
+            begin = numpy.searchsorted(self.days, start.toordinal())
+        if end is not None:
+            stop = numpy.searchsorted(self.days, end.toordinal(), 'right')
+        return UserColumns(
+            self.days[begin:stop], self.starts[begin:stop],
+            self.ends[begin:stop],
+        )
+
+    def __getitem__(self, date):
+        day = date.toordinal()
+        position = numpy.searchsorted(self.days, day)
+        if position == len(self.days) or self.days[position] != day:
+            raise KeyError(date)
+        return PresenceEntry(
+            int(self.starts[position]), int(self.ends[position])
+        )
+
+    def __iter__(self):
+        for day in self.days.tolist():
+            yield datetime.date.fromordinal(day)
+
+    def __len__(self):
+        return len(self.days)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Atomic replacement of data files.
+"""
+import os
+import stat
+
+# mode of new files, mkstemp creates them readable by owner only
+DEFAULT_MODE = 0644
+
+
+def replace_file(temporary, path):
+    """
+    Renames temporary file over path.
+
+    Replacement gets mode of the file it replaces, DEFAULT_MODE when
+    there is none, so other processes can still read it.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = DEFAULT_MODE
+    os.chmod(temporary, mode)
+    os.rename(temporary, path)
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+Loading of presence CSV file.
+
+CSV file is parsed incrementally, optionally by a pool of processes,
+and turned into configured store: dictionaries, columnar store, binary
+snapshot or SQLite database.
+"""
+from array import array
+import csv
+import datetime
+import fcntl
+import itertools
+import logging
+import multiprocessing
+import os
+import sqlite3
+from threading import Lock
+import time
+
+from presence_analyzer import metrics
+from presence_analyzer.caching import FrozenDict, UserEntries
+from presence_analyzer.columnar import ColumnarStore, numpy
+from presence_analyzer.main import app
+from presence_analyzer.models import PresenceEntry
+from presence_analyzer.snapshot import PresenceSnapshot, csv_source, \
+    matches_source, write_snapshot
+from presence_analyzer.sqlstore import ConnectionPool, SqliteStore, \
+    read_source, write_database
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+sqlite_stores = {}  # pylint: disable=invalid-name
+
+CSV_BLOCK_SIZE = 1024 * 1024
+
+CSV_ROWS = metrics.Counter(
+    'presence_csv_rows_total', 'Presence CSV rows read, by parse result.',
+    ['result'],
+)
+CSV_LOAD_SECONDS = metrics.Histogram(
+    'presence_csv_load_seconds', 'Time of loading presence CSV file.',
+)
+
+
+DATES = {}
+TIMES = {}
+
+
+def seconds_since_midnight(value):
+    """
+    Calculates amount of seconds since midnight.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def parse_date(value):
+    """
+    Parses YYYY-MM-DD date, memoising repeated strings.
+    """
+    try:
+        return DATES[value]
+    except KeyError:
+        pass
+    if (len(value) == 10 and value[4] == '-' and value[7] == '-' and
+            (value[:4] + value[5:7] + value[8:]).isdigit()):
+        date = datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+    else:
+        date = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    DATES[value] = date
+    return date
+
+
+def parse_time(value):
+    """
+    Parses HH:MM:SS time to seconds since midnight, memoising repeated
+    strings.
+    """
+    try:
+        return TIMES[value]
+    except KeyError:
+        pass
+    if (len(value) == 8 and value[2] == ':' and value[5] == ':' and
+            (value[:2] + value[3:5] + value[6:]).isdigit()):
+        hour, minute, second = int(value[:2]), int(value[3:5]), int(value[6:])
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError('time data %r is out of range' % value)
+        seconds = hour * 3600 + minute * 60 + second
+    else:
+        seconds = seconds_since_midnight(
+            datetime.datetime.strptime(value, '%H:%M:%S').time()
+        )
+    TIMES[value] = seconds
+    return seconds
+
+
+def parse_row(row):
+    """
+    Parses single CSV row into (user_id, date, presence entry).
+
+    Fixed YYYY-MM-DD and HH:MM:SS layouts are sliced directly, anything
+    else falls back to strptime, so malformed values still raise
+    ValueError or TypeError.
+    """
+    user_id = int(row[0])
+    date = parse_date(row[1])
+    start = parse_time(row[2])
+    end = parse_time(row[3])
+    return user_id, date, PresenceEntry(start, end)
+
+
+class PresenceCsvLoader(object):
+    """
+    Reads presence CSV file incrementally.
+
+    Rows are only appended to the file, so loader remembers how many
+    bytes it has already consumed and parses only the new tail, merging
+    it into previously loaded data. Truncated or rotated file (another
+    inode, smaller size or different beginning) is read from scratch.
+
+    Unterminated last line may still be written, so `incremental`
+    loader leaves it for the next call; other loaders parse it too.
+    """
+    head_size = 1024
+
+    def __init__(self, incremental=False):
+        self.incremental = incremental
+        self.lock = Lock()
+        self.parsed = 0
+        self.skipped = 0
+        self.path = None
+        self.inode = None
+        self.offset = 0
+        self.lines = 0
+        self.head = ''
+        self.data = FrozenDict()
+
+    def reset(self, path, inode):
+        """
+        Forgets everything read so far.
+        """
+        self.path = path
+        self.inode = inode
+        self.offset = 0
+        self.lines = 0
+        self.head = ''
+        self.data = FrozenDict()
+
+    def is_continuation(self, csvfile, path):
+        """
+        Checks if opened file is the one read before, only longer.
+        """
+        stat = os.fstat(csvfile.fileno())
+        if (path, stat.st_ino) != (self.path, self.inode):
+            return False
+        if stat.st_size < self.offset:
+            return False
+        return csvfile.read(len(self.head)) == self.head
+
+    def load(self, path, workers=1):
+        """
+        Returns presence data including rows appended since last call.
+
+        File read from scratch is parsed by a pool of `workers`
+        processes when more than one is requested.
+        """
+        started = time.time()
+        try:
+            return self.read(path, workers)
+        finally:
+            CSV_LOAD_SECONDS.observe(time.time() - started)
+
+    def read(self, path, workers):
+        """
+        Reads new rows of the file, see load().
+        """
+        with self.lock:
+            with open(path, 'rb') as csvfile:
+                if not self.is_continuation(csvfile, path):
+                    self.reset(path, os.fstat(csvfile.fileno()).st_ino)
+                if self.offset == 0 and workers > 1:
+                    return self.load_parallel(csvfile, workers)
+                from_scratch = self.offset == 0
+                updates = self.parse(self.read_lines(csvfile))
+                if from_scratch:
+                    csvfile.seek(0)
+                    self.head = csvfile.read(min(self.offset, self.head_size))
+            if updates:
+                self.data = self.merge(updates)
+            return self.data
+
+    def read_lines(self, csvfile, end=None):
+        """
+        Yields lines of opened file from offset up to `end` (end of file
+        by default), reading it in blocks of CSV_BLOCK_SIZE.
+
+        Offset and number of lines advance past complete lines only.
+        """
+        csvfile.seek(self.offset)
+        position = self.offset
+        tail = ''
+        while end is None or position < end:
+            size = CSV_BLOCK_SIZE
+            if end is not None:
+                size = min(size, end - position)
+            block = csvfile.read(size)
+            if not block:
+                break
+            position += len(block)
+            # partial line is carried over to the next block
+            block = tail + block
+            consumed = block.rfind('\n') + 1
+            tail = block[consumed:]
+            self.offset += consumed
+            self.lines += block.count('\n', 0, consumed)
+            for line in block[:consumed].splitlines():
+                yield line
+        if tail and not self.incremental:
+            yield tail
+
+    def load_parallel(self, csvfile, workers):
+        """
+        Parses whole file in parallel processes.
+
+        File is split at line boundaries into byte ranges, one for each
+        worker. Results are merged in file order, so entries from later
+        lines still replace earlier ones.
+        """
+        size = os.fstat(csvfile.fileno()).st_size
+        bounds = [0]
+        for part in xrange(1, workers):
+            position = size * part // workers
+            if position:
+                csvfile.seek(position - 1)
+                csvfile.readline()
+                position = min(csvfile.tell(), size)
+            bounds.append(position)
+        bounds.append(size)
+        tasks = []
+        line = self.lines
+        for begin, end in zip(bounds, bounds[1:]):
+            if begin < end:
+                tasks.append(
+                    (csvfile.name, begin, end, line, self.incremental)
+                )
+                if end < size:
+                    line += count_lines(csvfile, begin, end)
+        if not tasks:
+            return self.data
+
+        results = parse_pool(workers).map(parse_csv_range, tasks)
+
+        updates = {}
+        for packed, lines, _, parsed, skipped in results:
+            rows = array('l')
+            rows.fromstring(packed)
+            group_rows(itertools.izip(*[iter(rows)] * 4), updates)
+            self.lines += lines
+            self.count_rows(parsed, skipped)
+        # unterminated last line is read again by incremental loader
+        self.offset = results[-1][2]
+        csvfile.seek(0)
+        self.head = csvfile.read(min(self.offset, self.head_size))
+        if updates:
+            self.data = self.merge(updates)
+        return self.data
+
+    def parse(self, lines):
+        """
+        Groups parsed rows by user_id, skipping malformed ones.
+        """
+        updates = {}
+        parsed = skipped = 0
+        presence_reader = csv.reader(lines, delimiter=',')
+        for i, row in enumerate(presence_reader, self.lines):
+            if len(row) != 4:
+                # ignore header and footer lines
+                skipped += 1
+                continue
+
+            try:
+                user_id, date, entry = parse_row(row)
+            except (ValueError, TypeError):
+                log.debug('Problem with line %d: ', i, exc_info=True)
+                skipped += 1
+                continue
+
+            updates.setdefault(user_id, {})[date] = entry
+            parsed += 1
+        self.count_rows(parsed, skipped)
+        return updates
+
+    def count_rows(self, parsed, skipped):
+        """
+        Adds numbers of parsed and skipped rows to loader and metrics.
+        """
+        self.parsed += parsed
+        self.skipped += skipped
+        CSV_ROWS.inc(parsed, result='parsed')
+        CSV_ROWS.inc(skipped, result='skipped')
+
+    def merge(self, updates):
+        """
+        Returns loaded data with new entries of touched users.
+
+        Mapping handed out before is never modified: new one shares
+        UserEntries of untouched users with it, touched users get new
+        ones.
+        """
+        data = FrozenDict(self.data)
+        replaced = {}
+        for user_id, entries in updates.iteritems():
+            previous = data.get(user_id)
+            if previous is None:
+                replaced[user_id] = UserEntries(entries)
+            else:
+                replaced[user_id] = previous.updated(entries)
+        dict.update(data, replaced)
+        return data
+
+
+csv_loader = PresenceCsvLoader(  # pylint: disable=invalid-name
+    incremental=True
+)
+
+
+def parse_csv_range(task):
+    """
+    Parses (path, begin, end, first line, incremental) byte range of CSV
+    file in pool worker.
+
+    Returns parsed (user_id, day ordinal, start, end) rows packed into
+    native long array string, which is much cheaper to send back than
+    pickled dates and entries, number of complete lines, offset just
+    after the last of them and numbers of parsed and skipped rows.
+    """
+    path, begin, end, first_line, incremental = task
+    rows = array('l')
+    loader = PresenceCsvLoader(incremental)
+    loader.offset = begin
+    # malformed rows are logged with their line number in the whole file
+    loader.lines = first_line
+    with open(path, 'rb') as csvfile:
+        updates = loader.parse(loader.read_lines(csvfile, end))
+    for user_id, entries in updates.iteritems():
+        for date, entry in entries.iteritems():
+            rows.extend((user_id, date.toordinal()) + entry)
+    return (
+        rows.tostring(),
+        loader.lines - first_line,
+        loader.offset,
+        loader.parsed,
+        loader.skipped,
+    )
+
+
+def count_lines(csvfile, begin, end):
+    """
+    Returns number of line breaks in byte range of opened file.
+    """
+    csvfile.seek(begin)
+    lines = 0
+    while begin < end:
+        block = csvfile.read(min(CSV_BLOCK_SIZE, end - begin))
+        if not block:
+            break
+        lines += block.count('\n')
+        begin += len(block)
+    return lines
+
+
+parse_pools = {}  # pylint: disable=invalid-name
+parse_pools_lock = Lock()  # pylint: disable=invalid-name
+
+
+def parse_pool(workers):
+    """
+    Returns pool of `workers` processes parsing CSV files.
+
+    Pools are created once per process and reused by later loads.
+    Forking while other threads hold locks can deadlock the children,
+    so start_background_tasks() creates the configured pool before any
+    thread of the application is started.
+    """
+    with parse_pools_lock:
+        pool = parse_pools.get(workers)
+        if pool is None:
+            pool = parse_pools[workers] = multiprocessing.Pool(workers)
+        return pool
+
+
+def close_parse_pools():
+    """
+    Stops processes of all parsing pools.
+    """
+    with parse_pools_lock:
+        for pool in parse_pools.itervalues():
+            pool.terminate()
+            pool.join()
+        parse_pools.clear()
+
+
+def load_snapshot_data(csv_path, snapshot_path):
+    """
+    Returns presence data read from binary snapshot of CSV file.
+
+    Snapshot which is missing or no longer matches the CSV file is
+    rebuilt first. Columnar store uses memory-mapped snapshot columns
+    directly, so all processes share them; dictionary store is built
+    from the columns, which is still much faster than parsing text.
+    When the snapshot can't be written or read, CSV file is parsed.
+    """
+    snapshot = PresenceSnapshot.open(snapshot_path)
+    if snapshot is None or not snapshot.is_fresh(csv_path):
+        snapshot = rebuild_snapshot(csv_path, snapshot_path)
+    if snapshot is None:
+        return PresenceCsvLoader().load(csv_path)
+    return snapshot_data(snapshot)
+
+
+def rebuild_snapshot(csv_path, snapshot_path):
+    """
+    Writes new snapshot of CSV file and returns it, None on failure.
+
+    Rebuilders are serialised with a lock file next to the snapshot, so
+    concurrent processes write each change once.
+    """
+    try:
+        with open(snapshot_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # another process could rebuild it while we were waiting
+            snapshot = PresenceSnapshot.open(snapshot_path)
+            if snapshot is not None and snapshot.is_fresh(csv_path):
+                return snapshot
+            log.info('rebuilding presence snapshot %s', snapshot_path)
+            write_presence_snapshot(csv_path, snapshot_path)
+    except (IOError, OSError):
+        log.exception('cannot write presence snapshot')
+        return None
+    snapshot = PresenceSnapshot.open(snapshot_path)
+    if snapshot is None:
+        log.error('cannot read presence snapshot %s', snapshot_path)
+    return snapshot
+
+
+def snapshot_data(snapshot):
+    """
+    Returns presence data of snapshot in configured store.
+    """
+    columnar = app.config.get('PRESENCE_STORE', 'dict') == 'columnar'
+    if columnar and numpy is not None:
+        return ColumnarStore(*snapshot.arrays())
+
+    return FrozenDict(
+        (user_id, UserEntries(entries))
+        for user_id, entries in group_rows(snapshot.rows()).iteritems()
+    )
+
+
+def group_rows(rows, data=None):
+    """
+    Groups (user_id, day ordinal, start, end) rows into `data` by user.
+
+    Later row of the same user and day replaces the earlier one.
+    """
+    if data is None:
+        data = {}
+    days = {}
+    for user_id, day, start, end in rows:
+        if day not in days:
+            days[day] = datetime.date.fromordinal(day)
+        data.setdefault(user_id, {})[days[day]] = PresenceEntry(start, end)
+    return data
+
+
+def parse_presence_rows(csv_path):
+    """
+    Parses CSV file into rows sorted by user and day.
+
+    :return: (user_id, day ordinal, start, end) rows iterator and
+        (size, mtime, sha1) source of the file
+    """
+    with open(csv_path, 'rb') as csvfile:
+        content = csvfile.read()
+    data = PresenceCsvLoader().parse(content.splitlines())
+    rows = (
+        (user_id, date.toordinal()) + data[user_id][date]
+        for user_id in sorted(data)
+        for date in sorted(data[user_id])
+    )
+    return rows, csv_source(content, csv_path)
+
+
+def write_presence_snapshot(csv_path, snapshot_path):
+    """
+    Parses CSV file and writes its binary snapshot.
+    """
+    rows, source = parse_presence_rows(csv_path)
+    write_snapshot(snapshot_path, rows, source)
+
+
+def is_imported(csv_path, database_path):
+    """
+    Checks if database holds current content of CSV file.
+    """
+    source = read_source(database_path)
+    return source is not None and matches_source(csv_path, source)
+
+
+def load_sqlite_store(csv_path, database_path):
+    """
+    Returns SqliteStore of database imported from CSV file.
+
+    Database which is missing or no longer matches the CSV file is
+    imported again. Importers are serialised with a lock file next to
+    the database, so concurrent processes import each change once.
+    Store and its connection pool are reused as long as the database
+    file stays the same.
+    """
+    if not is_imported(csv_path, database_path):
+        try:
+            with open(database_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # another process could import it while we were waiting
+                if not is_imported(csv_path, database_path):
+                    log.info('importing presence data into %s',
+                             database_path)
+                    write_database(
+                        database_path, *parse_presence_rows(csv_path)
+                    )
+        except (IOError, OSError, sqlite3.Error):
+            log.exception('cannot write presence database')
+            return PresenceCsvLoader().load(csv_path)
+
+    inode = os.stat(database_path).st_ino
+    current = sqlite_stores.get(database_path)
+    if current is None or current[0] != inode:
+        pool = ConnectionPool(
+            database_path, app.config.get('SQLITE_POOL_SIZE', 5)
+        )
+        current = sqlite_stores[database_path] = (inode, SqliteStore(pool))
+    return current[1]
+
+
+def build_columnar_store(data):
+    """
+    Converts presence data dictionary to ColumnarStore.
+    """
+    return ColumnarStore.from_rows(
+        (
+            user_id,
+            date.toordinal(),
+            entry.start_seconds,
+            entry.end_seconds,
+        )
+        for user_id, entries in data.iteritems()
+        for date, entry in entries.iteritems()
+    )
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Process metrics exposed in Prometheus text format.
+
+Metrics register themselves in REGISTRY when created and are rendered
+by render(). Updates take a short per-metric lock only.
+"""
+from threading import Lock
+
+REGISTRY = []
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+
+
+class Metric(object):
+    """
+    Base of metrics with optional labels.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        """
+        Returns label values in order of label names.
+        """
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self):
+        """
+        Returns (suffix, labels, value) of every sample.
+        """
+        with self.lock:
+            values = self.values.items()
+        return [
+            ('', zip(self.labels, key), value)
+            for key, value in sorted(values)
+        ]
+
+
+class Counter(Metric):
+    """
+    Value which only goes up.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases counter of given labels.
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value which is set to the current state.
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """
+        Sets gauge of given labels.
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """
+        Records single observation of given labels.
+        """
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def samples(self):
+        """
+        Returns bucket, sum and count samples of every label set.
+        """
+        with self.lock:
+            values = [
+                (key, list(counts)) for key, counts in self.values.items()
+            ]
+        samples = []
+        for key, counts in sorted(values):
+            labels = zip(self.labels, key)
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                samples.append(
+                    ('_bucket', labels + [('le', format_value(bound))], total)
+                )
+            samples.append(('_sum', labels, counts[-1]))
+            samples.append(('_count', labels, total))
+        return samples
+
+
+class Callback(Metric):
+    """
+    Metric read from a function when rendered.
+
+    Function returns list of (labels dict, value) pairs.
+    """
+
+    def __init__(self, name, documentation, kind, function, labels=()):
+        super(Callback, self).__init__(name, documentation, labels)
+        self.kind = kind
+        self.function = function
+
+    def samples(self):
+        """
+        Returns samples reported by the function.
+        """
+        return [
+            ('', [(label, labels[label]) for label in self.labels], value)
+            for labels, value in self.function()
+        ]
+
+
+def format_value(value):
+    """
+    Formats sample value or bucket bound.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def escape(value):
+    """
+    Escapes label value.
+    """
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def render():
+    """
+    Returns all registered metrics in Prometheus text format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for suffix, labels, value in metric.samples():
+            if labels:
+                lines.append('%s%s{%s} %s' % (
+                    metric.name, suffix,
+                    ','.join(
+                        '%s="%s"' % (label, escape(label_value))
+                        for label, label_value in labels
+                    ),
+                    format_value(value),
+                ))
+            else:
+                lines.append('%s%s %s' % (
+                    metric.name, suffix, format_value(value)
+                ))
+    return '\n'.join(lines) + '\n'
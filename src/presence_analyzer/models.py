@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Presence data records.
+"""
+from collections import namedtuple
+
+
+class PresenceEntry(namedtuple('PresenceEntry', 'start_seconds end_seconds')):
+    """
+    Presence of a user in a single day.
+
+    Start and end are kept as seconds since midnight. Slotted tuple
+    takes a fraction of memory of a dict with two datetime.time objects.
+    """
+    __slots__ = ()
+
+    @property
+    def interval(self):
+        """
+        Presence time in seconds.
+        """
+        return self.end_seconds - self.start_seconds
+
+
+# per-user statistics precomputed by utils.get_aggregates
+UserAggregates = namedtuple(
+    'UserAggregates',
+    'weekday_totals weekday_means mean_start_end monthly_hours',
+)
+
+# statistics of all users precomputed by utils.get_office_aggregates
+OfficeAggregates = namedtuple(
+    'OfficeAggregates', 'weekday_means headcount arrivals',
+)
+
+# user name and avatar path from users XML file
+UserInfo = namedtuple('UserInfo', 'name avatar')
+
+# server settings and {user_id: UserInfo} of users XML file
+UserDirectory = namedtuple('UserDirectory', 'server users')
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned data plane shared by worker processes.
+
+Loader publishes presence snapshot and user directory of every version
+as files in DATA_PLANE directory and then atomically replaces `current`
+manifest naming them. Workers memory-map files of the current version
+read-only, so all of them share one copy in the page cache, and switch
+to a new version by mapping its files once the manifest changes. Files
+of replaced versions stay readable for workers which still map them.
+"""
+from array import array
+from collections import Mapping
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+from presence_analyzer.files import replace_file
+from presence_analyzer.models import UserDirectory, UserInfo
+from presence_analyzer.snapshot import PresenceSnapshot, csv_source, \
+    matches_source, write_snapshot
+
+MANIFEST = 'current'
+PUBLISH_LOCK = '.publish.lock'
+VERSION_FILE = re.compile(r'^(presence|directory)-(\d+)\.snapshot$')
+
+DIRECTORY_MAGIC = 'PREDIR01'
+# magic, number of users, size of server settings JSON
+DIRECTORY_HEADER = struct.Struct('<8sII')
+ITEM_SIZE = 4
+
+
+def write_file(path, chunks):
+    """
+    Atomically writes chunks of data to file.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix='.plane-'
+    )
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        replace_file(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def write_directory(path, directory):
+    """
+    Writes user directory snapshot.
+
+    Header is followed by sorted int32 user ids, uint32 offsets of their
+    records, server settings JSON and records, each one a JSON list of
+    user name and avatar.
+    """
+    user_ids = array('i', sorted(directory.users))
+    offsets = array('I', [0])
+    records = []
+    for user_id in user_ids:
+        records.append(json.dumps(list(directory.users[user_id])))
+        offsets.append(offsets[-1] + len(records[-1]))
+    server = json.dumps(directory.server)
+    if sys.byteorder != 'little':  # pragma: no cover
+        user_ids.byteswap()
+        offsets.byteswap()
+    write_file(path, [
+        DIRECTORY_HEADER.pack(DIRECTORY_MAGIC, len(user_ids), len(server)),
+        user_ids.tostring(), offsets.tostring(), server, ''.join(records),
+    ])
+
+
+class MappedUsers(Mapping):
+    """
+    Read-only {user_id: UserInfo} mapping of memory-mapped directory.
+
+    Users are found by binary search over mapped ids and their records
+    decoded only when they are looked up.
+    """
+
+    def __init__(self, buf, count, records):
+        self.buffer = buf
+        self.count = count
+        self.records = records
+
+    def user_id(self, index):
+        """
+        Returns user id at given position.
+        """
+        return struct.unpack_from(
+            '<i', self.buffer, DIRECTORY_HEADER.size + index * ITEM_SIZE
+        )[0]
+
+    def offset(self, index):
+        """
+        Returns offset of record at given position.
+        """
+        return struct.unpack_from(
+            '<I', self.buffer,
+            DIRECTORY_HEADER.size + (self.count + index) * ITEM_SIZE,
+        )[0]
+
+    def __getitem__(self, user_id):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.user_id(middle) < user_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self.user_id(low) != user_id:
+            raise KeyError(user_id)
+        begin = self.records + self.offset(low)
+        end = self.records + self.offset(low + 1)
+        return UserInfo(*json.loads(self.buffer[begin:end]))
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self.user_id(index)
+
+    def __len__(self):
+        return self.count
+
+
+def open_directory(path):
+    """
+    Maps user directory snapshot, returns None if it is missing or
+    damaged.
+    """
+    try:
+        with open(path, 'rb') as directory_file:
+            buf = mmap.mmap(
+                directory_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+    except (IOError, OSError, ValueError):
+        return None
+    if len(buf) < DIRECTORY_HEADER.size:
+        return None
+    magic, count, server_size = DIRECTORY_HEADER.unpack_from(buf)
+    server_offset = DIRECTORY_HEADER.size + (2 * count + 1) * ITEM_SIZE
+    records = server_offset + server_size
+    if magic != DIRECTORY_MAGIC or len(buf) < records:
+        return None
+    users = MappedUsers(buf, count, records)
+    if len(buf) != records + users.offset(count):
+        return None
+    try:
+        server = json.loads(buf[server_offset:records])
+    except ValueError:
+        return None
+    return UserDirectory(server, users)
+
+
+class PlaneVersion(object):
+    """
+    Presence snapshot and user directory of one published version.
+    """
+
+    def __init__(self, version, presence, directory):
+        self.version = version
+        self.presence = presence
+        self.directory = directory
+
+
+def read_manifest(plane_path):
+    """
+    Returns manifest of current version, None if nothing is published.
+    """
+    try:
+        with open(os.path.join(plane_path, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+
+
+def attach(plane_path):
+    """
+    Maps files of current version, returns None if there is none.
+    """
+    manifest = read_manifest(plane_path)
+    if manifest is None:
+        return None
+    presence = PresenceSnapshot.open(
+        os.path.join(plane_path, manifest['presence'])
+    )
+    if presence is None:
+        return None
+    directory = None
+    if manifest['directory']:
+        directory = open_directory(
+            os.path.join(plane_path, manifest['directory'])
+        )
+    return PlaneVersion(manifest['version'], presence, directory)
+
+
+def encode_source(source):
+    """
+    Converts (size, mtime, sha1) source to JSON compatible list.
+    """
+    if source is None:
+        return None
+    size, mtime, digest = source
+    return [size, mtime, digest.encode('hex')]
+
+
+def is_unchanged(manifest, key, path):
+    """
+    Checks if file recorded under key of manifest still has the same
+    content. Path of a file which isn't configured is None.
+    """
+    if manifest is None:
+        return False
+    source = manifest[key]
+    if path is None:
+        return source is None
+    if source is None:
+        return not os.path.exists(path)
+    size, mtime, digest = source
+    return matches_source(path, (size, mtime, digest.decode('hex')))
+
+
+def publish(plane_path, csv_path, xml_path, parse_rows, load_directory,
+            keep=3):
+    """
+    Publishes new version of data files unless current one matches them.
+
+    Presence CSV is parsed by `parse_rows` returning sorted rows and
+    source of the file, users XML by `load_directory` returning
+    UserDirectory or None. Versions published without `xml_path` have
+    no user directory. Publishers are serialised with a lock file,
+    so concurrent processes publish each change once. Only `keep`
+    newest versions are kept.
+
+    :return: manifest of current version
+    """
+    if not os.path.isdir(plane_path):
+        os.makedirs(plane_path)
+    with open(os.path.join(plane_path, PUBLISH_LOCK), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = read_manifest(plane_path)
+        csv_unchanged = is_unchanged(manifest, 'csv', csv_path)
+        if csv_unchanged and is_unchanged(manifest, 'xml', xml_path):
+            return manifest
+
+        version = manifest['version'] + 1 if manifest else 1
+        if csv_unchanged:
+            # only users XML changed, presence snapshot is still valid
+            presence = manifest['presence']
+            csv = manifest['csv']
+        else:
+            rows, source = parse_rows(csv_path)
+            presence = 'presence-%d.snapshot' % version
+            write_snapshot(os.path.join(plane_path, presence), rows, source)
+            csv = encode_source(source)
+
+        xml_source = directory = directory_name = None
+        if xml_path is not None:
+            try:
+                with open(xml_path, 'rb') as xml_file:
+                    xml_source = csv_source(xml_file.read(), xml_path)
+            except (IOError, OSError):
+                pass
+            directory = load_directory(xml_path)
+        if directory is not None:
+            directory_name = 'directory-%d.snapshot' % version
+            write_directory(
+                os.path.join(plane_path, directory_name), directory
+            )
+
+        manifest = {
+            'version': version,
+            'presence': presence,
+            'directory': directory_name,
+            'csv': csv,
+            'xml': encode_source(xml_source),
+        }
+        write_file(
+            os.path.join(plane_path, MANIFEST), [json.dumps(manifest)]
+        )
+        prune(plane_path, version - keep, [presence, directory_name])
+        return manifest
+
+
+def prune(plane_path, last, current):
+    """
+    Removes files of versions up to `last`, except `current` ones.
+    """
+    for name in os.listdir(plane_path):
+        match = VERSION_FILE.match(name)
+        if match and int(match.group(2)) <= last and name not in current:
+            os.remove(os.path.join(plane_path, name))
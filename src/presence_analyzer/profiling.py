@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of single requests.
+
+With PROFILE_REQUESTS config key set, make_app() wraps the application
+in RequestProfiler. Requests sent with `X-Profile` header or `profile`
+query argument (equal to PROFILE_TOKEN when it is configured, '1'
+otherwise) run under cProfile. Without PROFILE_REQUESTS the application
+isn't wrapped at all, so other requests pay nothing.
+"""
+import cProfile
+import datetime
+import logging
+import marshal
+import os
+import re
+from urlparse import parse_qs
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# functions whose cumulative time is reported in X-Profile-Timings
+TIMED = (
+    'get_data', 'load_snapshot_data', 'get_user_directory',
+    'load_user_directory', 'get_related_xml_values', 'get_user_photo_url',
+)
+
+
+class RequestProfiler(object):
+    """
+    WSGI middleware profiling requests which ask for it.
+
+    Profile is saved in `directory`, where only `keep` newest profiles
+    are kept, and its name is sent in X-Profile-File header. Without
+    directory the profile replaces the response as an attachment.
+    Either way it can be read with pstats or snakeviz.
+    """
+
+    def __init__(self, wsgi_app, directory=None, keep=20, token=None):
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.keep = keep
+        self.token = token or '1'
+
+    def __call__(self, environ, start_response):
+        if not self.is_requested(environ):
+            return self.wsgi_app(environ, start_response)
+
+        response = {'written': []}
+
+        def capture_start_response(status, headers, exc_info=None):
+            """
+            Captures status and headers of profiled response.
+            """
+            response['status'] = status
+            response['headers'] = headers
+            response['exc_info'] = exc_info
+            return response['written'].append
+
+        profile = cProfile.Profile()
+        body = profile.runcall(
+            self.collect, environ, capture_start_response
+        )
+        body = ''.join(response['written']) + body
+        profile.create_stats()
+        headers = [
+            ('X-Profile-Timings', format_timings(timings(profile.stats))),
+        ]
+        data = marshal.dumps(profile.stats)
+        name = profile_name(environ)
+
+        if self.directory is None:
+            start_response('200 OK', headers + [
+                ('Content-Type', 'application/octet-stream'),
+                ('Content-Disposition', 'attachment; filename="%s"' % name),
+                ('Content-Length', str(len(data))),
+            ])
+            return [data]
+
+        try:
+            self.save(name, data)
+            headers.append(('X-Profile-File', name))
+        except (IOError, OSError) as error:
+            log.error('saving profile %s failed\n%s', name, error)
+        start_response(
+            response['status'], response['headers'] + headers,
+            response['exc_info'],
+        )
+        return [body]
+
+    def is_requested(self, environ):
+        """
+        Checks if request asks for profiling.
+        """
+        if environ.get('HTTP_X_PROFILE') == self.token:
+            return True
+        query = environ.get('QUERY_STRING')
+        if not query or 'profile' not in query:
+            return False
+        return self.token in parse_qs(query).get('profile', ())
+
+    def collect(self, environ, start_response):
+        """
+        Runs application and reads whole response body.
+        """
+        result = self.wsgi_app(environ, start_response)
+        try:
+            return ''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def save(self, name, data):
+        """
+        Writes profile to directory, removing the oldest over the limit.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(os.path.join(self.directory, name), 'wb') as output:
+            output.write(data)
+        profiles = sorted(
+            entry for entry in os.listdir(self.directory)
+            if entry.endswith('.prof')
+        )
+        for entry in profiles[:-self.keep]:
+            os.remove(os.path.join(self.directory, entry))
+
+
+def profile_name(environ):
+    """
+    Returns file name of profile, sortable by time of request.
+    """
+    path = re.sub(r'[^\w-]+', '_', environ.get('PATH_INFO', '')).strip('_')
+    return '%s-%s.prof' % (
+        datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'), path or 'root'
+    )
+
+
+def timings(stats):
+    """
+    Returns cumulative seconds of TIMED functions found in profile stats.
+    """
+    result = {}
+    for (_, _, function), (_, _, _, cumulative, _) in stats.iteritems():
+        if function in TIMED:
+            result[function] = result.get(function, 0) + cumulative
+    return result
+
+
+def format_timings(values):
+    """
+    Formats timings as header value.
+    """
+    return ', '.join(
+        '%s=%.6f' % (function, seconds)
+        for function, seconds in sorted(values.iteritems())
+    )
+
+
+def install(app):
+    """
+    Wraps application in RequestProfiler if PROFILE_REQUESTS is set.
+    """
+    if not app.config.get('PROFILE_REQUESTS'):
+        return
+    app.wsgi_app = RequestProfiler(
+        app.wsgi_app,
+        directory=app.config.get('PROFILE_DIR'),
+        keep=app.config.get('PROFILE_KEEP', 20),
+        token=app.config.get('PROFILE_TOKEN'),
+    )
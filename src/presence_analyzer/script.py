@@ -27,9 +27,12 @@ del _buildout_path
 
 # bin/paster serve parts/etc/deploy.ini
 def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
-    from presence_analyzer import app
+    from presence_analyzer import app, profiling
+    from presence_analyzer.utils import start_background_tasks
     app.config.from_pyfile(abspath(config))
     app.debug = debug
+    profiling.install(app)
+    start_background_tasks()
     return app
 
 
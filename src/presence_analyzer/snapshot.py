@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Binary snapshot of parsed presence data.
+
+Snapshot file starts with a fixed header describing the CSV file it was
+built from, followed by four columns of little-endian int32 values:
+user ids, day ordinals, start and end seconds since midnight, sorted by
+user and day. The file is memory-mapped, so processes reading the same
+snapshot share a single copy in the page cache.
+"""
+from array import array
+from hashlib import sha1
+from itertools import izip
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from presence_analyzer.files import replace_file
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+MAGIC = 'PRESNAP1'
+# magic, number of rows, CSV size, CSV mtime, CSV sha1, padding
+HEADER = struct.Struct('<8sQQd20s12x')
+COLUMNS = 4
+ITEM_SIZE = 4
+
+
+def csv_source(content, path):
+    """
+    Returns (size, mtime, sha1) source description of CSV file content.
+    """
+    return len(content), os.stat(path).st_mtime, sha1(content).digest()
+
+
+def matches_source(csv_path, source):
+    """
+    Checks if CSV file still has content described by (size, mtime,
+    sha1) source.
+
+    Size and modification time are compared first, checksum of the
+    content only when the file was touched without growing.
+    """
+    size, mtime, digest = source
+    try:
+        stat = os.stat(csv_path)
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime == mtime:
+            return True
+        with open(csv_path, 'rb') as csv_file:
+            return sha1(csv_file.read()).digest() == digest
+    except (IOError, OSError):
+        return False
+
+
+def write_snapshot(path, rows, source):
+    """
+    Atomically writes snapshot of sorted (user, day, start, end) rows.
+    """
+    columns = [array('i', column) for column in zip(*rows)]
+    if not columns:
+        columns = [array('i') for _ in xrange(COLUMNS)]
+    if sys.byteorder != 'little':  # pragma: no cover
+        for column in columns:
+            column.byteswap()
+
+    size, mtime, digest = source
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix='.snapshot-'
+    )
+    try:
+        with os.fdopen(descriptor, 'wb') as snapshot_file:
+            snapshot_file.write(
+                HEADER.pack(MAGIC, len(columns[0]), size, mtime, digest)
+            )
+            for column in columns:
+                column.tofile(snapshot_file)
+        replace_file(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class PresenceSnapshot(object):
+    """
+    Memory-mapped snapshot file.
+    """
+
+    def __init__(self, buf, count, size, mtime, digest):
+        self.buffer = buf
+        self.count = count
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+    @classmethod
+    def open(cls, path):
+        """
+        Maps snapshot file, returns None if it is missing or damaged.
+        """
+        try:
+            with open(path, 'rb') as snapshot_file:
+                buf = mmap.mmap(
+                    snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except (IOError, OSError, ValueError):
+            return None
+        if len(buf) < HEADER.size:
+            return None
+        magic, count, size, mtime, digest = HEADER.unpack_from(buf)
+        expected = HEADER.size + COLUMNS * ITEM_SIZE * count
+        if magic != MAGIC or len(buf) != expected:
+            return None
+        return cls(buf, count, size, mtime, digest)
+
+    def is_fresh(self, csv_path):
+        """
+        Checks if snapshot describes current content of CSV file.
+        """
+        return matches_source(csv_path, (self.size, self.mtime, self.digest))
+
+    def offset(self, index):
+        """
+        Returns byte offset of column with given index.
+        """
+        return HEADER.size + index * ITEM_SIZE * self.count
+
+    def column(self, index):
+        """
+        Returns copy of column as int32 array.
+        """
+        column = array('i')
+        column.fromstring(
+            self.buffer[self.offset(index):self.offset(index + 1)]
+        )
+        if sys.byteorder != 'little':  # pragma: no cover
+            column.byteswap()
+        return column
+
+    def arrays(self):
+        """
+        Returns read-only numpy views of all columns, without copying.
+        """
+        return [
+            numpy.frombuffer(
+                self.buffer, numpy.dtype('<i4'), self.count,
+                self.offset(index),
+            )
+            for index in xrange(COLUMNS)
+        ]
+
+    def rows(self):
+        """
+        Iterates over (user, day, start, end) rows.
+        """
+        return izip(*[self.column(index) for index in xrange(COLUMNS)])
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite presence store.
+
+Enabled with PRESENCE_STORE = 'sqlite'. Presence CSV is imported into
+DATA_SQLITE database, clustered on (user_id, day), and aggregations run
+as indexed queries reading a single user's rows. Processes keep only a
+small pool of connections shared by their threads instead of all
+entries.
+"""
+from collections import Mapping
+from contextlib import contextmanager
+import datetime
+import os
+from Queue import Empty, LifoQueue
+import sqlite3
+import tempfile
+
+from presence_analyzer.files import replace_file
+from presence_analyzer.models import PresenceEntry
+
+SCHEMA = """
+CREATE TABLE presence (
+    user_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE source (
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    digest BLOB NOT NULL
+);
+"""
+
+# day ordinal 1 (0001-01-01) is julian day 1721425.5
+JULIAN_OFFSET = 1721424.5
+
+
+def write_database(path, rows, source):
+    """
+    Atomically writes database of (user, day, start, end) rows imported
+    from CSV file described by (size, mtime, sha1) source.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix='.sqlite-'
+    )
+    os.close(descriptor)
+    try:
+        connection = sqlite3.connect(temporary)
+        try:
+            connection.executescript(SCHEMA)
+            connection.executemany(
+                'INSERT OR REPLACE INTO presence VALUES (?, ?, ?, ?)', rows
+            )
+            size, mtime, digest = source
+            connection.execute(
+                'INSERT INTO source VALUES (?, ?, ?)',
+                (size, mtime, buffer(digest)),
+            )
+            connection.commit()
+        finally:
+            connection.close()
+        replace_file(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def read_source(path):
+    """
+    Returns (size, mtime, sha1) source of database, None if it is
+    missing or damaged.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        connection = sqlite3.connect(path)
+        try:
+            row = connection.execute(
+                'SELECT size, mtime, digest FROM source'
+            ).fetchone()
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError:
+        return None
+    if row is None:
+        return None
+    return row[0], row[1], str(row[2])
+
+
+class ConnectionPool(object):
+    """
+    Connections to database shared by threads of a process.
+
+    Connection is taken by one thread at a time and returned when it is
+    done with it; at most `size` idle connections are kept open.
+    """
+
+    def __init__(self, path, size=5):
+        self.path = path
+        self.size = size
+        self.idle = LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends connection for the duration of the block.
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except Empty:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            yield connection
+        finally:
+            if self.idle.qsize() < self.size:
+                self.idle.put(connection)
+            else:
+                connection.close()
+
+    def query(self, sql, parameters=()):
+        """
+        Returns all rows of query.
+        """
+        with self.connection() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+
+class SqliteStore(Mapping):
+    """
+    Presence data kept in SQLite database.
+
+    Behaves like read-only {user_id: entries} mapping, entries are
+    UserRows reading the database when they are used.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def everyone(self):
+        """
+        Returns entries of all users as a single UserRows.
+        """
+        return UserRows(self.pool, None)
+
+    def __getitem__(self, user_id):
+        if user_id not in self:
+            raise KeyError(user_id)
+        return UserRows(self.pool, user_id)
+
+    def __contains__(self, user_id):
+        return bool(self.pool.query(
+            'SELECT 1 FROM presence WHERE user_id = ? LIMIT 1', (user_id,)
+        ))
+
+    def __iter__(self):
+        rows = self.pool.query('SELECT DISTINCT user_id FROM presence')
+        return (user_id for user_id, in rows)
+
+    def __len__(self):
+        return self.pool.query(
+            'SELECT COUNT(DISTINCT user_id) FROM presence'
+        )[0][0]
+
+
+class UserRows(Mapping):
+    """
+    Presence entries of a single user, or all of them when `user_id` is
+    None, optionally limited to days from `first` to `last` ordinal.
+
+    Behaves like read-only {date: entry} mapping, but aggregation
+    helpers from utils use its SQL reductions instead.
+    """
+
+    def __init__(self, pool, user_id, first=None, last=None):
+        self.pool = pool
+        self.user_id = user_id
+        self.first = first
+        self.last = last
+
+    def select(self, columns, suffix=''):
+        """
+        Returns rows of columns of selected entries.
+        """
+        conditions = []
+        parameters = []
+        for condition, value in [
+                ('user_id = ?', self.user_id),
+                ('day >= ?', self.first),
+                ('day <= ?', self.last),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        sql = 'SELECT %s FROM presence' % columns
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return self.pool.query(sql + suffix, parameters)
+
+    def group_by_weekday(self):
+        """
+        Groups presence intervals by weekday.
+        """
+        result = [[] for _ in xrange(7)]
+        for weekday, interval in self.select(
+                '(day + 6) % 7, end - start', ' ORDER BY day'):
+            result[weekday].append(interval)
+        return result
+
+    def weekday_totals(self):
+        """
+        Returns number of entries and total presence time per weekday.
+        """
+        counts = [0] * 7
+        totals = [0] * 7
+        for weekday, count, total in self.select(
+                '(day + 6) % 7, COUNT(*), SUM(end - start)',
+                ' GROUP BY 1'):
+            counts[weekday] = count
+            totals[weekday] = total
+        return counts, totals
+
+    def mean_start_end_time(self):
+        """
+        Returns (mean start, mean end) tuple for every weekday.
+        """
+        result = [(0, 0)] * 7
+        for weekday, start, end in self.select(
+                '(day + 6) % 7, AVG(start), AVG(end)', ' GROUP BY 1'):
+            result[weekday] = (start, end)
+        return result
+
+    def month_totals(self):
+        """
+        Returns {year: {month: [total presence seconds]}} dictionary.
+        """
+        years = {}
+        for year, month, total in self.select(
+                "CAST(strftime('%%Y', day + %s) AS INTEGER), "
+                "CAST(strftime('%%m', day + %s) AS INTEGER), "
+                "SUM(end - start)" % (JULIAN_OFFSET, JULIAN_OFFSET),
+                ' GROUP BY 1, 2'):
+            years.setdefault(year, {})[month] = [total]
+        return years
+
+    def day_counts(self):
+        """
+        Returns (date, number of entries) pairs of all days with entries.
+        """
+        return [
+            (datetime.date.fromordinal(day), count)
+            for day, count in self.select(
+                'day, COUNT(*)', ' GROUP BY day ORDER BY day'
+            )
+        ]
+
+    def start_counts(self, bucket):
+        """
+        Returns (bucket start, number of entries) pairs of start times
+        grouped into `bucket` seconds long periods.
+        """
+        return [
+            (index * bucket, count)
+            for index, count in self.select(
+                'start / %d, COUNT(*)' % bucket, ' GROUP BY 1 ORDER BY 1'
+            )
+        ]
+
+    def between(self, start=None, end=None):
+        """
+        Returns entries of days from start to end, both inclusive.
+        """
+        first = self.first
+        last = self.last
+        if start is not None and (first is None or start.toordinal() > first):
+            first = start.toordinal()
+        if end is not None and (last is None or end.toordinal() < last):
+            last = end.toordinal()
+        return UserRows(self.pool, self.user_id, first, last)
+
+    def __getitem__(self, date):
+        day = date.toordinal()
+        if self.first is not None and day < self.first or \
+                self.last is not None and day > self.last:
+            raise KeyError(date)
+        rows = self.pool.query(
+            'SELECT start, end FROM presence WHERE user_id = ? AND day = ?',
+            (self.user_id, day),
+        )
+        if not rows:
+            raise KeyError(date)
+        return PresenceEntry(*rows[0])
+
+    def __iter__(self):
+        for day, in self.select('day', ' ORDER BY day'):
+            yield datetime.date.fromordinal(day)
+
+    def __len__(self):
+        return self.select('COUNT(*)')[0][0]
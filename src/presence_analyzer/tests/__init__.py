@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Presence analyzer unit tests.
+"""
+import unittest
+
+from presence_analyzer.tests import test_benchmarks, test_caching, \
+    test_columnar, test_files, test_loader, test_metrics, test_plane, \
+    test_profiling, test_snapshot, test_sqlstore, test_utils, test_views
+
+MODULES = (
+    test_views,
+    test_profiling,
+    test_utils,
+    test_caching,
+    test_loader,
+    test_files,
+    test_benchmarks,
+    test_columnar,
+    test_sqlstore,
+    test_snapshot,
+    test_plane,
+    test_metrics,
+)
+
+
+def suite():
+    """
+    Default test suite.
+    """
+    base_suite = unittest.TestSuite()
+    for module in MODULES:
+        base_suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromModule(module)
+        )
+    return base_suite
+
+
+def load_tests(loader, tests, pattern):  # pylint: disable=unused-argument
+    """
+    Runs default test suite when package is loaded by unittest.
+    """
+    return suite()
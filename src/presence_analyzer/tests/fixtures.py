@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Test data files and stand-in intranet server shared by tests.
+"""
+import BaseHTTPServer
+import os
+import SocketServer
+import threading
+
+from requests import ConnectionError
+
+from presence_analyzer import utils
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data'
+)
+
+TEST_DATA_CSV = os.path.join(DATA_DIR, 'test_data.csv')
+
+SAMPLE_DATA_CSV = os.path.join(DATA_DIR, 'sample_data.csv')
+
+TEST_DATA_XML = os.path.join(DATA_DIR, 'test_data.xml')
+
+XML_URL = "http://sargo.bolt.stxnext.pl/users.xml"
+
+
+class MockResponse(object):
+    """
+    Mock class for response objects.
+    """
+
+    def __init__(self, content, status_code):
+        self.content = content
+        self.status_code = status_code
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves test users XML file the way intranet does.
+    """
+    protocol_version = 'HTTP/1.1'
+    etag = '"users-1"'
+    last_modified = 'Thu, 10 Oct 2013 08:00:00 GMT'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Sends XML file unless client already has it.
+        """
+        self.server.requests.append(
+            (self.command, self.client_address, dict(self.headers))
+        )
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        with open(TEST_DATA_XML, 'r') as xml_file:
+            body = xml_file.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Last-Modified', self.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """
+        Keeps test output clean.
+        """
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP server standing in for intranet in tests.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), StandInHandler
+        )
+        self.requests = []
+        self.url = 'http://127.0.0.1:%d/users.xml' % self.server_port
+
+    def start(self, test_case):
+        """
+        Serves requests in background until the end of test case.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        test_case.addCleanup(self.server_close)
+        test_case.addCleanup(self.shutdown)
+        test_case.addCleanup(utils.http_session.close)
+        return self
+
+
+def mocked_cache(url):
+    """
+    Mock caching decorator
+    """
+    if url == 'wrong_url_path':
+        raise ConnectionError
+    with open(TEST_DATA_XML, 'r') as xml_file:
+        response = MockResponse(xml_file.read(), 200)
+    return response
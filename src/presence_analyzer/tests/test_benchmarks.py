@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite tests.
+"""
+import unittest
+
+from presence_analyzer.benchmarks import suite as benchmark_suite
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerBenchmarksTestCase(unittest.TestCase):
+    """
+    Benchmark suite tests.
+    """
+
+    def test_benchmark_baseline_comparison(self):
+        """
+        Test reporting benchmark cases worse than baseline over tolerance.
+        """
+        baseline = {
+            'get_data': {'seconds': 1.0, 'allocations': 100},
+            'aggregate_user': {'seconds': 0.5, 'allocations': 10},
+            'removed': {'seconds': 0.1, 'allocations': 1},
+        }
+        results = {
+            'get_data': {'seconds': 1.2, 'allocations': 200},
+            'aggregate_user': {'seconds': 0.7, 'allocations': 10},
+            'added': {'seconds': 9.0, 'allocations': 900},
+        }
+        self.assertEqual(
+            benchmark_suite.compare(results, baseline, 0.25),
+            [
+                ('aggregate_user', 'seconds', 0.5, 0.7),
+                ('get_data', 'allocations', 100, 200),
+            ],
+        )
+        self.assertEqual(benchmark_suite.compare(results, baseline, 1), [])
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Cache tests.
+"""
+import functools
+import os
+import datetime
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from presence_analyzer import caching, main, models, utils
+from presence_analyzer.caching import cache_data
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, SAMPLE_DATA_CSV, \
+    TEST_DATA_XML, XML_URL
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerCachingTestCase(unittest.TestCase):
+    """
+    Cache tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'XML_URL': XML_URL})
+        main.app.config.update({'CACHE_DATA': False})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+
+    def test_user_entries_updated(self):
+        """
+        Test merging new entries into sorted date index.
+        """
+        september = functools.partial(datetime.date, 2013, 9)
+        entry = models.PresenceEntry(32400, 63000)
+        items = caching.UserEntries(
+            {september(10): entry, september(5): entry}
+        )
+        updated = items.updated({september(12): entry, september(11): entry})
+        self.assertEqual(updated.dates, tuple(sorted(updated)))
+        self.assertEqual(len(items), 2)
+        updated = items.updated({september(1): entry, september(7): entry})
+        self.assertEqual(updated.dates, tuple(sorted(updated)))
+        replaced = models.PresenceEntry(0, 1)
+        updated = items.updated({september(5): replaced})
+        self.assertIs(updated.dates, items.dates)
+        self.assertEqual(updated[september(5)], replaced)
+        self.assertIsInstance(updated, caching.UserEntries)
+        with self.assertRaises(TypeError):
+            updated[september(6)] = entry
+
+    def test_cache_data_decorator(self):
+        """
+        Test cache data decorator.
+        """
+
+        @cache_data(seconds=10)
+        def empty_function():
+            """ Empty function """
+            return []
+
+        empty_function().append('test')
+        self.assertListEqual(empty_function(), [])
+
+        main.app.config.update({'CACHE_DATA': 'True'})
+
+        @cache_data(1)
+        def add_function(beta, gamma=10):
+            """ Simple function prepared for test caching """
+            add_function.alfa += 1
+            return add_function.alfa + beta + gamma
+
+        add_function.alfa = 0
+
+        self.assertEqual(add_function(-1), 10)
+        self.assertEqual(add_function(-1), add_function(-1))
+        self.assertEqual(add_function(-1), add_function(-1))
+
+    def test_cache_data_arguments(self):
+        """
+        Test caching results per arguments with counters.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        calls = []
+
+        @cache_data(60)
+        def add_function(beta, gamma=10):
+            """ Function counting its calls """
+            calls.append((beta, gamma))
+            return [beta + gamma]
+
+        self.assertEqual(add_function(1), (11,))
+        # keyword and positional arguments are different keys
+        self.assertEqual(add_function(1, gamma=10), (11,))
+        self.assertEqual(add_function(2), (12,))
+        self.assertIs(add_function(2), add_function(2))
+        self.assertEqual(add_function(1, gamma=5), (6,))
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(
+            add_function.stats(),
+            {'hits': 2, 'misses': 4, 'evictions': 0, 'entries': 4,
+             'bytes': 0},
+        )
+        self.assertEqual(add_function.generation(1, gamma=5), 4)
+        self.assertIsNone(add_function.generation(3))
+
+        hook = mock.Mock()
+        add_function.on_invalidate(hook)
+        add_function.invalidate(2)
+        hook.assert_called_once_with(2)
+        self.assertIsNone(add_function.generation(2))
+        self.assertEqual(add_function.stats()['entries'], 3)
+        add_function(2)
+        self.assertEqual(len(calls), 5)
+        add_function.invalidate()
+        self.assertEqual(add_function.stats()['entries'], 0)
+
+        self.assertEqual(add_function([1], []), [[1]])
+        self.assertEqual(add_function([1], []), [[1]])
+        self.assertEqual(len(calls), 7)
+
+    def test_cache_data_lru(self):
+        """
+        Test evicting least recently used results over the limits.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+
+        @cache_data(60, max_entries=2)
+        def square(value):
+            """ Function cached for two arguments at most """
+            return value * value
+
+        square(1)
+        square(2)
+        square(1)
+        square(3)
+        self.assertIsNotNone(square.generation(1))
+        self.assertIsNone(square.generation(2))
+        self.assertIsNotNone(square.generation(3))
+        self.assertEqual(square.stats()['evictions'], 1)
+
+        @cache_data(60, max_bytes=caching.sizeof(range(100)) * 2)
+        def numbers(length):
+            """ Function cached up to size of two 100 items lists """
+            return range(length)
+
+        numbers(100)
+        numbers(100)
+        self.assertEqual(
+            numbers.stats()['bytes'], caching.sizeof(tuple(range(100)))
+        )
+        numbers(50)
+        numbers(100)
+        numbers(150)
+        stats = numbers.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertIsNotNone(numbers.generation(150))
+
+    def test_cache_data_source(self):
+        """
+        Test results derived from cached source follow its snapshots.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        self.addCleanup(utils.get_data.invalidate)
+        utils.get_data.invalidate()
+        start = datetime.date(2013, 9, 10)
+        end = datetime.date(2013, 9, 11)
+        aggregates = utils.get_range_aggregates(11, start, end)
+        self.assertEqual(
+            aggregates,
+            utils.aggregate_user(
+                utils.select_dates(utils.get_data()[11], start, end)
+            ),
+        )
+        self.assertIs(utils.get_range_aggregates(11, start, end), aggregates)
+        self.assertIsNone(utils.get_range_aggregates(100, start, end))
+        utils.get_data.invalidate()
+        self.assertIsNone(
+            utils.get_range_aggregates.generation(11, start, end)
+        )
+
+        main.app.config.update({'DATA_CSV': SAMPLE_DATA_CSV})
+        utils.get_data()
+        with mock.patch.object(utils.get_data, 'generation',
+                               return_value=-1):
+            self.assertIsNot(
+                utils.get_range_aggregates(11, start, end), aggregates
+            )
+
+    def test_cache_data_shares_snapshot(self):
+        """
+        Test cache hits return the same read-only snapshot.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_data.invalidate()
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        self.assertIsInstance(data, caching.FrozenDict)
+        self.assertIsInstance(data[10], caching.FrozenDict)
+        with self.assertRaises(TypeError):
+            data[10] = {}
+        utils.get_data.invalidate()
+        self.assertEqual(utils.get_data(), data)
+
+    def test_cache_data_stale_while_revalidate(self):
+        """
+        Test serving stale snapshot while it is refreshed in background.
+        """
+        main.app.config.update({
+            'CACHE_DATA': True,
+            'CACHE_STALE_WHILE_REVALIDATE': 60,
+        })
+        release = threading.Event()
+        calls = []
+
+        @cache_data(10)
+        def slow_function():
+            """ Function blocking on every call but the first one """
+            if calls:
+                release.wait()
+            calls.append(len(calls))
+            return len(calls)
+
+        with mock.patch('presence_analyzer.caching.time.time') as mock_time:
+            mock_time.return_value = 1000
+            self.assertEqual(slow_function(), 1)
+            mock_time.return_value = 1020
+            self.assertEqual(slow_function(), 1)
+            self.assertEqual(slow_function(), 1)
+            release.set()
+            slow_function.wait()
+            self.assertEqual(slow_function(), 2)
+            self.assertEqual(len(calls), 2)
+            mock_time.return_value = 1200
+            self.assertEqual(slow_function(), 3)
+
+    def test_cache_data_key_locks(self):
+        """
+        Test calculations of different keys don't wait for each other.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        release = threading.Event()
+        started = threading.Event()
+
+        @cache_data(60)
+        def blocking(value):
+            """ Function blocking for the first argument """
+            if value == 1:
+                started.set()
+                release.wait()
+            return value
+
+        worker = threading.Thread(target=blocking, args=(1,))
+        worker.start()
+        started.wait()
+        self.assertEqual(blocking(2), 2)
+        release.set()
+        worker.join()
+        self.assertEqual(blocking.stats()['misses'], 2)
+
+    def test_cache_data_generation(self):
+        """
+        Test generation of the newest snapshot regardless of LRU order.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        source = {'generation': 1}
+
+        def data_source():
+            """ Stand-in for cached source function """
+            return source['generation']
+
+        data_source.generation = lambda: source['generation']
+
+        @cache_data(60, source=data_source)
+        def derived():
+            """ Function derived from source """
+            return source['generation']
+
+        derived()
+        source['generation'] = 2
+        derived()
+        source['generation'] = 1
+        derived()
+        self.assertEqual(derived.generation(), 2)
+        derived.invalidate()
+        self.assertIsNone(derived.generation())
+
+    def test_cache_data_watch_mode(self):
+        """
+        Test cache invalidated by change of watched file only.
+        """
+        main.app.config.update({
+            'CACHE_DATA': True,
+            'CACHE_INVALIDATION': 'watch',
+        })
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        main.app.config.update({'WATCHED_FILE': path})
+        calls = []
+
+        @cache_data(0, watch='WATCHED_FILE')
+        def read_function():
+            """ Function reading watched file """
+            calls.append(1)
+            with open(path) as watched_file:
+                return watched_file.read()
+
+        try:
+            self.assertEqual(read_function(), '')
+            self.assertEqual(read_function(), '')
+            self.assertEqual(len(calls), 1)
+            with open(path, 'w') as watched_file:
+                watched_file.write('changed')
+            self.assertEqual(read_function(), 'changed')
+            self.assertEqual(len(calls), 2)
+            main.app.config.update({'CACHE_INVALIDATION': 'ttl'})
+            read_function()
+            self.assertEqual(len(calls), 3)
+        finally:
+            os.remove(path)
+
+    def test_sizeof(self):
+        """
+        Test approximating memory taken by nested containers.
+        """
+        item = 'x' * 100
+        self.assertGreater(caching.sizeof([item]), caching.sizeof(item))
+        self.assertEqual(caching.sizeof([item, item]),
+                         caching.sizeof([None, None]) + caching.sizeof(item) -
+                         caching.sizeof(None))
+        self.assertGreater(caching.sizeof({1: item}), caching.sizeof(item))
+
+    def test_file_signature(self):
+        """
+        Test file signature reflects file changes.
+        """
+        signature = caching.file_signature(TEST_DATA_CSV)
+        self.assertEqual(len(signature), 3)
+        self.assertEqual(signature, caching.file_signature(TEST_DATA_CSV))
+        self.assertIsNone(caching.file_signature('/non/existing/file.csv'))
+
+    def test_freeze(self):
+        """
+        Test converting nested containers to immutable ones.
+        """
+        frozen = caching.freeze({1: [{'a': set([2])}], 2: 'value'})
+        self.assertEqual(frozen, {1: ({'a': frozenset([2])},), 2: 'value'})
+        self.assertIsInstance(frozen[1], tuple)
+        self.assertIsInstance(frozen[1][0], caching.FrozenDict)
+        self.assertIs(caching.freeze(frozen), frozen)
+        for method in ('clear', 'popitem'):
+            self.assertRaises(TypeError, getattr(frozen, method))
+        self.assertRaises(TypeError, frozen.update, {3: 4})
+        self.assertRaises(TypeError, frozen.setdefault, 3)
+        self.assertRaises(TypeError, frozen.pop, 1)
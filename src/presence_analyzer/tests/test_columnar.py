@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar presence store tests.
+"""
+import json
+import datetime
+import unittest
+
+from presence_analyzer import columnar, main, utils
+from presence_analyzer.tests.fixtures import SAMPLE_DATA_CSV, TEST_DATA_XML
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+@unittest.skipIf(columnar.numpy is None, 'numpy is not installed')
+class PresenceAnalyzerColumnarTestCase(unittest.TestCase):
+    """
+    Columnar presence store tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': SAMPLE_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'CACHE_DATA': False})
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+        utils.get_data.invalidate()
+
+    def test_get_data_columnar_store(self):
+        """
+        Test building columnar store from CSV file.
+        """
+        data = utils.get_data()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        store = utils.get_data()
+        self.assertIsInstance(store, columnar.ColumnarStore)
+        self.assertItemsEqual(store.keys(), data.keys())
+        self.assertIn(10, store)
+        self.assertNotIn(100, store)
+        user = store[10]
+        self.assertEqual(len(user), len(data[10]))
+        self.assertItemsEqual(list(user), data[10].keys())
+        date = datetime.date(2013, 9, 10)
+        self.assertEqual(user[date], data[10][date])
+        self.assertRaises(
+            KeyError, user.__getitem__, datetime.date(1999, 1, 1)
+        )
+        self.assertRaises(ValueError, store.starts.__setitem__, 0, 1)
+
+    def test_columnar_helpers(self):
+        """
+        Test vectorised helpers give the same results as dict based ones.
+        """
+        data = utils.get_data()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        store = utils.get_data()
+        for user_id in data:
+            self.assertEqual(
+                map(sorted, utils.group_by_weekday(store[user_id])),
+                map(sorted, utils.group_by_weekday(data[user_id])),
+            )
+            self.assertEqual(
+                utils.get_mean_start_end_time(store[user_id]),
+                utils.get_mean_start_end_time(data[user_id]),
+            )
+            self.assertEqual(
+                utils.get_monthly_worked_hours(store[user_id]),
+                utils.get_monthly_worked_hours(data[user_id]),
+            )
+
+    def test_columnar_range(self):
+        """
+        Test selecting range of days from columnar store.
+        """
+        data = utils.get_data()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        store = utils.get_data()
+        start = datetime.date(2013, 5, 1)
+        end = datetime.date(2013, 7, 31)
+        for user_id in data:
+            selected = utils.select_dates(store[user_id], start, end)
+            self.assertIsInstance(selected, columnar.UserColumns)
+            self.assertEqual(
+                dict(selected.iteritems()),
+                utils.select_dates(data[user_id], start, end),
+            )
+            self.assertEqual(
+                utils.get_monthly_worked_hours(store[user_id], start, end),
+                utils.get_monthly_worked_hours(data[user_id], start, end),
+            )
+
+    def test_columnar_office(self):
+        """
+        Test vectorised office statistics match dict based ones.
+        """
+        data = utils.get_data()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        store = utils.get_data()
+        self.assertEqual(
+            utils.aggregate_office(store), utils.aggregate_office(data)
+        )
+
+    def test_columnar_views(self):
+        """
+        Test views return the same JSON with columnar store.
+        """
+        urls = [
+            '/api/v1/mean_time_weekday/%d',
+            '/api/v1/presence_weekday/%d',
+            '/api/v1/presence_start_end/%d',
+            '/api/v1/monthly_worked_hours/%d',
+        ]
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_data.invalidate()
+        user_ids = utils.get_data().keys()
+
+        def get_all():
+            """ Returns bodies of all views, checking they succeeded """
+            bodies = []
+            for url in urls:
+                for user_id in user_ids:
+                    response = self.client.get(url % user_id)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue(json.loads(response.data))
+                    bodies.append(response.data)
+            return bodies
+
+        expected = get_all()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        utils.get_data.invalidate()
+        self.assertIsInstance(utils.get_data(), columnar.ColumnarStore)
+        self.assertEqual(get_all(), expected)
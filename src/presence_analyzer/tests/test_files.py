@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Data file helpers tests.
+"""
+import os
+from stat import S_IMODE
+import shutil
+import tempfile
+import unittest
+
+from presence_analyzer import files
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerFilesTestCase(unittest.TestCase):
+    """
+    Data file helpers tests.
+    """
+
+    def test_replace_file_keeps_mode(self):
+        """
+        Test replaced data file keeps its mode, new one is world readable.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'data')
+        for mode in (0644, 0640):
+            handle, temporary = tempfile.mkstemp(dir=directory)
+            os.close(handle)
+            files.replace_file(temporary, path)
+            self.assertEqual(S_IMODE(os.stat(path).st_mode), mode)
+            os.chmod(path, 0640)
+        self.assertEqual(os.listdir(directory), ['data'])
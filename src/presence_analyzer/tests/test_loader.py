@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Presence CSV loader tests.
+"""
+import os
+import multiprocessing
+import datetime
+import tempfile
+import unittest
+
+import mock
+
+from presence_analyzer import main, models, utils
+from presence_analyzer import loader as loader_module
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, SAMPLE_DATA_CSV, \
+    TEST_DATA_XML, XML_URL
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerLoaderTestCase(unittest.TestCase):
+    """
+    Presence CSV loader tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'XML_URL': XML_URL})
+        main.app.config.update({'CACHE_DATA': False})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+
+    @mock.patch('csv.reader')
+    def test_get_data_corrupted_date(self, csv_reader):
+        """
+        Test if method log problem for corrupted date
+        """
+        csv_reader.return_value = [
+            ['11', 'wrong_value', '13:16:56', '13:16:56']]
+        self.assertEqual(utils.get_data(), {})
+
+    @mock.patch('csv.reader')
+    def test_get_data_corrupted_time(self, csv_reader):
+        """
+        Test if method log problem for corrupted time
+        """
+        csv_reader.return_value = [
+            ['11', '2013-09-13', '13:16:56', 'wrong_value']]
+        self.assertEqual(utils.get_data(), {})
+
+    @mock.patch('csv.reader')
+    def test_get_data_corrupted_id_as_string(self, csv_reader):
+        """
+        Test if method log problem for corrupted id
+        """
+        csv_reader.return_value = [
+            ['wrong', '2013-09-13', '13:16:56', '13:16:56']]
+        data = utils.get_data
+        self.assertEqual(data(), {})
+
+    @mock.patch('csv.reader')
+    def test_get_data_corrupted_id_as_list(self, csv_reader):
+        """
+        Test if method log problem for corrupted id
+        """
+        csv_reader.return_value = [
+            [[1, 2], '2013-09-13', '13:16:56', '13:16:56']]
+        self.assertEqual(utils.get_data(), {})
+
+    def test_parse_date(self):
+        """
+        Test parsing and memoising dates.
+        """
+        date = loader_module.parse_date('2013-09-10')
+        self.assertEqual(date, datetime.date(2013, 9, 10))
+        self.assertIs(loader_module.parse_date('2013-09-10'), date)
+        self.assertEqual(
+            loader_module.parse_date('2013-9-1'), datetime.date(2013, 9, 1)
+        )
+        self.assertRaises(ValueError, loader_module.parse_date, '2013-02-30')
+        self.assertRaises(ValueError, loader_module.parse_date, '2013-0a-10')
+        self.assertRaises(TypeError, loader_module.parse_date, ['2013-09-10'])
+
+    def test_parse_time(self):
+        """
+        Test parsing and memoising times.
+        """
+        self.assertEqual(loader_module.parse_time('09:39:05'), 34745)
+        self.assertEqual(loader_module.parse_time('9:39:5'), 34745)
+        self.assertEqual(loader_module.parse_time('23:59:59'), 86399)
+        self.assertRaises(ValueError, loader_module.parse_time, '24:00:00')
+        self.assertRaises(ValueError, loader_module.parse_time, '10:60:00')
+        self.assertRaises(ValueError, loader_module.parse_time, '09:39:5x')
+
+    def test_csv_loader_reads_appended_rows(self):
+        """
+        Test incremental loading of rows appended to CSV file.
+        """
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        loader = loader_module.PresenceCsvLoader(incremental=True)
+        try:
+            with open(path, 'w') as csv_file:
+                csv_file.write('10,2013-09-10,09:39:05,17:59:52\n11,2013-09')
+            data = loader.load(path)
+            self.assertItemsEqual(data.keys(), [10])
+            offset = loader.offset
+            with open(path, 'a') as csv_file:
+                csv_file.write('-05,09:28:08,15:51:27\n'
+                               '10,2013-09-11,09:19:52,16:07:37\n')
+            with mock.patch.object(loader, 'merge',
+                                   wraps=loader.merge) as merge:
+                new_data = loader.load(path)
+            updates = merge.call_args[0][0]
+            self.assertItemsEqual(updates.keys(), [10, 11])
+            self.assertEqual(len(updates[10]), 1)
+            self.assertGreater(loader.offset, offset)
+            self.assertItemsEqual(new_data.keys(), [10, 11])
+            self.assertEqual(len(new_data[10]), 2)
+            self.assertIs(loader.load(path), new_data)
+
+            with open(path, 'a') as csv_file:
+                csv_file.write('10,2013-09-12,09:00:00,17:30:0')
+            counters = (loader.parsed, loader.skipped)
+            data = loader.load(path)
+            self.assertNotIn(datetime.date(2013, 9, 12), data[10])
+            self.assertEqual((loader.parsed, loader.skipped), counters)
+            with open(path, 'a') as csv_file:
+                csv_file.write('5\n')
+            data = loader.load(path)
+            self.assertEqual(
+                data[10][datetime.date(2013, 9, 12)],
+                models.PresenceEntry(32400, 63005),
+            )
+            # snapshot handed out before stays as it was
+            self.assertIsNot(data, new_data)
+            self.assertNotIn(datetime.date(2013, 9, 12), new_data[10])
+            self.assertIs(data[11], new_data[11])
+            self.assertEqual(
+                (loader.parsed, loader.skipped),
+                (counters[0] + 1, counters[1]),
+            )
+        finally:
+            os.remove(path)
+
+    def test_csv_loader_reloads_truncated_file(self):
+        """
+        Test reading rotated or truncated CSV file from scratch.
+        """
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        loader = loader_module.PresenceCsvLoader()
+        try:
+            with open(path, 'w') as csv_file:
+                csv_file.write('10,2013-09-10,09:39:05,17:59:52\n'
+                               '10,2013-09-11,09:19:52,16:07:37\n')
+            self.assertEqual(len(loader.load(path)[10]), 2)
+            with open(path, 'w') as csv_file:
+                csv_file.write('11,2013-09-10,09:39:05,17:59:52\n')
+            self.assertItemsEqual(loader.load(path).keys(), [11])
+            with open(path, 'w') as csv_file:
+                csv_file.write('12,2013-09-10,09:39:05,17:59:52\n'
+                               '12,2013-09-11,09:19:52,16:07:37\n')
+            self.assertItemsEqual(loader.load(path).keys(), [12])
+        finally:
+            os.remove(path)
+
+    def test_csv_loader_parallel(self):
+        """
+        Test parsing CSV file in a pool of processes.
+        """
+        loader_module.close_parse_pools()
+        self.addCleanup(loader_module.close_parse_pools)
+        expected = loader_module.PresenceCsvLoader().load(SAMPLE_DATA_CSV)
+        with mock.patch('multiprocessing.Pool',
+                        wraps=multiprocessing.Pool) as mock_pool:
+            for workers in (2, 3, 8, 2):
+                loader = loader_module.PresenceCsvLoader()
+                self.assertEqual(
+                    loader.load(SAMPLE_DATA_CSV, workers), expected
+                )
+                self.assertEqual(
+                    loader.offset, os.path.getsize(SAMPLE_DATA_CSV)
+                )
+            self.assertEqual(
+                mock_pool.call_args_list,
+                [mock.call(2), mock.call(3), mock.call(8)],
+            )
+
+        main.app.config.update({'CSV_WORKERS': 2})
+        with mock.patch('presence_analyzer.loader.parse_pool',
+                        wraps=loader_module.parse_pool) as mock_parse_pool:
+            self.assertEqual(utils.get_data(), utils.get_data())
+            mock_parse_pool.assert_called_with(2)
+
+    @mock.patch('presence_analyzer.loader.log')
+    def test_csv_loader_parallel_lines(self, mock_log):
+        """
+        Test line numbers of chunks and user ids too big for int32.
+        """
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as csv_file:
+            csv_file.write('10,2013-09-10,09:00:00,17:00:00\n' * 20)
+            csv_file.write('10,2013-09-31,09:00:00,17:00:00\n'
+                           '3000000000,2013-09-10,09:00:00,17:00:00\n')
+        expected = loader_module.PresenceCsvLoader().load(path)
+        self.assertEqual(mock_log.debug.call_args[0][1], 20)
+        mock_log.reset_mock()
+
+        # chunks parsed in this process, so the logger mock sees them
+        with mock.patch('presence_analyzer.loader.parse_pool') as mock_pool:
+            mock_pool.return_value.map = map
+            self.assertEqual(loader_module.PresenceCsvLoader().load(path, 4),
+                             expected)
+        self.assertEqual(mock_log.debug.call_args[0][1], 20)
+        self.assertEqual(
+            expected[3000000000][datetime.date(2013, 9, 10)],
+            models.PresenceEntry(32400, 61200),
+        )
+
+    def test_csv_loader_without_trailing_newline(self):
+        """
+        Test last line without line break is parsed by full reads.
+        """
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as csv_file:
+            csv_file.write('10,2013-09-10,09:00:00,17:00:00\n' * 20)
+            csv_file.write('11,2013-09-10,09:00:00,17:00:00')
+        main.app.config.update({'DATA_CSV': path})
+        self.assertItemsEqual(utils.get_data().keys(), [10, 11])
+        for workers in (1, 4):
+            data = loader_module.PresenceCsvLoader().load(path, workers)
+            self.assertItemsEqual(data.keys(), [10, 11])
+        rows, _ = loader_module.parse_presence_rows(path)
+        self.assertEqual(len(list(rows)), 2)
+
+        with mock.patch('presence_analyzer.loader.CSV_BLOCK_SIZE', 7):
+            self.assertEqual(loader_module.PresenceCsvLoader().load(path),
+                             data)
+            loader = loader_module.PresenceCsvLoader(incremental=True)
+            self.assertItemsEqual(loader.load(path).keys(), [10])
+            self.assertEqual(loader.lines, 20)
+            with open(path, 'a') as csv_file:
+                csv_file.write('\n')
+            self.assertItemsEqual(loader.load(path).keys(), [10, 11])
+
+    def test_csv_loader_parallel_merge_order(self):
+        """
+        Test later duplicates win and appended rows are read afterwards.
+        """
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as csv_file:
+            csv_file.write('10,2013-09-10,09:00:00,17:00:00\n' * 20)
+            csv_file.write('10,2013-09-10,10:00:00,18:00:00\n'
+                           '11,2013-09')
+        loader = loader_module.PresenceCsvLoader(incremental=True)
+        data = loader.load(path, 4)
+        self.assertEqual(
+            data[10][datetime.date(2013, 9, 10)],
+            models.PresenceEntry(36000, 64800),
+        )
+        self.assertItemsEqual(data.keys(), [10])
+        self.assertEqual(loader.lines, 21)
+
+        with open(path, 'a') as csv_file:
+            csv_file.write('-05,09:28:08,15:51:27\n')
+        data = loader.load(path, 4)
+        self.assertItemsEqual(data.keys(), [10, 11])
+        self.assertEqual(loader.offset, os.path.getsize(path))
+
+        loader = loader_module.PresenceCsvLoader()
+        with open(path, 'w') as csv_file:
+            csv_file.write('10,2013-09-10,09:00:00,17:00:00\n')
+        self.assertEqual(len(loader.load(path, 8)), 1)
+        with open(path, 'w'):
+            pass
+        self.assertEqual(loader_module.PresenceCsvLoader().load(path, 8), {})
+
+    def test_seconds_since_midnight(self):
+        """
+        Test calculating seconds from midnight.
+        """
+        test_time = datetime.time(hour=8, minute=10, second=9)
+        seconds = loader_module.seconds_since_midnight(test_time)
+        self.assertIsInstance(seconds, int)
+        self.assertEqual(seconds, 29409)
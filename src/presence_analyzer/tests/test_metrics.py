@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics tests.
+"""
+import unittest
+
+from presence_analyzer import metrics
+from presence_analyzer import loader as loader_module
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerMetricsTestCase(unittest.TestCase):
+    """
+    Prometheus metrics tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.registry = metrics.REGISTRY[:]
+        del metrics.REGISTRY[:]
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        metrics.REGISTRY[:] = self.registry
+
+    def test_counter_and_gauge(self):
+        """
+        Test rendering counters and gauges with and without labels.
+        """
+        counter = metrics.Counter('rows_total', 'Rows.', ['result'])
+        counter.inc(result='parsed')
+        counter.inc(2, result='parsed')
+        counter.inc(result='skipped')
+        gauge = metrics.Gauge('users', 'Users.')
+        gauge.set(6)
+        gauge.set(0.5)
+        self.assertEqual(metrics.render(), '\n'.join([
+            '# HELP rows_total Rows.',
+            '# TYPE rows_total counter',
+            'rows_total{result="parsed"} 3',
+            'rows_total{result="skipped"} 1',
+            '# HELP users Users.',
+            '# TYPE users gauge',
+            'users 0.5',
+        ]) + '\n')
+
+    def test_histogram(self):
+        """
+        Test cumulative buckets, sum and count of histogram.
+        """
+        histogram = metrics.Histogram(
+            'latency_seconds', 'Latency.', ['route'], buckets=[1, 0.1],
+        )
+        for value in [0.05, 0.5, 0.5, 3]:
+            histogram.observe(value, route='/')
+        self.assertEqual(metrics.render().splitlines()[2:], [
+            'latency_seconds_bucket{route="/",le="0.1"} 1',
+            'latency_seconds_bucket{route="/",le="1"} 3',
+            'latency_seconds_bucket{route="/",le="+Inf"} 4',
+            'latency_seconds_sum{route="/"} 4.05',
+            'latency_seconds_count{route="/"} 4',
+        ])
+
+    def test_callback_and_escaping(self):
+        """
+        Test metric read on rendering and escaping label values.
+        """
+        values = [({'name': 'a "b"\\c\nd'}, 1)]
+        metrics.Callback('calls', 'Calls.', 'counter', lambda: values,
+                         ['name'])
+        self.assertEqual(
+            metrics.render().splitlines()[2],
+            r'calls{name="a \"b\"\\c\nd"} 1',
+        )
+        values.append(({'name': 'e'}, 2))
+        self.assertEqual(metrics.render().splitlines()[3], 'calls{name="e"} 2')
+
+    def test_csv_rows_counted(self):
+        """
+        Test counting parsed and skipped rows of presence CSV file.
+        """
+        loader = loader_module.PresenceCsvLoader()
+        loader.load(TEST_DATA_CSV)
+        self.assertEqual((loader.parsed, loader.skipped), (25, 2))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Data plane tests.
+"""
+import os
+import datetime
+from stat import S_IMODE
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from presence_analyzer import main, models, plane, utils
+from presence_analyzer import loader as loader_module
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, TEST_DATA_XML
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerPlaneTestCase(unittest.TestCase):
+    """
+    Shared data plane tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        self.directory = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.directory, 'data.csv')
+        self.xml_path = os.path.join(self.directory, 'users.xml')
+        self.plane_path = os.path.join(self.directory, 'plane')
+        shutil.copy(TEST_DATA_CSV, self.csv_path)
+        shutil.copy(TEST_DATA_XML, self.xml_path)
+        main.app.config.update({
+            'DATA_CSV': self.csv_path,
+            'DATA_XML': self.xml_path,
+            'DATA_PLANE': self.plane_path,
+            'CACHE_DATA': False,
+        })
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+        utils.planes.clear()
+        utils.get_data.invalidate()
+        utils.get_user_directory.invalidate()
+        shutil.rmtree(self.directory)
+
+    def test_plane_without_users_xml(self):
+        """
+        Test publishing data plane without users XML configured.
+        """
+        main.app.config.pop('DATA_XML')
+        response = main.app.test_client().get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        manifest = plane.read_manifest(self.plane_path)
+        self.assertIsNone(manifest['directory'])
+        self.assertIsNone(manifest['xml'])
+        self.assertIsNone(utils.get_user_directory())
+        self.assertEqual(utils.publish_data_plane(), manifest)
+
+    def test_get_data_from_plane(self):
+        """
+        Test publishing data plane on first use and attaching to it.
+        """
+        data = utils.get_data()
+        self.assertEqual(
+            data, loader_module.PresenceCsvLoader().load(self.csv_path)
+        )
+        manifest = plane.read_manifest(self.plane_path)
+        self.assertEqual(manifest['version'], 1)
+        self.assertEqual(manifest['presence'], 'presence-1.snapshot')
+        for name in (plane.MANIFEST, 'presence-1.snapshot'):
+            path = os.path.join(self.plane_path, name)
+            self.assertEqual(S_IMODE(os.stat(path).st_mode), 0644)
+
+        directory = utils.get_user_directory()
+        expected = utils.load_user_directory(self.xml_path)
+        self.assertEqual(directory.server, expected.server)
+        self.assertIsInstance(directory.users, plane.MappedUsers)
+        self.assertEqual(dict(directory.users), expected.users)
+        self.assertRaises(KeyError, directory.users.__getitem__, 141)
+        self.assertEqual(
+            utils.get_related_xml_values([10]), {10: u'Adrian K.'}
+        )
+
+        with mock.patch('presence_analyzer.utils.parse_presence_rows') \
+                as mock_parse:
+            utils.get_data()
+            self.assertEqual(utils.publish_data_plane(), manifest)
+            self.assertFalse(mock_parse.called)
+
+    def test_switch_to_new_version(self):
+        """
+        Test switching to version published after CSV file changed.
+        """
+        main.app.config.update({'DATA_PLANE_KEEP': 1})
+        utils.get_data()
+        attached = utils.current_plane()
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2013-09-13,9:00:00,17:00:00\n')
+        self.assertEqual(utils.publish_data_plane()['version'], 2)
+
+        data = utils.get_data()
+        self.assertEqual(
+            data[10][datetime.date(2013, 9, 13)],
+            models.PresenceEntry(32400, 61200),
+        )
+        self.assertEqual(utils.current_plane().version, 2)
+        # replaced version is removed, but still readable while mapped
+        self.assertNotIn('presence-1.snapshot', os.listdir(self.plane_path))
+        self.assertEqual(attached.presence.count, 25)
+        self.assertEqual(len(list(attached.presence.rows())), 25)
+
+    def test_users_xml_change_keeps_presence(self):
+        """
+        Test publishing only user directory when users XML changes.
+        """
+        utils.publish_data_plane()
+        with open(self.xml_path, 'w') as xml_file:
+            xml_file.write(
+                '<intranet><server><host>example.com</host></server>'
+                '<users><user id="10"><name>Ten</name></user></users>'
+                '</intranet>'
+            )
+        manifest = utils.publish_data_plane()
+        self.assertEqual(manifest['version'], 2)
+        self.assertEqual(manifest['presence'], 'presence-1.snapshot')
+        self.assertEqual(manifest['directory'], 'directory-2.snapshot')
+        directory = utils.get_user_directory()
+        self.assertEqual(directory.server, {'host': 'example.com'})
+        self.assertEqual(
+            dict(directory.users), {10: models.UserInfo('Ten', None)}
+        )
+
+    def test_cached_data_follows_manifest(self):
+        """
+        Test watched cache switching version when manifest changes.
+        """
+        main.app.config.update({
+            'CACHE_DATA': True, 'CACHE_INVALIDATION': 'watch',
+        })
+        utils.publish_data_plane()
+        utils.get_data.invalidate()
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2013-09-13,9:00:00,17:00:00\n')
+        self.assertIs(utils.get_data(), data)
+        utils.publish_data_plane()
+        self.assertIn(datetime.date(2013, 9, 13), utils.get_data()[10])
+
+    def test_plane_not_writable(self):
+        """
+        Test reading data files when data plane can't be published.
+        """
+        main.app.config.update({
+            'DATA_PLANE': os.path.join(self.csv_path, 'plane'),
+        })
+        self.assertEqual(
+            utils.get_data(),
+            loader_module.PresenceCsvLoader().load(self.csv_path),
+        )
+        self.assertEqual(
+            utils.get_related_xml_values([10]), {10: u'Adrian K.'}
+        )
+        self.assertIsNone(utils.current_plane())
+
+    def test_damaged_directory_snapshot(self):
+        """
+        Test rejecting truncated or foreign directory snapshot.
+        """
+        path = os.path.join(self.directory, 'directory.snapshot')
+        plane.write_directory(path, utils.load_user_directory(self.xml_path))
+        self.assertEqual(len(plane.open_directory(path).users), 4)
+        with open(path, 'r+') as directory_file:
+            directory_file.truncate(40)
+        self.assertIsNone(plane.open_directory(path))
+        with open(path, 'w') as directory_file:
+            directory_file.write('x' * 64)
+        self.assertIsNone(plane.open_directory(path))
+        self.assertIsNone(plane.open_directory('/non/existing/file'))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Request profiler tests.
+"""
+import os
+import marshal
+import shutil
+import tempfile
+import unittest
+
+from presence_analyzer import main, profiling
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, TEST_DATA_XML, \
+    XML_URL
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerProfilingTestCase(unittest.TestCase):
+    """
+    Request profiler tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'XML_URL': XML_URL})
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+
+    def install_profiler(self, **config):
+        """
+        Installs request profiler with given config for one test.
+        """
+        wsgi_app = main.app.wsgi_app
+        self.addCleanup(setattr, main.app, 'wsgi_app', wsgi_app)
+        main.app.config.update(config)
+        profiling.install(main.app)
+
+    def test_profiling_disabled(self):
+        """
+        Test leaving application unwrapped without PROFILE_REQUESTS.
+        """
+        wsgi_app = main.app.wsgi_app
+        self.install_profiler(PROFILE_REQUESTS=False)
+        self.assertIs(main.app.wsgi_app, wsgi_app)
+        response = self.client.get('/api/v1/presence_weekday/10?profile=1')
+        self.assertEqual(response.content_type, 'application/json')
+
+    def test_profile_attachment(self):
+        """
+        Test returning profile of requested request as attachment.
+        """
+        main.app.config.update({'CACHE_DATA': False})
+        self.install_profiler(PROFILE_REQUESTS=True)
+        response = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertNotIn('X-Profile-Timings', response.headers)
+
+        response = self.client.get('/api/v1/presence_weekday/10?profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/octet-stream')
+        self.assertTrue(
+            response.headers['Content-Disposition'].startswith(
+                'attachment; filename="'
+            )
+        )
+        self.assertTrue(
+            response.headers['Content-Disposition'].endswith(
+                '-api_v1_presence_weekday_10.prof"'
+            )
+        )
+        stats = marshal.loads(response.data)
+        self.assertIn('get_data', [key[2] for key in stats])
+        self.assertIn('get_data=', response.headers['X-Profile-Timings'])
+
+    def test_profile_saved_in_directory(self):
+        """
+        Test saving profiles with token into rotated directory.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'profiles')
+        self.install_profiler(
+            PROFILE_REQUESTS=True, PROFILE_DIR=path, PROFILE_TOKEN='secret'
+        )
+        main.app.wsgi_app.keep = 2
+        expected = self.client.get('/api/v1/presence_weekday/10').data
+
+        response = self.client.get(
+            '/api/v1/presence_weekday/10', headers={'X-Profile': '1'}
+        )
+        self.assertNotIn('X-Profile-File', response.headers)
+        self.assertFalse(os.path.exists(path))
+
+        names = []
+        for _ in xrange(3):
+            response = self.client.get(
+                '/api/v1/presence_weekday/10',
+                headers={'X-Profile': 'secret'},
+            )
+            self.assertEqual(response.data, expected)
+            self.assertEqual(response.content_type, 'application/json')
+            names.append(response.headers['X-Profile-File'])
+        self.assertEqual(sorted(os.listdir(path)), names[1:])
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Binary presence snapshot tests.
+"""
+import os
+import datetime
+from stat import S_IMODE
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from presence_analyzer import caching, columnar, main, models, utils
+from presence_analyzer import loader as loader_module
+from presence_analyzer import snapshot as snapshot_module
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerSnapshotTestCase(unittest.TestCase):
+    """
+    Binary presence snapshot tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        self.directory = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.directory, 'data.csv')
+        self.snapshot_path = os.path.join(self.directory, 'data.snapshot')
+        shutil.copy(TEST_DATA_CSV, self.csv_path)
+        main.app.config.update({'DATA_CSV': self.csv_path})
+        main.app.config.update({'DATA_SNAPSHOT': self.snapshot_path})
+        main.app.config.update({'CACHE_DATA': False})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+        shutil.rmtree(self.directory)
+
+    def test_get_data_from_snapshot(self):
+        """
+        Test loading the same data from snapshot as from CSV file.
+        """
+        data = utils.get_data()
+        snapshot = snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        self.assertEqual(snapshot.count, 25)
+        self.assertTrue(snapshot.is_fresh(self.csv_path))
+        self.assertEqual(
+            S_IMODE(os.stat(self.snapshot_path).st_mode), 0644
+        )
+        self.assertEqual(
+            data, loader_module.PresenceCsvLoader().load(self.csv_path)
+        )
+        self.assertIsInstance(data, caching.FrozenDict)
+        self.assertIsInstance(
+            data[10][datetime.date(2013, 9, 10)], models.PresenceEntry
+        )
+
+        with mock.patch('presence_analyzer.loader.write_presence_snapshot') \
+                as mock_write:
+            self.assertEqual(utils.get_data(), data)
+            self.assertFalse(mock_write.called)
+
+    def test_stale_snapshot_rebuilt(self):
+        """
+        Test rebuilding snapshot when CSV file changes.
+        """
+        utils.get_data()
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2013-09-13,9:00:00,17:00:00\n')
+        data = utils.get_data()
+        self.assertEqual(
+            data[10][datetime.date(2013, 9, 13)],
+            models.PresenceEntry(32400, 61200),
+        )
+        snapshot = snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        self.assertEqual(snapshot.count, 26)
+
+    def test_touched_csv_checked_by_checksum(self):
+        """
+        Test keeping snapshot when CSV file is touched but not changed.
+        """
+        utils.get_data()
+        stat = os.stat(self.csv_path)
+        os.utime(self.csv_path, (stat.st_atime, stat.st_mtime + 10))
+        snapshot = snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        self.assertTrue(snapshot.is_fresh(self.csv_path))
+
+        with open(self.csv_path, 'r+') as csv_file:
+            csv_file.write('11')
+        os.utime(self.csv_path, (stat.st_atime, stat.st_mtime + 20))
+        self.assertFalse(snapshot.is_fresh(self.csv_path))
+        self.assertFalse(snapshot.is_fresh('/non/existing/file.csv'))
+
+    def test_damaged_snapshot_rebuilt(self):
+        """
+        Test rebuilding snapshot which is truncated or not a snapshot.
+        """
+        utils.get_data()
+        with open(self.snapshot_path, 'r+') as snapshot_file:
+            snapshot_file.truncate(100)
+        self.assertIsNone(
+            snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        )
+        utils.get_data()
+        self.assertIsNotNone(
+            snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        )
+
+        with open(self.snapshot_path, 'w') as snapshot_file:
+            snapshot_file.write('x' * 64)
+        self.assertIsNone(
+            snapshot_module.PresenceSnapshot.open(self.snapshot_path)
+        )
+        self.assertEqual(len(utils.get_data()), 6)
+
+    def test_snapshot_not_writable(self):
+        """
+        Test falling back to CSV file when snapshot cannot be written.
+        """
+        snapshot_path = os.path.join(self.directory, 'missing', 'snapshot')
+        main.app.config.update({'DATA_SNAPSHOT': snapshot_path})
+        data = utils.get_data()
+        self.assertEqual(len(data), 6)
+        self.assertFalse(os.path.exists(snapshot_path))
+
+    def test_snapshot_rebuilt_once(self):
+        """
+        Test snapshot rebuilt by another process isn't written again and
+        unreadable one falls back to CSV file.
+        """
+        utils.get_data()
+        os.utime(self.csv_path, (0, 0))
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2013-09-30,09:00:00,17:00:00\n')
+        snapshot = loader_module.rebuild_snapshot(
+            self.csv_path, self.snapshot_path
+        )
+        self.assertTrue(snapshot.is_fresh(self.csv_path))
+        self.assertTrue(os.path.exists(self.snapshot_path + '.lock'))
+        with mock.patch('presence_analyzer.loader.write_presence_snapshot') \
+                as mock_write:
+            self.assertTrue(loader_module.rebuild_snapshot(
+                self.csv_path, self.snapshot_path
+            ))
+            self.assertFalse(mock_write.called)
+
+        with mock.patch.object(snapshot_module.PresenceSnapshot, 'open',
+                               return_value=None):
+            data = utils.get_data()
+        self.assertEqual(len(data[10]), 4)
+
+    @unittest.skipIf(columnar.numpy is None, 'numpy is not installed')
+    def test_columnar_store_from_snapshot(self):
+        """
+        Test building columnar store on memory-mapped snapshot.
+        """
+        data = utils.get_data()
+        main.app.config.update({'PRESENCE_STORE': 'columnar'})
+        store = utils.get_data()
+        self.assertIsInstance(store, columnar.ColumnarStore)
+        self.assertFalse(store.starts.flags.writeable)
+        self.assertFalse(store.starts.flags.owndata)
+        for user_id in data:
+            self.assertEqual(
+                utils.aggregate_user(store[user_id]),
+                utils.aggregate_user(data[user_id]),
+            )
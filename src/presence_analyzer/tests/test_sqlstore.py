@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite presence store tests.
+"""
+import os
+import datetime
+import fcntl
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from presence_analyzer import main, models, sqlstore, utils
+from presence_analyzer import loader as loader_module
+from presence_analyzer.tests.fixtures import SAMPLE_DATA_CSV
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerSqliteTestCase(unittest.TestCase):
+    """
+    SQLite presence store tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        self.directory = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.directory, 'data.csv')
+        self.database_path = os.path.join(self.directory, 'data.sqlite')
+        shutil.copy(SAMPLE_DATA_CSV, self.csv_path)
+        main.app.config.update({'DATA_CSV': self.csv_path})
+        main.app.config.update({'DATA_SQLITE': self.database_path})
+        main.app.config.update({'CACHE_DATA': False})
+        self.client = main.app.test_client()
+        self.data = utils.get_data()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+        loader_module.sqlite_stores.clear()
+        utils.get_data.invalidate()
+        shutil.rmtree(self.directory)
+
+    def get_store(self):
+        """
+        Returns SQLite store of the CSV file.
+        """
+        main.app.config.update({'PRESENCE_STORE': 'sqlite'})
+        return utils.get_data()
+
+    def test_get_data_sqlite_store(self):
+        """
+        Test importing CSV file into SQLite store.
+        """
+        store = self.get_store()
+        self.assertIsInstance(store, sqlstore.SqliteStore)
+        self.assertItemsEqual(store.keys(), self.data.keys())
+        self.assertEqual(len(store), len(self.data))
+        self.assertIn(10, store)
+        self.assertNotIn(100, store)
+        self.assertRaises(KeyError, store.__getitem__, 100)
+        user = store[10]
+        self.assertEqual(len(user), len(self.data[10]))
+        self.assertEqual(list(user), sorted(self.data[10]))
+        date = datetime.date(2013, 9, 10)
+        self.assertEqual(user[date], self.data[10][date])
+        self.assertRaises(
+            KeyError, user.__getitem__, datetime.date(1999, 1, 1)
+        )
+
+        with mock.patch('presence_analyzer.loader.write_database') \
+                as mock_write:
+            self.assertIs(utils.get_data(), store)
+            self.assertFalse(mock_write.called)
+
+    def test_stale_database_imported_again(self):
+        """
+        Test importing CSV file again when it changes.
+        """
+        store = self.get_store()
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2099-01-05,9:00:00,17:00:00\n')
+        updated = utils.get_data()
+        self.assertIsNot(updated, store)
+        self.assertEqual(
+            updated[10][datetime.date(2099, 1, 5)],
+            models.PresenceEntry(32400, 61200),
+        )
+
+        with open(self.database_path, 'w') as database_file:
+            database_file.write('x' * 64)
+        self.assertIsNone(sqlstore.read_source(self.database_path))
+        self.assertIn(10, utils.get_data())
+
+    def test_database_imported_once(self):
+        """
+        Test database imported by another process isn't imported again.
+        """
+        self.get_store()
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('10,2099-01-05,9:00:00,17:00:00\n')
+
+        def import_meanwhile(lock_file, operation):
+            """
+            Imports database as another process holding the lock would.
+            """
+            self.assertEqual(operation, fcntl.LOCK_EX)
+            self.assertEqual(lock_file.name, self.database_path + '.lock')
+            sqlstore.write_database(
+                self.database_path,
+                *loader_module.parse_presence_rows(self.csv_path)
+            )
+
+        with mock.patch('fcntl.flock', side_effect=import_meanwhile), \
+                mock.patch('presence_analyzer.loader.write_database') \
+                as mock_write:
+            updated = utils.get_data()
+        self.assertFalse(mock_write.called)
+        self.assertIn(datetime.date(2099, 1, 5), updated[10])
+
+    def test_sqlite_helpers(self):
+        """
+        Test SQL aggregations give the same results as dict based ones.
+        """
+        store = self.get_store()
+        start = datetime.date(2013, 5, 1)
+        end = datetime.date(2013, 7, 31)
+        for user_id in self.data:
+            self.assertEqual(
+                utils.aggregate_user(store[user_id]),
+                utils.aggregate_user(self.data[user_id]),
+            )
+            self.assertEqual(
+                map(sorted, utils.group_by_weekday(store[user_id])),
+                map(sorted, utils.group_by_weekday(self.data[user_id])),
+            )
+            selected = utils.select_dates(store[user_id], start, end)
+            self.assertIsInstance(selected, sqlstore.UserRows)
+            self.assertEqual(
+                dict(selected.iteritems()),
+                utils.select_dates(self.data[user_id], start, end),
+            )
+            self.assertEqual(
+                utils.get_monthly_worked_hours(store[user_id], start, end),
+                utils.get_monthly_worked_hours(self.data[user_id], start, end),
+            )
+        self.assertEqual(
+            utils.aggregate_office(store), utils.aggregate_office(self.data)
+        )
+
+    def test_sqlite_views(self):
+        """
+        Test views return the same JSON with SQLite store.
+        """
+        urls = [
+            '/api/v1/presence_weekday/%d',
+            '/api/v1/presence_start_end/%d',
+            '/api/v1/monthly_worked_hours/%d?from=2013-05-01',
+        ]
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_data.invalidate()
+        expected = [
+            self.client.get(url % user_id).data
+            for url in urls for user_id in self.data
+        ]
+        utils.get_data.invalidate()
+        self.get_store()
+        with mock.patch('presence_analyzer.views.get_aggregates') \
+                as mock_aggregates:
+            responses = [
+                self.client.get(url % user_id).data
+                for url in urls for user_id in self.data
+            ]
+            self.assertFalse(mock_aggregates.called)
+        self.assertEqual(responses, expected)
+
+    def test_connection_pool_shared_by_threads(self):
+        """
+        Test connections are reused by threads up to the pool size.
+        """
+        self.get_store()
+        pool = sqlstore.ConnectionPool(self.database_path, size=2)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                pool.query('SELECT COUNT(*) FROM presence')[0][0]
+            ))
+            for _ in xrange(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        self.assertLessEqual(pool.idle.qsize(), 2)
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+        with pool.connection() as connection:
+            self.assertIn(connection, (first, second))
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+"""
+Utility functions tests.
+"""
+import calendar
+import functools
+import os
+import datetime
+from stat import S_IMODE
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from requests import ConnectionError
+
+from presence_analyzer import caching, main, models, utils
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, SAMPLE_DATA_CSV, \
+    TEST_DATA_XML, XML_URL, StandInHandler, StandInServer
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
+    """
+    Utility functions tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'XML_URL': XML_URL})
+        main.app.config.update({'CACHE_DATA': False})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+
+    def test_get_data_correct_type(self):
+        """
+        Test if method returns correct type of data
+        """
+        data = utils.get_data()
+        self.assertIsInstance(data, dict)
+
+    def test_get_data_read_correct_number_of_keys(self):
+        """
+        Test parsing of CSV file.
+        """
+        data = utils.get_data()
+        self.assertItemsEqual(data.keys(), [10, 11, 13, 14, 15, 141])
+
+    def test_get_data_read_correctly_values(self):
+        """
+        Test reading correctly values from CSV file.
+        """
+        data = utils.get_data()
+        sample_date = datetime.date(2013, 9, 10)
+        self.assertIn(sample_date, data[10])
+        self.assertIsInstance(data[10][sample_date], models.PresenceEntry)
+        self.assertEqual(data[10][sample_date].start_seconds, 34745)
+        self.assertEqual(data[10][sample_date].end_seconds, 64792)
+
+    def test_group_by_weekday(self):
+        """
+        Test grouping results by weekday.
+        """
+        items = utils.get_data()
+        results = utils.group_by_weekday(items[10])
+        self.assertIsInstance(results, list)
+        self.assertEqual(results[0], [])
+        self.assertEqual(len(results[1]), 1)
+
+    def test_group_by_weekday_range(self):
+        """
+        Test grouping by weekday only entries from range of days.
+        """
+        items = utils.get_data()[11]
+        results = utils.group_by_weekday(
+            items, datetime.date(2013, 9, 9), datetime.date(2013, 9, 11)
+        )
+        self.assertEqual(map(len, results), [1, 1, 1, 0, 0, 0, 0])
+        results = utils.group_by_weekday(items, end=datetime.date(2013, 9, 9))
+        self.assertEqual(map(len, results), [1, 0, 0, 1, 0, 0, 0])
+
+    def test_select_dates(self):
+        """
+        Test selecting entries of days in range using sorted date index.
+        """
+        items = utils.get_data()[11]
+        self.assertIsInstance(items, caching.UserEntries)
+        self.assertEqual(items.dates, tuple(sorted(items)))
+        self.assertIs(utils.select_dates(items), items)
+        september = functools.partial(datetime.date, 2013, 9)
+        selected = utils.select_dates(items, september(6), september(10))
+        self.assertItemsEqual(selected.keys(), [september(9), september(10)])
+        self.assertEqual(selected[september(9)], items[september(9)])
+        self.assertItemsEqual(
+            utils.select_dates(items, start=september(12)).keys(),
+            [september(12), september(13)],
+        )
+        self.assertEqual(
+            utils.select_dates(dict(items), september(14), september(30)),
+            {},
+        )
+        with mock.patch('presence_analyzer.utils.sorted') as mock_sorted:
+            utils.select_dates(items, september(6), september(10))
+            self.assertFalse(mock_sorted.called)
+
+    def test_presence_entry(self):
+        """
+        Test presence entry record.
+        """
+        entry = models.PresenceEntry(start_seconds=29409, end_seconds=37219)
+        self.assertEqual(entry.interval, 7810)
+        self.assertEqual(entry, (29409, 37219))
+        self.assertRaises(AttributeError, setattr, entry, 'extra', 1)
+        self.assertIs(caching.freeze(entry), entry)
+
+    def test_interval(self):
+        """
+        Test calculating proper interval between start <-> end dates.
+        """
+        start = datetime.time(hour=8)
+        end = datetime.time(hour=10, minute=10, second=10)
+        time_interval = utils.interval(start, end)
+        self.assertIsInstance(time_interval, int)
+        self.assertEqual(time_interval, 7810)
+
+    def test_mean_if_items(self):
+        """
+        Test calculating mean from items.
+        """
+        items = [1, 2, 3, 4, 5]
+        mean = utils.mean(items)
+        self.assertIsInstance(mean, float)
+        self.assertEqual(mean, 3)
+        items.append(9.7)
+        mean = utils.mean(items)
+        self.assertEqual(mean, 4.116666666666666)
+
+    def test_mean_if_empty_list(self):
+        """
+        Test mean function if list is empty.
+        """
+        mean = utils.mean([])
+        self.assertIsInstance(mean, int)
+        self.assertEqual(mean, 0)
+
+    def test_mean_start_end_time(self):
+        """
+        Test calculating mean values of start and end times of user
+        according to the weekdays
+        """
+        data = utils.get_data()
+        mean_times = utils.get_mean_start_end_time(data[13])
+        self.assertIsInstance(mean_times, list)
+        self.assertEqual(len(mean_times), 7)
+        self.assertTupleEqual(mean_times[1], (33398.0, 54340.5))
+
+    def test_process_request_get(self):
+        """
+        Test processing get request passed as parameters
+        """
+        server = StandInServer().start(self)
+        response = utils.process_request(server.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests[0][0], 'GET')
+
+    def test_process_request_post(self):
+        """
+        Test processing post request passed as parameters
+        """
+        server = StandInServer().start(self)
+        response = utils.process_request(server.url, 'post')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests[0][0], 'POST')
+
+    def test_process_request_reuses_connection(self):
+        """
+        Test sending subsequent requests over the same connection.
+        """
+        server = StandInServer().start(self)
+        utils.process_request(server.url)
+        utils.process_request(server.url)
+        self.assertEqual(server.requests[0][1], server.requests[1][1])
+
+    @mock.patch.object(utils.http_session, 'request')
+    def test_process_request_timeout(self, mock_request):
+        """
+        Test passing configured timeout to the request.
+        """
+        main.app.config.update({'XML_TIMEOUT': 5})
+        utils.process_request(XML_URL)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 5)
+        utils.process_request(XML_URL, timeout=1)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 1)
+
+    @mock.patch.object(utils.http_session, 'request',
+                       side_effect=ConnectionError)
+    def test_process_request_catch_connection_error(self, mock_request):
+        """
+        Test catching io exception when processing request.
+        """
+        self.assertFalse(utils.process_request(XML_URL))
+        self.assertTrue(mock_request.called)
+
+    def test_downloading_users_information(self):
+        """
+        Test downloading xml file from http location to file.
+        """
+        server = StandInServer().start(self)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'users.xml')
+        main.app.config.update({'XML_URL': server.url, 'DATA_XML': path})
+
+        data = utils.download_users_information()
+        self.assertEqual(data, os.path.getsize(TEST_DATA_XML))
+        with open(path) as downloaded, open(TEST_DATA_XML) as expected:
+            self.assertEqual(downloaded.read(), expected.read())
+        self.assertEqual(os.listdir(directory),
+                         ['users.xml', 'users.xml.validators'])
+        self.assertEqual(S_IMODE(os.stat(path).st_mode), 0644)
+        self.assertNotIn('If-None-Match', server.requests[0][2])
+
+        downloads = dict(utils.DOWNLOADS.values)
+        self.assertEqual(utils.download_users_information(), 0)
+        self.assertEqual(
+            utils.DOWNLOADS.values[('304',)], downloads.get(('304',), 0) + 1
+        )
+        headers = dict(
+            (key.lower(), value)
+            for key, value in server.requests[1][2].iteritems()
+        )
+        self.assertEqual(headers['if-none-match'], StandInHandler.etag)
+        self.assertEqual(headers['if-modified-since'],
+                         StandInHandler.last_modified)
+
+    def test_downloading_users_information_catch_error(self):
+        """
+        Test catching io exception during downloading xml file.
+        """
+        server = StandInServer().start(self)
+        main.app.config.update({
+            'XML_URL': server.url,
+            'DATA_XML': '/non/existing/directory/users.xml',
+        })
+        self.assertFalse(utils.download_users_information())
+
+    def test_downloading_users_information_connection_error(self):
+        """
+        Test downloading xml file when server is not available.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        main.app.config.update({
+            'XML_URL': 'http://127.0.0.1:1/users.xml',
+            'DATA_XML': os.path.join(directory, 'users.xml'),
+        })
+        self.assertIsNone(utils.download_users_information())
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_downloading_users_information_key_error(self):
+        """
+        Test catching io exception during downloading xml file.
+        """
+        main.app.config.pop('XML_URL')
+        self.assertFalse(utils.download_users_information())
+
+    def test_scheduler_not_started_on_import(self):
+        """
+        Test importing utils does not start scheduler.
+        """
+        self.assertIsNone(utils.background['scheduler'])
+
+    @mock.patch('presence_analyzer.utils.Scheduler')
+    def test_scheduler_started_once(self, mock_scheduler):
+        """
+        Test starting scheduler only once per process.
+        """
+        self.addCleanup(utils.shutdown_scheduler)
+        scheduler = utils.download_user_info_scheduler()
+        self.assertIs(utils.download_user_info_scheduler(), scheduler)
+        self.assertEqual(mock_scheduler.call_count, 1)
+        scheduler.start.assert_called_once_with()
+        self.assertEqual(scheduler.add_cron_job.call_count, 1)
+
+    @mock.patch('presence_analyzer.utils.Scheduler')
+    def test_scheduler_single_leader(self, mock_scheduler):
+        """
+        Test starting scheduler only by the holder of lock file.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        lock_path = os.path.join(directory, 'scheduler.lock')
+        main.app.config.update({'SCHEDULER_LOCK': lock_path})
+
+        other = utils.acquire_leader_lock(lock_path)
+        self.assertIsNotNone(other)
+        self.assertIsNone(utils.download_user_info_scheduler())
+        self.assertFalse(mock_scheduler.called)
+
+        other.close()
+        self.addCleanup(utils.shutdown_scheduler)
+        self.assertIsNotNone(utils.download_user_info_scheduler())
+        self.assertIsNone(utils.acquire_leader_lock(lock_path))
+
+    @mock.patch('presence_analyzer.utils.download_users_information')
+    @mock.patch('presence_analyzer.utils.Scheduler')
+    def test_start_background_tasks(self, mock_scheduler, mock_download):
+        """
+        Test warming caches up in background when application starts.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        self.addCleanup(utils.get_user_directory.invalidate)
+        self.addCleanup(utils.get_data.invalidate)
+        self.addCleanup(utils.shutdown_scheduler)
+        utils.get_data.invalidate()
+        utils.get_user_directory.invalidate()
+        self.addCleanup(utils.readiness.update, ready=False,
+                        warm_up_seconds=None)
+        mock_download.return_value = 0
+
+        main.app.config.update({'CSV_WORKERS': 2})
+        pools = []
+
+        def parse_pool(workers):
+            """
+            Records if pool is created before the scheduler.
+            """
+            pools.append((workers, mock_scheduler.called))
+            return mock.Mock(map=map)
+
+        with mock.patch('presence_analyzer.utils.parse_pool', parse_pool), \
+                mock.patch('presence_analyzer.loader.parse_pool', parse_pool):
+            utils.start_background_tasks().join()
+        self.assertEqual(pools[0], (2, False))
+        self.assertTrue(mock_scheduler.called)
+        mock_download.assert_called_once_with()
+        self.assertIsNotNone(utils.get_data.generation())
+        self.assertIsNotNone(utils.get_user_directory.generation())
+        self.assertIs(utils.get_aggregates(), utils.get_aggregates())
+        self.assertTrue(utils.readiness['ready'])
+        self.assertIsNone(utils.readiness['error'])
+        self.assertGreaterEqual(utils.readiness['warm_up_seconds'], 0)
+
+    @mock.patch('presence_analyzer.utils.get_data', side_effect=IOError)
+    @mock.patch('presence_analyzer.utils.download_users_information')
+    def test_warm_up_catch_error(self, mock_download, mock_get_data):
+        """
+        Test warming up by follower and catching errors while doing it.
+        """
+        self.addCleanup(utils.readiness.update, ready=False,
+                        warm_up_seconds=None, error=None)
+        utils.warm_up(download=False)
+        self.assertFalse(mock_download.called)
+        self.assertTrue(mock_get_data.called)
+        self.assertFalse(utils.readiness['ready'])
+        self.assertEqual(utils.readiness['error'], 'IOError: ')
+        self.assertGreaterEqual(utils.readiness['warm_up_seconds'], 0)
+
+    def test_get_related_xml_values(self):
+        """
+        Test returning proper list of names according to the ids list.
+        """
+        data = utils.get_data()
+
+        names = utils.get_related_xml_values(data.keys())
+        self.assertEqual(len(names.keys()), 6)
+        self.assertEqual(names[10], 'Adrian K.')
+        self.assertEqual(names[13], 'Agata J.')
+
+    def test_get_related_xml_values_processing_error(self):
+        """
+        Test returning none if xml file is corrupted.
+        """
+        data = utils.get_data()
+        with tempfile.NamedTemporaryFile(suffix='.xml') as xml_file:
+            xml_file.write('<intranet><users><user id="10">')
+            xml_file.flush()
+            main.app.config.update({'DATA_XML': xml_file.name})
+            names = utils.get_related_xml_values(data.keys())
+        self.assertFalse(names)
+
+    def test_get_related_xml_values_with_empty_items(self):
+        """
+        Test returning empty dict if ids list is also empty.
+        """
+        names = utils.get_related_xml_values([])
+        self.assertDictEqual(names, {})
+
+    def test_get_related_xml_values_with_no_matching_id(self):
+        """
+        Test returning default value if id wasn't found in XML file.
+        """
+        names = utils.get_related_xml_values([121])
+        self.assertEqual(len(names.keys()), 1)
+        self.assertEqual(names[121], 'User  121')
+
+    def test_load_user_directory(self):
+        """
+        Test streaming users from XML file.
+        """
+        directory = utils.load_user_directory(TEST_DATA_XML)
+        self.assertEqual(directory.server['host'], 'intranet.stxnext.pl')
+        self.assertEqual(directory.server['protocol'], 'https')
+        self.assertEqual(len(directory.users), 4)
+        self.assertEqual(
+            directory.users[10],
+            models.UserInfo('Adrian K.', '/api/images/users/10'),
+        )
+        self.assertIsNone(utils.load_user_directory('/non/existing.xml'))
+
+    def test_get_user_directory_parsed_once(self):
+        """
+        Test user directory is parsed again only when XML file changes.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_user_directory.invalidate()
+        directory = utils.get_user_directory()
+        with mock.patch.object(utils, 'load_user_directory') as mocked:
+            self.assertIs(utils.get_user_directory(), directory)
+            self.assertFalse(mocked.called)
+            signature = caching.file_signature(TEST_DATA_XML)
+            with mock.patch('presence_analyzer.caching.file_signature') \
+                    as stat:
+                stat.return_value = signature[:2] + (0,)
+                utils.get_user_directory()
+            self.assertTrue(mocked.called)
+        utils.get_user_directory.invalidate()
+
+    def test_get_user_photo(self):
+        """
+        Test getting user photo.
+        """
+        photo_url = utils.get_user_photo_url(13)
+        correct_url = 'https://intranet.stxnext.pl/api/images/users/13'
+        self.assertIsNotNone(photo_url)
+        self.assertEqual(photo_url, correct_url)
+
+    def test_get_user_photo_wrong_user_id(self):
+        """
+        Test getting user default photo.
+        """
+        photo_url = utils.get_user_photo_url('wrong_url')
+        default_photo_url = 'https://intranet.stxnext.pl/api/images/users/1'
+        self.assertEqual(photo_url, default_photo_url)
+
+    def test_time_separated_by_months(self):
+        """
+        Test gathering times separated for years nad months related to
+        them.
+        """
+        data = utils.get_data()
+        years_data = utils.time_separated_by_months(data[10])
+        self.assertIsNotNone(years_data)
+        self.assertDictEqual(years_data, {2013: {9: [30047, 23705, 24465]}})
+
+    def test_group_time_by_month_year(self):
+        """
+        Test grouping monthly worked hours by months in year.
+        """
+        years = {2013: {9: [30047, 23705, 24465]}}
+        grouped_data = utils.group_time_by_month_year(years)
+        self.assertEqual(len(grouped_data[2013]), 12)
+        self.assertListEqual(grouped_data[2013][8], ['Sep', 21])
+
+    @mock.patch('presence_analyzer.utils.time_separated_by_months')
+    def test_get_monthly_worked_hours(self, years_dict):
+        """
+        Test getting average working hours for each month.
+        """
+        years_dict.return_value = {2013: {9: [30047, 23705, 24465]}}
+        output = utils.get_monthly_worked_hours({})
+        self.assertListEqual(output[0], ['Year', '2013'])
+        self.assertListEqual(output[9], ['Sep', 21])
+
+    def test_get_monthly_worked_hours_range(self):
+        """
+        Test getting monthly worked hours only from range of days.
+        """
+        items = utils.get_data()[11]
+        output = utils.get_monthly_worked_hours(
+            items, datetime.date(2013, 10, 1), datetime.date(2013, 10, 31)
+        )
+        self.assertListEqual(output, [['Year']] + [
+            [month] for month in calendar.month_abbr[1:]
+        ])
+        output = utils.get_monthly_worked_hours(
+            items, start=datetime.date(2013, 9, 12)
+        )
+        self.assertListEqual(output[9], ['Sep', 8])
+
+    def test_aggregate_office(self):
+        """
+        Test office statistics are calculated once per data snapshot.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        self.addCleanup(utils.get_data.invalidate)
+        utils.get_data.invalidate()
+        office = utils.get_office_aggregates()
+        self.assertIsInstance(office, models.OfficeAggregates)
+        self.assertIs(utils.get_office_aggregates(), office)
+        self.assertEqual(
+            office.headcount[0], (datetime.date(2013, 9, 5), 1)
+        )
+        self.assertEqual(office.arrivals[0], (9 * 3600, 7))
+        self.assertEqual(office.weekday_means[0], 24123.0)
+        self.assertEqual(office.weekday_means[5:], (0, 0))
+
+    def test_aggregate_user(self):
+        """
+        Test precomputed statistics match the ones calculated on request.
+        """
+        main.app.config.update({'DATA_CSV': SAMPLE_DATA_CSV})
+        data = utils.get_data()
+        for items in data.itervalues():
+            aggregates = utils.aggregate_user(items)
+            weekdays = utils.group_by_weekday(items)
+            self.assertEqual(
+                list(aggregates.weekday_totals), map(sum, weekdays)
+            )
+            self.assertEqual(
+                list(aggregates.weekday_means), map(utils.mean, weekdays)
+            )
+            self.assertEqual(
+                list(aggregates.mean_start_end),
+                utils.get_mean_start_end_time(items),
+            )
+            self.assertEqual(
+                aggregates.monthly_hours,
+                caching.freeze(utils.get_monthly_worked_hours(items)),
+            )
+
+    def test_get_aggregates(self):
+        """
+        Test aggregates are calculated once per presence data snapshot.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_data.invalidate()
+        aggregates = utils.get_aggregates()
+        self.assertItemsEqual(aggregates.keys(), utils.get_data().keys())
+        self.assertIsInstance(aggregates[10], models.UserAggregates)
+        self.assertIs(utils.get_aggregates(), aggregates)
+        main.app.config.update({'DATA_CSV': SAMPLE_DATA_CSV})
+        utils.get_data.invalidate()
+        self.assertIsNot(utils.get_aggregates(), aggregates)
+        utils.get_data.invalidate()
+
+    def test_weekday_abbr(self):
+        """
+        Test returning correct weekday abbreviation.
+        """
+        self.assertEqual(utils.weekday_abbr(2), 'Wed')
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+Views tests.
+"""
+import json
+import unittest
+
+import mock
+
+from presence_analyzer import main, utils, views
+from presence_analyzer.tests.fixtures import TEST_DATA_CSV, TEST_DATA_XML, \
+    XML_URL
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods
+class PresenceAnalyzerViewsTestCase(unittest.TestCase):
+    """
+    Views tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.config = dict(main.app.config)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        main.app.config.update({'XML_URL': XML_URL})
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.clear()
+        main.app.config.update(self.config)
+
+    def test_mainpage(self):
+        """
+        Test main page redirect.
+        """
+        resp = self.client.get('/')
+        self.assertEqual(resp.status_code, 302)
+        assert resp.headers['Location'].endswith('/presence_weekday')
+
+    def test_api_users(self):
+        """
+        Test users listing.
+        """
+        resp = self.client.get('/api/v1/users')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 6)
+        self.assertDictEqual(data[0], {u'user_id': 10, u'name': u'Adrian K.'})
+
+    def test_mean_time_weekday_wrong_user(self):
+        """
+        Test user weekday view for wrong user
+        """
+        response = self.client.get('/api/v1/mean_time_weekday/100')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content_type, 'text/html')
+
+    def test_mean_time_weekday_view(self):
+        """
+        Test user weekday view
+        """
+        response = self.client.get('/api/v1/mean_time_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        data = json.loads(response.data)
+        self.assertEqual(len(data), 7)
+        self.assertListEqual(data[1], [u'Tue', 30047.0])
+
+    def test_presence_weekday_view(self):
+        """
+        Test user presence weekday view
+        """
+        response = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(len(data), 8)
+        self.assertListEqual(data[4], [u'Thu', 23705])
+
+    def test_presence_weekday_wrong_user(self):
+        """
+        Test user weekday view for wrong user
+        """
+        response = self.client.get('/api/v1/presence_weekday/100')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content_type, 'text/html')
+
+    def test_presence_start_end_wrong_user(self):
+        """
+        Test user weekday view for wrong user
+        """
+        response = self.client.get('/api/v1/presence_start_end/100')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content_type, 'text/html')
+
+    def test_presence_start_end_view(self):
+        """
+        Test user presence weekday view
+        """
+        response = self.client.get('/api/v1/presence_start_end/13')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(len(data), 7)
+        self.assertListEqual(data[3], [u'Thu', 42466.0, 57163.5])
+
+    def test_presence_weekday_page(self):
+        """
+        Test user presence weekday page rendering with proper template.
+        """
+        response = self.client.get('/presence_weekday')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<h2>Presence by weekday</h2>', response.data)
+
+    def test_mean_time_weekday_page(self):
+        """
+        Test user mean time presence weekday page rendering with proper.
+        template
+        """
+        response = self.client.get('/mean_time_weekday')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<h2>Presence mean time by weekday</h2>', response.data)
+
+    def test_start_end_time_weekday_page(self):
+        """
+        Test user mean start / end presence time by weekday page
+        rendering with proper template.
+        """
+        response = self.client.get('/start_end_mean_time_weekday')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<h2>Mean working hours</h2>', response.data)
+
+    def test_monthly_worked_hours_page(self):
+        """
+        Test monthly worked hours page rendering with proper template.
+        """
+        response = self.client.get('/monthly_worked_hours')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<h2>Monthly worked hours</h2>', response.data)
+
+    def test_user_photo_url_api_route(self):
+        """
+        Test user photo url api route.
+        """
+        response = self.client.get('/api/v1/user/10/photo')
+        photo_url = 'https://intranet.stxnext.pl/api/images/users/10'
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertDictEqual(data[0], {"user_photo": photo_url})
+
+    def test_default_user_photo_url_api_route(self):
+        """
+        Test default photo.
+        """
+        response = self.client.get('/api/v1/user/10000/photo')
+        photo_url = 'https://intranet.stxnext.pl/api/images/users/1'
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertDictEqual(data[0], {"user_photo": photo_url})
+
+    def test_stats_view(self):
+        """
+        Test bulk statistics match single user views.
+        """
+        response = self.client.get(
+            '/api/v1/stats?users=13,10,100&metrics=presence_weekday,'
+            'monthly_worked_hours'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertIn('ETag', response.headers)
+        data = json.loads(response.data)
+        self.assertEqual([user['user_id'] for user in data], [10, 13])
+        self.assertItemsEqual(
+            data[0].keys(),
+            ['user_id', 'presence_weekday', 'monthly_worked_hours'],
+        )
+        for user in data:
+            for metric in ['presence_weekday', 'monthly_worked_hours']:
+                single = self.client.get(
+                    '/api/v1/%s/%d' % (metric, user['user_id'])
+                )
+                self.assertEqual(user[metric], json.loads(single.data))
+
+    def test_stats_view_all(self):
+        """
+        Test bulk statistics of all users and metrics.
+        """
+        with mock.patch('presence_analyzer.views.requested_aggregates',
+                        wraps=views.requested_aggregates) as mocked:
+            data = json.loads(self.client.get('/api/v1/stats').data)
+            self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(
+            [user['user_id'] for user in data], [10, 11, 13, 14, 15, 141]
+        )
+        self.assertItemsEqual(
+            data[0].keys(), ['user_id'] + views.METRICS.keys()
+        )
+        self.assertListEqual(data[2]['presence_start_end'][3],
+                             [u'Thu', 42466.0, 57163.5])
+
+    def test_stats_view_stream(self):
+        """
+        Test streaming bulk statistics one user per line.
+        """
+        response = self.client.get(
+            '/api/v1/stats?users=all&metrics=mean_time_weekday&stream=1'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        lines = response.data.splitlines()
+        self.assertEqual(len(lines), 6)
+        single = self.client.get('/api/v1/mean_time_weekday/10')
+        self.assertEqual(
+            json.loads(lines[0]),
+            {'user_id': 10, 'mean_time_weekday': json.loads(single.data)},
+        )
+
+    def test_office_views(self):
+        """
+        Test office-wide statistics of all users.
+        """
+        response = self.client.get('/api/v1/office/mean_time_weekday')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        data = json.loads(response.data)
+        self.assertEqual(len(data), 7)
+        self.assertListEqual(data[0], [u'Mon', 24123.0])
+        self.assertListEqual(data[6], [u'Sun', 0])
+
+        data = json.loads(self.client.get('/api/v1/office/headcount').data)
+        self.assertListEqual(data[0], [u'Date', u'Headcount'])
+        self.assertEqual(len(data), 10)
+        self.assertListEqual(data[3], [u'2013-09-10', 3])
+
+        data = json.loads(self.client.get('/api/v1/office/arrivals').data)
+        self.assertListEqual(data[0], [u'Arrival', u'Entries'])
+        self.assertListEqual(data[1], [u'09:00', 7])
+        self.assertListEqual(data[-1], [u'13:15', 6])
+        self.assertEqual(sum(count for _, count in data[1:]), 25)
+
+    def test_date_range_views(self):
+        """
+        Test limiting user statistics to range of days.
+        """
+        response = self.client.get(
+            '/api/v1/presence_weekday/11?from=2013-09-09&to=2013-09-11'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(
+            [total > 0 for _, total in data[1:]],
+            [True, True, True, False, False, False, False],
+        )
+        response = self.client.get(
+            '/api/v1/mean_time_weekday/11?to=2013-09-05'
+        )
+        data = json.loads(response.data)
+        self.assertEqual(
+            data, json.loads(self.client.get(
+                '/api/v1/mean_time_weekday/11?from=2013-09-01&to=2013-09-05'
+            ).data),
+        )
+        self.assertEqual(data[3], ['Thu', 22999])
+        response = self.client.get(
+            '/api/v1/stats?users=10,11&metrics=monthly_worked_hours'
+            '&from=2013-09-12'
+        )
+        data = json.loads(response.data)
+        self.assertEqual(data[1]['monthly_worked_hours'][9], ['Sep', 8])
+        response = self.client.get(
+            '/api/v1/presence_start_end/100?from=2013-09-12'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_user_views_without_cache(self):
+        """
+        Test only requested user is aggregated when cache is disabled.
+        """
+        main.app.config.update({'CACHE_DATA': False})
+        with mock.patch('presence_analyzer.utils.aggregate_user',
+                        wraps=utils.aggregate_user) as mocked:
+            response = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mocked.call_count, 1)
+        response = self.client.get('/api/v1/presence_weekday/100')
+        self.assertEqual(response.status_code, 404)
+
+    def test_date_range_bad_request(self):
+        """
+        Test rejecting malformed range of days.
+        """
+        response = self.client.get('/api/v1/presence_weekday/11?from=9/9/13')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1/stats?to=2013-02-30')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_view_bad_request(self):
+        """
+        Test rejecting malformed user ids and unknown metrics.
+        """
+        response = self.client.get('/api/v1/stats?users=10,ten')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1/stats?metrics=salary')
+        self.assertEqual(response.status_code, 400)
+
+    def test_health_ready(self):
+        """
+        Test readiness reported once warm-up is done.
+        """
+        with mock.patch.dict(utils.readiness,
+                             ready=False, warm_up_seconds=None):
+            response = self.client.get('/health/ready')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+            self.assertFalse(json.loads(response.data)['ready'])
+
+        with mock.patch.dict(utils.readiness,
+                             ready=True, warm_up_seconds=1.5):
+            response = self.client.get('/health/ready')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content_type, 'application/json')
+            self.assertDictEqual(
+                json.loads(response.data),
+                {'ready': True, 'warm_up_seconds': 1.5, 'error': None},
+            )
+
+        with mock.patch.dict(utils.readiness, ready=False,
+                             warm_up_seconds=0.1, error='IOError: '):
+            response = self.client.get('/health/ready')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.data)['error'], 'IOError: ')
+
+    def test_api_etag(self):
+        """
+        Test answering repeated request with 304 without calculation.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        response = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        with mock.patch('presence_analyzer.views.get_aggregates') as mocked:
+            response = self.client.get(
+                '/api/v1/presence_weekday/10',
+                headers={'If-None-Match': etag},
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, '')
+            self.assertEqual(response.headers['ETag'], etag)
+            response = self.client.get('/api/v1/presence_weekday/10')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.assertFalse(mocked.called)
+
+        response = self.client.get(
+            '/api/v1/presence_weekday/11', headers={'If-None-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_api_etag_new_data_generation(self):
+        """
+        Test memoised responses are dropped when data changes.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        response = self.client.get('/api/v1/presence_weekday/10')
+        utils.get_data.invalidate()
+        with mock.patch('presence_analyzer.views.get_aggregates',
+                        wraps=utils.get_aggregates) as mocked:
+            response = self.client.get(
+                '/api/v1/presence_weekday/10',
+                headers={'If-None-Match': response.headers['ETag']},
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertTrue(mocked.called)
+
+    def test_api_memo_limit(self):
+        """
+        Test only JSON_CACHE_ENTRIES recently used responses are kept.
+        """
+        main.app.config.update({
+            'CACHE_DATA': True,
+            'JSON_CACHE_ENTRIES': 2,
+        })
+        urls = ['/api/v1/presence_weekday/10?%d' % i for i in xrange(3)]
+        with mock.patch('presence_analyzer.views.get_aggregates',
+                        wraps=utils.get_aggregates) as mocked:
+            for url in urls + urls[2:]:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(mocked.call_count, 3)
+            self.client.get(urls[0])
+            self.assertEqual(mocked.call_count, 4)
+            views.presence_weekday_view.clear()
+            self.client.get(urls[0])
+            self.assertEqual(mocked.call_count, 5)
+            self.assertIn(views.presence_weekday_view,
+                          utils.jsonified_functions)
+
+    def test_api_without_users_xml(self):
+        """
+        Test API works without users XML configured.
+        """
+        main.app.config.pop('DATA_XML')
+        main.app.config.update({
+            'CACHE_DATA': True,
+            'CACHE_INVALIDATION': 'watch',
+        })
+        self.addCleanup(utils.get_user_directory.invalidate)
+        utils.get_user_directory.invalidate()
+        response = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(utils.get_user_directory())
+        generation = utils.data_generation()
+        self.assertEqual(utils.data_generation(), generation)
+        response = self.client.get('/api/v1/user/10/photo')
+        self.assertEqual(response.status_code, 200)
+
+    def test_monthly_worked_hours_api_route(self):
+        """
+        Test monthly worked hour api route.
+        """
+        response = self.client.get('/api/v1/monthly_worked_hours/10')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertListEqual(data[0], ['Year', '2013'])
+        self.assertListEqual(data[9], ['Sep', 21])
+        response = self.client.get('/api/v1/monthly_worked_hours/1111')
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_view(self):
+        """
+        Test Prometheus metrics of served requests.
+        """
+        main.app.config.update({'CACHE_DATA': True})
+        utils.get_data.invalidate()
+        self.client.get('/api/v1/presence_weekday/10')
+        self.client.get('/api/v1/presence_weekday/1111')
+        self.client.get('/non/existing/page')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.headers['Content-Type'],
+            'text/plain; version=0.0.4; charset=utf-8',
+        )
+        lines = response.data.splitlines()
+        self.assertIn(
+            '# TYPE presence_http_request_seconds histogram', lines
+        )
+        for expected in [
+                'presence_http_responses_total{route="/api/v1/'
+                'presence_weekday/<int:user_id>",status="200"}',
+                'presence_http_responses_total{route="/api/v1/'
+                'presence_weekday/<int:user_id>",status="404"}',
+                'presence_http_responses_total{route="unmatched",'
+                'status="404"}',
+                'presence_http_request_seconds_count{route="/api/v1/'
+                'presence_weekday/<int:user_id>"}',
+                'presence_csv_rows_total{result="parsed"}',
+                'presence_cache_misses_total{function="get_data"}',
+                'presence_cache_refresh_seconds_count{function="get_data"}',
+        ]:
+            self.assertTrue(
+                any(line.startswith(expected + ' ') for line in lines),
+                expected,
+            )
@@ -2,25 +2,76 @@
 """
 Helper functions used in views.
 """
+from bisect import bisect_left, bisect_right
 import calendar
-from copy import deepcopy
-import csv
+import json
 from json import dumps
+from collections import OrderedDict
 from functools import wraps
-from datetime import datetime, timedelta
+from hashlib import sha1
+import fcntl
 import locale
 import logging
-from threading import RLock
+import os
+import tempfile
+from threading import Lock, Thread
+import time
 
 from apscheduler.scheduler import Scheduler
 from lxml import etree
-from flask import Response
+from flask import Response, request
 import requests
-from requests import ConnectionError
 
+from presence_analyzer import metrics, plane
+from presence_analyzer.caching import FrozenDict, UserEntries, cache_data, \
+    freeze
+from presence_analyzer.columnar import ColumnarStore, UserColumns, numpy
+from presence_analyzer.files import replace_file
+from presence_analyzer.loader import PresenceCsvLoader, \
+    build_columnar_store, csv_loader, load_snapshot_data, \
+    load_sqlite_store, parse_pool, parse_presence_rows, \
+    seconds_since_midnight, snapshot_data
 from presence_analyzer.main import app
+from presence_analyzer.models import OfficeAggregates, UserAggregates, \
+    UserDirectory, UserInfo
+from presence_analyzer.sqlstore import SqliteStore, UserRows
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+http_session = requests.Session()  # pylint: disable=invalid-name
+scheduler_lock = Lock()  # pylint: disable=invalid-name
+background = {  # pylint: disable=invalid-name
+    'scheduler': None,
+    'lock_file': None,
+}
+readiness = {  # pylint: disable=invalid-name
+    'ready': False,
+    'warm_up_seconds': None,
+    'error': None,
+}
+planes = {}  # pylint: disable=invalid-name
+jsonified_functions = []  # pylint: disable=invalid-name
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+ARRIVAL_BUCKET = 15 * 60
+RANGE_CACHE_ENTRIES = 4096
+# stores and entries which calculate aggregations themselves
+AGGREGATING_STORES = (ColumnarStore, SqliteStore)
+AGGREGATING_ENTRIES = (UserColumns, UserRows)
+
+XML_PARSE_SECONDS = metrics.Histogram(
+    'presence_xml_parse_seconds', 'Time of processing users XML file.',
+    ['loader'],
+)
+DOWNLOAD_SECONDS = metrics.Histogram(
+    'presence_xml_download_seconds', 'Latency of users XML downloads.',
+)
+DOWNLOAD_BYTES = metrics.Counter(
+    'presence_xml_download_bytes_total', 'Downloaded users XML bytes.',
+)
+DOWNLOADS = metrics.Counter(
+    'presence_xml_downloads_total', 'Users XML downloads, by status.',
+    ['status'],
+)
 locale.setlocale(locale.LC_ALL, 'pl_PL.UTF-8')
 
 
@@ -28,63 +79,96 @@ def jsonify(function):
     """
     Creates a response with the JSON representation of wrapped function
     result.
+
+    Serialised responses are memoised per arguments and query string
+    until data generation changes, at most JSON_CACHE_ENTRIES (1024 by
+    default) least recently used ones. Each carries strong ETag, so
+    request with matching If-None-Match gets 304 without calling the
+    function. Wrapper's clear() forgets memoised responses.
     """
+    memo = {'current': (None, OrderedDict())}
+    lock = Lock()
 
     @wraps(function)
     def inner(*args, **kwargs):
         """
         This docstring will be overridden by @wraps decorator.
         """
-        json_data = dumps(function(*args, **kwargs), )
-        return Response(json_data, mimetype='application/json')
+        generation = data_generation()
+        current = memo['current']
+        if generation is None or current[0] != generation:
+            current = (generation, OrderedDict())
+            memo['current'] = current
+        responses = current[1]
+
+        key = (args, tuple(sorted(kwargs.items())), request.query_string)
+        with lock:
+            cached = responses.pop(key, None)
+            if cached is not None:
+                responses[key] = cached
+        if cached is None:
+            json_data = dumps(function(*args, **kwargs), )
+            cached = (json_data, sha1(json_data).hexdigest())
+            limit = app.config.get('JSON_CACHE_ENTRIES', 1024)
+            with lock:
+                responses[key] = cached
+                while len(responses) > limit:
+                    responses.popitem(last=False)
+        json_data, etag = cached
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(json_data, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = app.config.get(
+            'JSON_CACHE_CONTROL', 'no-cache'
+        )
+        return response
+
+    def clear():
+        """
+        Forgets all memoised responses.
+        """
+        memo['current'] = (None, OrderedDict())
 
+    inner.clear = clear
+    jsonified_functions.append(inner)
     return inner
 
 
-def cache_data(seconds=0):
+def data_generation():
     """
-    Decorator for caching data in memory.
+    Returns value identifying current version of data served by API.
+
+    It changes whenever presence data snapshot or user directory is
+    replaced. Without cache there is no generation and None is
+    returned.
     """
-    delta = timedelta(seconds=seconds)
+    if not app.config.get('CACHE_DATA', True):
+        return None
+    get_data()
+    get_user_directory()
+    return get_data.generation(), get_user_directory.generation()
+
 
-    def decorate(function):
+def watched_path(key):
+    """
+    Returns function naming file which cached data of `key` config file
+    depends on: data plane manifest with DATA_PLANE set, the file itself
+    otherwise.
+    """
+    def path():
         """
-        Main decorator function.
+        Returns path of watched file.
         """
-        function.lock = RLock()
-        updates = {}
-        results = {}
-
-        def do_cache(*args, **kwargs):
-            """
-            Cache method.
-            """
-            should_cache = app.config.get('CACHE_DATA', True)
-            cache_lock = function.lock
-            cache_lock.acquire()
-            try:
-                now = datetime.now()
-                updated = updates.get(function, now)
-                old_data = function not in results or now - updated > delta
+        if app.config.get('DATA_PLANE'):
+            return os.path.join(app.config['DATA_PLANE'], plane.MANIFEST)
+        return app.config.get(key)
+    return path
 
-                if not should_cache or old_data:
-                    # Calculate
-                    updates[function] = now
-                    result = function(*args, **kwargs)
-                    results[function] = deepcopy(result)
-                    return result
-                else:
-                    # Cache
-                    return deepcopy(results[function])
-            finally:
-                cache_lock.release()
 
-        return do_cache
-
-    return decorate
-
-
-@cache_data(600)
+@cache_data(600, watch=watched_path('DATA_CSV'))
 def get_data():
     """
     Extracts presence data from CSV file and groups it by user_id.
@@ -92,36 +176,54 @@ def get_data():
     It creates structure like this:
     data = {
         'user_id': {
-            datetime.date(2013, 10, 1): {
-                'start': datetime.time(9, 0, 0),
-                'end': datetime.time(17, 30, 0),
-            },
-            datetime.date(2013, 10, 2): {
-                'start': datetime.time(8, 30, 0),
-                'end': datetime.time(16, 45, 0),
-            },
+            datetime.date(2013, 10, 1): PresenceEntry(
+                start_seconds=32400,  # 9:00:00
+                end_seconds=63000,  # 17:30:00
+            ),
+            datetime.date(2013, 10, 2): PresenceEntry(
+                start_seconds=30600,  # 8:30:00
+                end_seconds=60300,  # 16:45:00
+            ),
         }
     }
-    """
-    data = {}
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
-        presence_reader = csv.reader(csvfile, delimiter=',')
-        for i, row in enumerate(presence_reader):
-            if len(row) != 4:
-                # ignore header and footer lines
-                continue
 
-            try:
-                user_id = int(row[0])
-                date = datetime.strptime(row[1], '%Y-%m-%d').date()
-                start = datetime.strptime(row[2], '%H:%M:%S').time()
-                end = datetime.strptime(row[3], '%H:%M:%S').time()
-            except (ValueError, TypeError):
-                log.debug('Problem with line %d: ', i, exc_info=True)
-                continue
-
-            data.setdefault(user_id, {})[date] = {'start': start, 'end': end}
-    return data
+    With cache enabled the file is read incrementally, otherwise every
+    call reads it from scratch.
+
+    With PRESENCE_STORE = 'columnar' the file is always read from
+    scratch and only ColumnarStore arrays are kept in memory.
+
+    CSV_WORKERS config key sets number of processes parsing the file
+    when it is read from scratch (1 by default).
+
+    With DATA_SNAPSHOT set, data is loaded from binary snapshot of the
+    file instead, see load_snapshot_data().
+
+    With PRESENCE_STORE = 'sqlite' the file is imported into DATA_SQLITE
+    database queried on demand, see load_sqlite_store().
+
+    With DATA_PLANE set, data comes from snapshot published in the shared
+    data plane, see current_plane(), unless there is none available.
+    """
+    path = app.config['DATA_CSV']
+    if app.config.get('PRESENCE_STORE', 'dict') == 'sqlite':
+        return load_sqlite_store(path, app.config['DATA_SQLITE'])
+    if app.config.get('DATA_PLANE'):
+        version = current_plane()
+        if version is not None:
+            return snapshot_data(version.presence)
+    elif app.config.get('DATA_SNAPSHOT'):
+        return load_snapshot_data(path, app.config['DATA_SNAPSHOT'])
+    workers = app.config.get('CSV_WORKERS', 1)
+    if app.config.get('PRESENCE_STORE', 'dict') == 'columnar':
+        if numpy is not None:
+            return build_columnar_store(
+                PresenceCsvLoader().load(path, workers)
+            )
+        log.warning('numpy is not installed, columnar store unavailable')
+    if app.config.get('CACHE_DATA', True):
+        return csv_loader.load(path, workers)
+    return PresenceCsvLoader().load(path, workers)
 
 
 def weekday_abbr(weekday):
@@ -131,23 +233,33 @@ def weekday_abbr(weekday):
     return calendar.day_abbr[weekday].decode('utf8')
 
 
-def group_by_weekday(items):
+def select_dates(items, start=None, end=None):
     """
-    Groups presence entries by weekday.
+    Returns presence entries of days from start to end, both inclusive.
+
+    Missing start or end leaves the range open on that side.
     """
-    result = [[], [], [], [], [], [], []]  # one list for every day in week
-    for date in items:
-        start = items[date]['start']
-        end = items[date]['end']
-        result[date.weekday()].append(interval(start, end))
-    return result
+    if start is None and end is None:
+        return items
+    if isinstance(items, AGGREGATING_ENTRIES):
+        return items.between(start, end)
+    dates = items.dates if isinstance(items, UserEntries) else sorted(items)
+    begin = bisect_left(dates, start) if start is not None else 0
+    stop = bisect_right(dates, end) if end is not None else len(dates)
+    return dict((date, items[date]) for date in dates[begin:stop])
 
 
-def seconds_since_midnight(time):
+def group_by_weekday(items, start=None, end=None):
     """
-    Calculates amount of seconds since midnight.
+    Groups presence entries by weekday, optionally only from given range.
     """
-    return time.hour * 3600 + time.minute * 60 + time.second
+    items = select_dates(items, start, end)
+    if isinstance(items, AGGREGATING_ENTRIES):
+        return items.group_by_weekday()
+    result = [[], [], [], [], [], [], []]  # one list for every day in week
+    for date, entry in items.iteritems():
+        result[date.weekday()].append(entry.interval)
+    return result
 
 
 def interval(start, end):
@@ -172,13 +284,13 @@ def get_mean_start_end_time(items):
     :param items: user in/out datetime
     :return: list of tuples (mean_start_time, mean_end_time)
     """
+    if isinstance(items, AGGREGATING_ENTRIES):
+        return items.mean_start_end_time()
     starts = [[] for _ in xrange(7)]  # one list for every day in week
     ends = [[] for _ in xrange(7)]  # one list for every day in week
-    for date in items:
-        start = items[date]['start']
-        end = items[date]['end']
-        starts[date.weekday()].append(seconds_since_midnight(start))
-        ends[date.weekday()].append(seconds_since_midnight(end))
+    for date, entry in items.iteritems():
+        starts[date.weekday()].append(entry.start_seconds)
+        ends[date.weekday()].append(entry.end_seconds)
 
     results = [[] for _ in xrange(7)]
     for weekday, day in enumerate(zip(starts, ends)):
@@ -189,45 +301,244 @@ def get_mean_start_end_time(items):
 def download_users_information():
     """
     Download xml file from http localization set in config file.
+
+    Validators of the previous download are sent along, so unchanged
+    file isn't transferred again. Response is streamed to temporary
+    file, which then atomically replaces the old one.
+
+    :return: number of downloaded bytes, 0 if file wasn't modified
     """
     try:
-        xml_file = process_request(app.config['XML_URL'])
-        with open(app.config['DATA_XML'], 'w') as output_file:
-            return output_file.write(xml_file.content)
-    except IOError as error:
-        log.error('error during saving xml_content to file\n%s', error)
+        url = app.config['XML_URL']
+        path = app.config['DATA_XML']
     except KeyError:
         log.warning('application start first time, some keys are not '
                     'available yet')
+        return None
+
+    headers = {}
+    if os.path.exists(path):
+        validators = load_validators(path)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    started = time.time()
+    response = process_request(url, headers=headers, stream=True)
+    if response is None:
+        record_download('error', started)
+        return None
+    try:
+        if response.status_code == 304:
+            log.info('xml file not modified since last download')
+            record_download(304, started)
+            return 0
+        if response.status_code != 200:
+            log.error('xml file download failed with status %d',
+                      response.status_code)
+            record_download(response.status_code, started)
+            return None
+        size = stream_to_file(response, path)
+    except (IOError, OSError, requests.RequestException) as error:
+        log.error('error during saving xml_content to file\n%s', error)
+        record_download('error', started)
+        return None
+    finally:
+        response.close()
+    record_download(200, started, size)
+
+    save_validators(path, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    })
+    return size
+
+
+def record_download(status, started, size=0):
+    """
+    Records latency, status and size of users XML download in metrics.
+    """
+    DOWNLOAD_SECONDS.observe(time.time() - started)
+    DOWNLOADS.inc(status=status)
+    DOWNLOAD_BYTES.inc(size)
+
+
+def stream_to_file(response, path):
+    """
+    Writes response body to temporary file renamed to `path` at the end.
+
+    :return: number of written bytes
+    """
+    handle, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix='.download-'
+    )
+    size = 0
+    try:
+        with os.fdopen(handle, 'wb') as output_file:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                output_file.write(chunk)
+                size += len(chunk)
+        replace_file(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return size
 
 
-def process_xml_file():
+def load_validators(path):
     """
-    Read XML file and returns object.
+    Returns HTTP validators stored with downloaded file.
     """
     try:
-        with open(app.config['DATA_XML'], 'r') as xml_file:
-            tree = etree.fromstring(xml_file.read())
-        return tree
-    except AttributeError as error:
-        log.error("parsing xml failed\n%s", error)
+        with open(path + '.validators', 'r') as validators_file:
+            return json.load(validators_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_validators(path, validators):
+    """
+    Stores HTTP validators of downloaded file next to it.
+    """
+    validators = dict(
+        (key, value) for key, value in validators.iteritems() if value
+    )
+    try:
+        with open(path + '.validators', 'w') as validators_file:
+            json.dump(validators, validators_file)
     except IOError as error:
-        log.error('reading from file fails\n%s', error)
+        log.error('saving validators of %s failed\n%s', path, error)
 
 
-def process_request(url, method='get'):
+def process_request(url, method='get', **kwargs):
     """
     Method execute request to url provided as parameter. Default
     method is GET
+
+    Requests go through shared session reusing connections and time out
+    after XML_TIMEOUT seconds. Other keyword arguments are passed to
+    the session.
     """
+    kwargs.setdefault('timeout', app.config.get('XML_TIMEOUT', 30))
     try:
-        if method.lower() == 'post':
-            return requests.post(url)
-        return requests.get(url)
-    except ConnectionError as error:
+        return http_session.request(method.upper(), url, **kwargs)
+    except requests.RequestException as error:
         log.error('network error - file wasn\'t downloaded\n%s', error)
 
 
+def load_user_directory(path):
+    """
+    Streams users XML file into UserDirectory.
+
+    Only server settings and user id, name and avatar are pulled out.
+    Processed elements are cleared right away, so memory use doesn't
+    grow with the size of the file.
+
+    :param path: path to users XML file
+    :return: UserDirectory or None if the file can't be processed
+    """
+    server = {}
+    users = {}
+    started = time.time()
+    try:
+        for _, element in etree.iterparse(path, tag=('server', 'user')):
+            if element.tag == 'server':
+                server.update((child.tag, child.text) for child in element)
+            else:
+                add_directory_user(users, element)
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except (IOError, etree.XMLSyntaxError) as error:
+        log.error('processing xml file fails\n%s', error)
+        return None
+    finally:
+        XML_PARSE_SECONDS.observe(time.time() - started, loader='directory')
+    return UserDirectory(FrozenDict(server), FrozenDict(users))
+
+
+def add_directory_user(users, element):
+    """
+    Adds UserInfo of <user> element to users dictionary.
+    """
+    try:
+        user_id = int(element.get('id'))
+    except (TypeError, ValueError):
+        log.warning('Wrong user id %r in xml file', element.get('id'))
+        return
+    users[user_id] = UserInfo(
+        element.findtext('name'), element.findtext('avatar')
+    )
+
+
+@cache_data(watch=watched_path('DATA_XML'), invalidation='watch')
+def get_user_directory():
+    """
+    Returns UserDirectory of users XML file, parsed once per file change.
+
+    With DATA_PLANE set, directory published in the shared data plane is
+    used instead, with users looked up in its memory-mapped file.
+    Without DATA_XML there is no directory and None is returned.
+    """
+    version = current_plane() if app.config.get('DATA_PLANE') else None
+    if version is not None:
+        directory = version.directory
+        if directory is None:
+            return None
+        return UserDirectory(FrozenDict(directory.server), directory.users)
+    if not app.config.get('DATA_XML'):
+        return None
+    return load_user_directory(app.config['DATA_XML'])
+
+
+def publish_data_plane():
+    """
+    Publishes new data plane version if data files changed since the
+    current one. Does nothing without DATA_PLANE.
+
+    :return: manifest of current version or None
+    """
+    plane_path = app.config.get('DATA_PLANE')
+    if not plane_path:
+        return None
+    return plane.publish(
+        plane_path, app.config['DATA_CSV'], app.config.get('DATA_XML'),
+        parse_presence_rows, load_user_directory,
+        keep=app.config.get('DATA_PLANE_KEEP', 3),
+    )
+
+
+def current_plane():
+    """
+    Returns PlaneVersion of current data plane version.
+
+    Files of a version are mapped once per process and replaced as a
+    whole when the manifest names a newer one. Version is published
+    right away when there is none yet. Returns None when no version can
+    be published or mapped, callers read the data files themselves then.
+    """
+    plane_path = app.config['DATA_PLANE']
+    manifest = plane.read_manifest(plane_path)
+    current = planes.get(plane_path)
+    if current is not None and manifest is not None and \
+            current.version == manifest['version']:
+        return current
+    current = plane.attach(plane_path)
+    if current is None:
+        try:
+            publish_data_plane()
+        except (IOError, OSError):
+            log.exception('cannot publish data plane %s', plane_path)
+        current = plane.attach(plane_path)
+    if current is None:
+        log.error('data plane %s is not available', plane_path)
+        planes.pop(plane_path, None)
+        return None
+    planes[plane_path] = current
+    return current
+
+
 def get_related_xml_values(items):
     """
     Returns list of user name according to list provided as parameter.
@@ -235,32 +546,36 @@ def get_related_xml_values(items):
     :param items: list of user ids
     :return: list of user names
     """
-    try:
-        tree = process_xml_file()
-        users_names = {}
-        for user_id in items:
-            user_name = tree.xpath("//user[@id='%s']/name/text()" % user_id)
-            try:
-                users_names[user_id] = user_name[0]
-            except IndexError:
-                log.warning('User name for id %d wasn\'t found', user_id)
-                users_names[user_id] = 'User %s' % str(user_id).rjust(4, ' ')
-        return users_names
-    except AttributeError as error:
-        log.error('processing xml file fails\n%s', error)
+    items = list(items)
+    if not items:
+        return {}
+    directory = get_user_directory()
+    if directory is None:
+        return None
+    users_names = {}
+    for user_id in items:
+        try:
+            users_names[user_id] = directory.users[user_id].name
+        except KeyError:
+            log.warning('User name for id %d wasn\'t found', user_id)
+            users_names[user_id] = 'User %s' % str(user_id).rjust(4, ' ')
+    return users_names
 
 
 def get_user_photo_url(user_id):
     """
     Return image from external api according to the user id.
     """
-    tree = process_xml_file()
+    directory = get_user_directory()
     try:
-        host = tree.xpath('server/host/text()')
-        protocol = tree.xpath('server/protocol/text()')
-        img_path = tree.xpath("//user[@id='{}']/avatar/text()".format(user_id))
-        photo_url = '{0}://{1}{2}'.format(protocol[0], host[0], img_path[0])
-    except IndexError as error:
+        server = directory.server
+        img_path = directory.users[user_id].avatar
+        if not img_path:
+            raise KeyError('avatar')
+        photo_url = '{0}://{1}{2}'.format(
+            server['protocol'], server['host'], img_path
+        )
+    except (AttributeError, KeyError) as error:
         log.warning('creating photo url failed.\n%s', error)
         photo_url = "https://intranet.stxnext.pl/api/images/users/1"
     return photo_url
@@ -271,11 +586,11 @@ def time_separated_by_months(items):
     Returns dictionary with Years and list of months related to it.
     """
     years = {}
-    for date, times in items.iteritems():
+    for date, entry in items.iteritems():
         years.setdefault(date.year, {})
         years[date.year].setdefault(date.month, [])
         years[date.year][date.month].append(
-            interval(times['start'], times['end'])
+            entry.interval
         )
     return years
 
@@ -298,11 +613,21 @@ def group_time_by_month_year(years):
     return result
 
 
-def get_monthly_worked_hours(items):
+def get_monthly_worked_hours(items, start=None, end=None):
+    """
+    Returns average working hours for each month in year, optionally
+    only from given range of days.
+    """
+    items = select_dates(items, start, end)
+    if isinstance(items, AGGREGATING_ENTRIES):
+        return format_monthly_hours(items.month_totals())
+    return format_monthly_hours(time_separated_by_months(items))
+
+
+def format_monthly_hours(years):
     """
-    Returns average working hours for each month in year.
+    Returns monthly worked hours table from {year: {month: intervals}}.
     """
-    years = time_separated_by_months(items)
     grouped_result = group_time_by_month_year(years)
     output = [['Year'] + map(str, years.iterkeys())]
 
@@ -314,19 +639,243 @@ def get_monthly_worked_hours(items):
     return output
 
 
+def aggregate_user(items):
+    """
+    Calculates all statistics of user presence entries in a single pass.
+    """
+    if isinstance(items, AGGREGATING_ENTRIES):
+        counts, totals = items.weekday_totals()
+        mean_start_end = items.mean_start_end_time()
+        years = items.month_totals()
+    else:
+        counts = [0] * 7  # one counter for every day in week
+        totals = [0] * 7
+        starts = [0] * 7
+        ends = [0] * 7
+        years = {}
+        for date, entry in items.iteritems():
+            weekday = date.weekday()
+            counts[weekday] += 1
+            totals[weekday] += entry.interval
+            starts[weekday] += entry.start_seconds
+            ends[weekday] += entry.end_seconds
+            years.setdefault(date.year, {}).setdefault(
+                date.month, []
+            ).append(entry.interval)
+        mean_start_end = [
+            (float(start) / count, float(end) / count) if count else (0, 0)
+            for start, end, count in zip(starts, ends, counts)
+        ]
+
+    return UserAggregates(
+        weekday_totals=tuple(totals),
+        weekday_means=tuple(
+            float(total) / count if count else 0
+            for total, count in zip(totals, counts)
+        ),
+        mean_start_end=tuple(mean_start_end),
+        monthly_hours=freeze(format_monthly_hours(years)),
+    )
+
+
+def aggregate_office(data):
+    """
+    Calculates statistics of all users at once: mean presence time per
+    weekday, number of users present every day and arrival times grouped
+    into ARRIVAL_BUCKET seconds long periods.
+    """
+    if isinstance(data, AGGREGATING_STORES):
+        entries = data.everyone()
+        counts, totals = entries.weekday_totals()
+        headcount = entries.day_counts()
+        arrivals = entries.start_counts(ARRIVAL_BUCKET)
+    else:
+        counts = [0] * 7  # one counter for every day in week
+        totals = [0] * 7
+        headcount = {}
+        arrivals = {}
+        for items in data.itervalues():
+            for date, entry in items.iteritems():
+                weekday = date.weekday()
+                counts[weekday] += 1
+                totals[weekday] += entry.interval
+                headcount[date] = headcount.get(date, 0) + 1
+                bucket = entry.start_seconds // ARRIVAL_BUCKET
+                arrivals[bucket] = arrivals.get(bucket, 0) + 1
+        headcount = sorted(headcount.iteritems())
+        arrivals = [
+            (bucket * ARRIVAL_BUCKET, count)
+            for bucket, count in sorted(arrivals.iteritems())
+        ]
+
+    return OfficeAggregates(
+        weekday_means=tuple(
+            float(total) / count if count else 0
+            for total, count in zip(totals, counts)
+        ),
+        headcount=tuple(headcount),
+        arrivals=tuple(arrivals),
+    )
+
+
+@cache_data(600, source=get_data, max_entries=1)
+def get_office_aggregates():
+    """
+    Returns OfficeAggregates precomputed for presence data.
+    """
+    return aggregate_office(get_data())
+
+
+@cache_data(600, source=get_data, max_entries=1)
+def get_aggregates():
+    """
+    Returns {user_id: UserAggregates} precomputed for presence data.
+    """
+    return dict(
+        (user_id, aggregate_user(items))
+        for user_id, items in get_data().items()
+    )
+
+
+@cache_data(600, source=get_data, max_entries=RANGE_CACHE_ENTRIES)
+def get_range_aggregates(user_id, start, end):
+    """
+    Returns UserAggregates of user entries from range of days, None for
+    unknown user.
+    """
+    data = get_data()
+    if user_id not in data:
+        return None
+    return aggregate_user(select_dates(data[user_id], start, end))
+
+
+# aggregates of invalidated data are never used again
+get_data.on_invalidate(get_office_aggregates.invalidate)
+get_data.on_invalidate(get_aggregates.invalidate)
+get_data.on_invalidate(get_range_aggregates.invalidate)
+
+
 def download_user_info_scheduler():
     """
     Create and prepare scheduler for downloading xml data from url.
+
+    Scheduler is started at most once per process. When SCHEDULER_LOCK
+    config key names a lock file, only the process holding it runs the
+    scheduler, so a host with many workers downloads the file once.
+    With DATA_PLANE set the scheduler also publishes new data plane
+    versions every DATA_PLANE_INTERVAL seconds (60 by default).
+    Returns the scheduler, None if another process leads.
+    """
+    with scheduler_lock:
+        if background['scheduler'] is not None:
+            return background['scheduler']
+        lock_path = app.config.get('SCHEDULER_LOCK')
+        if lock_path:
+            lock_file = acquire_leader_lock(lock_path)
+            if lock_file is None:
+                log.info('scheduler is run by another process')
+                return None
+            background['lock_file'] = lock_file
+
+        scheduler = Scheduler()
+        scheduler.start()
+
+        # backup Schedule to run once every 4 hours
+        day_of_week = app.config.get('cron_day_of_week_pattern', '*')
+        hour = app.config.get('cron_hour_pattern', '*/4')
+        minute = app.config.get('cron_minutes_pattern', '0')
+        scheduler.add_cron_job(download_users_information,
+                               day_of_week=day_of_week, hour=hour,
+                               minute=minute)
+        if app.config.get('DATA_PLANE'):
+            scheduler.add_interval_job(
+                publish_data_plane,
+                seconds=app.config.get('DATA_PLANE_INTERVAL', 60),
+            )
+        background['scheduler'] = scheduler
+        return scheduler
+
+
+def acquire_leader_lock(path):
+    """
+    Takes exclusive lock on file, returns it or None if already taken.
+    """
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def shutdown_scheduler():
+    """
+    Stops scheduler and gives up leadership.
     """
-    scheduler = Scheduler()
-    scheduler.start()
+    with scheduler_lock:
+        scheduler = background['scheduler']
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
+        lock_file = background['lock_file']
+        if lock_file is not None:
+            lock_file.close()
+        background.update(scheduler=None, lock_file=None)
 
-    # backup Schedule to run once every 4 hours
-    day_of_week = app.config.get('cron_day_of_week_pattern', '*')
-    hour = app.config.get('cron_hour_pattern', '*/4')
-    minute = app.config.get('cron_minutes_pattern', '0')
-    scheduler.add_cron_job(download_users_information, day_of_week=day_of_week,
-                           hour=hour, minute=minute)
 
+def warm_up(download=True):
+    """
+    Loads data into caches before first request.
+
+    Presence data, user directory and aggregates are preloaded from
+    local files first and worker reports readiness as soon as they are,
+    together with time it took. Only then users XML is downloaded, so
+    readiness never waits for intranet. When preloading fails, worker
+    stays not ready and reports the error instead.
 
-download_user_info_scheduler()
+    With DATA_PLANE set, the leader publishes data plane version before
+    loading it and again after downloading users XML.
+    """
+    started = time.time()
+    error = None
+    try:
+        if download:
+            publish_data_plane()
+        get_data()
+        get_user_directory()
+        get_aggregates()
+    except Exception as exception:  # pylint: disable=broad-except
+        log.exception('warm-up failed')
+        error = '%s: %s' % (type(exception).__name__, exception)
+    duration = time.time() - started
+    readiness.update(
+        ready=error is None, warm_up_seconds=round(duration, 3), error=error
+    )
+    log.info('warm-up finished in %.3f s', duration)
+
+    if download:
+        try:
+            if download_users_information():
+                publish_data_plane()
+                get_user_directory()
+        except Exception:  # pylint: disable=broad-except
+            log.exception('users XML download on startup failed')
+
+
+def start_background_tasks():
+    """
+    Starts scheduler and warms caches up without blocking the caller.
+
+    Called by application factory, never on import. Users XML is
+    downloaded right away only by the scheduler leader.
+    """
+    readiness.update(ready=False, warm_up_seconds=None, error=None)
+    workers = app.config.get('CSV_WORKERS', 1)
+    if workers > 1:
+        # forked while the process has no other threads yet
+        parse_pool(workers)
+    leader = download_user_info_scheduler() is not None
+    worker = Thread(target=warm_up, args=(leader,), name='warm-up')
+    worker.daemon = True
+    worker.start()
+    return worker
@@ -3,19 +3,57 @@
 Defines views.
 """
 
+from json import dumps
+import datetime
 import locale
 import logging
+from time import time
 
-from flask import abort, render_template, url_for, redirect
+from flask import Response, abort, g, render_template, request, url_for, \
+    redirect
 
+from presence_analyzer import metrics
 from presence_analyzer.main import app
-from presence_analyzer.utils import jsonify, get_data, mean, \
-    group_by_weekday, get_mean_start_end_time, get_related_xml_values, \
-    get_user_photo_url, get_monthly_worked_hours, weekday_abbr
+from presence_analyzer.sqlstore import SqliteStore
+from presence_analyzer.utils import jsonify, get_data, get_aggregates, \
+    get_office_aggregates, get_range_aggregates, get_related_xml_values, \
+    get_user_photo_url, readiness, weekday_abbr
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 locale.setlocale(locale.LC_ALL, '')
 
+REQUEST_SECONDS = metrics.Histogram(
+    'presence_http_request_seconds', 'Latency of HTTP requests, by route.',
+    ['route'],
+)
+RESPONSES = metrics.Counter(
+    'presence_http_responses_total', 'HTTP responses, by route and status.',
+    ['route', 'status'],
+)
+
+
+@app.before_request
+def start_request_timer():
+    """
+    Remembers when request processing started.
+    """
+    g.request_started = time()
+
+
+@app.after_request
+def record_request(response):
+    """
+    Records request latency and response status of matched route.
+
+    Streamed responses are timed until their first byte.
+    """
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time() - started, route=rule)
+    RESPONSES.inc(route=rule, status=response.status_code)
+    return response
+
 
 @app.route('/')
 def mainpage():
@@ -63,6 +101,31 @@ def monthly_worked_hours_page():
     return render_template('month_worked_hour.html', title=title)
 
 
+@app.route('/health/ready', methods=['GET'])
+def ready_view():
+    """
+    Tells load balancer whether worker finished its warm-up.
+    """
+    return Response(
+        dumps(readiness),
+        status=200 if readiness['ready'] else 503,
+        mimetype='application/json',
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    """
+    Exposes process metrics in Prometheus text format.
+    """
+    return Response(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
 @app.route('/api/v1/users', methods=['GET'])
 @jsonify
 def users_view():
@@ -93,24 +156,104 @@ def user_photo_view(user_id):
     ]
 
 
+def mean_time_weekday(aggregates):
+    """
+    Formats mean presence time by weekday of a single user.
+    """
+    return [
+        (weekday_abbr(weekday), mean_time)
+        for weekday, mean_time in enumerate(aggregates.weekday_means)
+    ]
+
+
+def presence_weekday(aggregates):
+    """
+    Formats total presence time by weekday of a single user.
+    """
+    result = [
+        (weekday_abbr(weekday), total)
+        for weekday, total in enumerate(aggregates.weekday_totals)
+    ]
+    result.insert(0, ('Weekday', 'Presence (hours)'))
+    return result
+
+
+def presence_start_end(aggregates):
+    """
+    Formats mean start and end time by weekday of a single user.
+    """
+    return [
+        (weekday_abbr(weekday), mean_times[0], mean_times[1])
+        for weekday, mean_times in enumerate(aggregates.mean_start_end)
+    ]
+
+
+def monthly_worked_hours(aggregates):
+    """
+    Formats monthly worked hours of a single user.
+    """
+    return aggregates.monthly_hours
+
+
+METRICS = {
+    'mean_time_weekday': mean_time_weekday,
+    'presence_weekday': presence_weekday,
+    'presence_start_end': presence_start_end,
+    'monthly_worked_hours': monthly_worked_hours,
+}
+
+
+def requested_range():
+    """
+    Returns (start, end) dates from 'from' and 'to' query parameters.
+    """
+    try:
+        return tuple(
+            datetime.datetime.strptime(request.args[name], '%Y-%m-%d').date()
+            if request.args.get(name) else None
+            for name in ('from', 'to')
+        )
+    except ValueError:
+        abort(400)
+
+
+def requested_aggregates(user_ids=None):
+    """
+    Returns aggregates of given users (all by default) limited to days
+    from requested range.
+
+    Precalculated aggregates cover whole history; for a range, or for
+    chosen users without cache or kept in SQLite store, only their
+    entries of matching days are aggregated. Precalculating all users of
+    SQLite store would take a few queries per every one of them.
+    """
+    start, end = requested_range()
+    data = get_data()
+    per_user = user_ids is not None and (
+        not app.config.get('CACHE_DATA', True) or
+        isinstance(data, SqliteStore)
+    )
+    if start is None and end is None and not per_user:
+        return get_aggregates()
+    if user_ids is None:
+        user_ids = data.keys()
+    return dict(
+        (user_id, get_range_aggregates(user_id, start, end))
+        for user_id in user_ids if user_id in data
+    )
+
+
 @app.route('/api/v1/mean_time_weekday/<int:user_id>', methods=['GET'])
 @jsonify
 def mean_time_weekday_view(user_id):
     """
     Returns mean presence time of given user grouped by weekday.
     """
-    data = get_data()
-    if user_id not in data:
+    aggregates = requested_aggregates([user_id])
+    if user_id not in aggregates:
         log.debug('User %s not found!', user_id)
         abort(404)
-
-    weekdays = group_by_weekday(data[user_id])
-    result = [
-        (weekday_abbr(weekday), mean(intervals))
-        for weekday, intervals in enumerate(weekdays)
-        ]
-
-    return result
+    return mean_time_weekday(aggregates[user_id])
 
 
 @app.route('/api/v1/presence_weekday/<int:user_id>', methods=['GET'])
@@ -119,19 +262,11 @@ def presence_weekday_view(user_id):
     """
     Returns total presence time of given user grouped by weekday.
     """
-    data = get_data()
-    if user_id not in data:
+    aggregates = requested_aggregates([user_id])
+    if user_id not in aggregates:
         log.debug('User %s not found!', user_id)
         abort(404)
-
-    weekdays = group_by_weekday(data[user_id])
-    result = [
-        (weekday_abbr(weekday), sum(intervals))
-        for weekday, intervals in enumerate(weekdays)
-        ]
-
-    result.insert(0, ('Weekday', 'Presence (hours)'))
-    return result
+    return presence_weekday(aggregates[user_id])
 
 
 @app.route('/api/v1/presence_start_end/<int:user_id>', methods=['GET'])
@@ -140,17 +275,11 @@ def start_end_time_view(user_id):
     """
     Returns time periods of given user spend in office.
     """
-    data = get_data()
-    if user_id not in data:
+    aggregates = requested_aggregates([user_id])
+    if user_id not in aggregates:
         log.debug('User %s not found!', user_id)
         abort(404)
-
-    mean_start_end_times = get_mean_start_end_time(data[user_id])
-    results = [
-        (weekday_abbr(weekday), mean_times[0], mean_times[1])
-        for weekday, mean_times in enumerate(mean_start_end_times)
-        ]
-    return results
+    return presence_start_end(aggregates[user_id])
 
 
 @app.route('/api/v1/monthly_worked_hours/<int:user_id>', methods=['GET'])
@@ -159,8 +288,120 @@ def monthly_worked_hours_view(user_id):
     """
     Returns monthly worked hours of given user
     """
-    data = get_data()
-    if user_id not in data:
+    aggregates = requested_aggregates([user_id])
+    if user_id not in aggregates:
         log.debug('User %s not found!', user_id)
         abort(404)
-    return get_monthly_worked_hours(data[user_id])
+    return monthly_worked_hours(aggregates[user_id])
+
+
+@app.route('/api/v1/office/mean_time_weekday', methods=['GET'])
+@jsonify
+def office_mean_time_weekday_view():
+    """
+    Returns mean presence time of all users grouped by weekday.
+    """
+    return mean_time_weekday(get_office_aggregates())
+
+
+@app.route('/api/v1/office/headcount', methods=['GET'])
+@jsonify
+def office_headcount_view():
+    """
+    Returns number of users present in office every day.
+    """
+    result = [
+        (date.isoformat(), count)
+        for date, count in get_office_aggregates().headcount
+    ]
+    result.insert(0, ('Date', 'Headcount'))
+    return result
+
+
+@app.route('/api/v1/office/arrivals', methods=['GET'])
+@jsonify
+def office_arrivals_view():
+    """
+    Returns distribution of arrival times of all users.
+    """
+    result = [
+        ('%02d:%02d' % divmod(start // 60, 60), count)
+        for start, count in get_office_aggregates().arrivals
+    ]
+    result.insert(0, ('Arrival', 'Entries'))
+    return result
+
+
+@app.route('/api/v1/stats', methods=['GET'])
+def stats_view():
+    """
+    Returns chosen statistics of many users at once.
+
+    Query parameters:
+     - 'users' - comma separated user ids or 'all' (default),
+     - 'metrics' - comma separated names from METRICS (all by default),
+     - 'from', 'to' - limit statistics to days in range (YYYY-MM-DD),
+     - 'stream' - when set, every user is sent as soon as it is
+       formatted, one JSON object per line.
+
+    Result is a list of {'user_id': ..., <metric>: ...} objects sorted
+    by user id. Unknown users are left out.
+    """
+    users = request.args.get('users', 'all')
+    if users == 'all':
+        user_ids = None
+    else:
+        try:
+            user_ids = sorted(set(int(user) for user in users.split(',')))
+        except ValueError:
+            abort(400)
+        user_ids = tuple(user_ids)
+
+    names = request.args.get('metrics')
+    names = tuple(sorted(names.split(',') if names else METRICS))
+    if not set(names) <= set(METRICS):
+        abort(400)
+
+    if request.args.get('stream'):
+        aggregates, user_ids = selected_aggregates(user_ids)
+        return Response(
+            (
+                dumps(user_stats(aggregates, user_id, names)) + '\n'
+                for user_id in user_ids
+            ),
+            mimetype='application/x-ndjson',
+        )
+    return stats_document(user_ids, names)
+
+
+@jsonify
+def stats_document(user_ids, names):
+    """
+    Returns statistics of given users as a single JSON document.
+    """
+    aggregates, user_ids = selected_aggregates(user_ids)
+    return [user_stats(aggregates, user_id, names) for user_id in user_ids]
+
+
+def selected_aggregates(user_ids):
+    """
+    Returns aggregates of given users (all for None) and sorted ids of
+    those which have any.
+    """
+    aggregates = requested_aggregates(user_ids)
+    if user_ids is None:
+        return aggregates, sorted(aggregates)
+    return aggregates, [
+        user_id for user_id in user_ids if user_id in aggregates
+    ]
+
+
+def user_stats(aggregates, user_id, names):
+    """
+    Returns chosen metrics of a single user.
+    """
+    stats = dict(
+        (name, METRICS[name](aggregates[user_id])) for name in names
+    )
+    stats['user_id'] = user_id
+    return stats